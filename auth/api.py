@@ -5,10 +5,9 @@ from fastapi_utils.inferring_router import InferringRouter
 from starlette.responses import Response, JSONResponse
 
 from auth.exceptions import LoginFailed, ExpiredJwtRefreshToken, InvalidUsername
-from auth.models import User
 from auth.schemas import ProfileCreate, RegisterResponse, LoginIn, LoginResponse, SocialAuthIn, ChangePasswordIn, \
     Profile, ChangeProfile, ForgotPassword, ResetPassword, TwoFactorConnectionResponse, ActivateUser
-from auth.security import get_user
+from auth.security import get_user, Principal
 from auth.service import AuthService
 from common.exceptions import HTTPExceptionJSON
 from common.rate_limiter import RateLimitTo
@@ -117,7 +116,7 @@ class AuthApi:
         "/change-password",
         status_code=status.HTTP_200_OK,
         response_model=ChangeProfile)
-    async def change_password(self, change_password_in: ChangePasswordIn, user: User = Depends(get_user)):
+    async def change_password(self, change_password_in: ChangePasswordIn, user: Principal = Depends(get_user)):
         """Changing password. User should input his current password and new password
         """
         try:
@@ -153,17 +152,17 @@ class AuthApi:
         "/account/two-factor-auth",
         response_model=TwoFactorConnectionResponse,
         status_code=status.HTTP_200_OK)
-    async def two_factor_auth(self, action: str = Query(...), user: User = Depends(get_user)):
+    async def two_factor_auth(self, action: str = Query(...), user: Principal = Depends(get_user)):
         """User can connect/disconnect Two-Factor Authentication
         """
-        profile = await self._service.find_profile_by_username(username=user.username)
+        profile = await self._service.find_credentials_by_username(username=user.username)
         return await self._service.two_factor_auth(action, profile)
 
     @auth_router.patch(
         "/account/change",
         response_model=ChangeProfile,
         status_code=status.HTTP_200_OK)
-    async def change_profile_data(self, data: ChangeProfile, user: User = Depends(get_user)):
+    async def change_profile_data(self, data: ChangeProfile, user: Principal = Depends(get_user)):
         """User can update his profile information.
         """
         if not data.dict(exclude_none=True):
@@ -0,0 +1,194 @@
+import json
+import logging
+from contextvars import ContextVar
+from typing import Awaitable, Callable, Optional, Sequence
+
+import redis.asyncio as redis
+from fastapi.encoders import jsonable_encoder
+
+from auth.models import public_profile_columns
+from common.metrics import metrics
+from common.services import services
+from config import cfg
+
+logger = logging.getLogger(__name__)
+
+# bump when the cached fields change, so rows cached with the old layout are ignored
+CACHE_VERSION = 2
+
+# generation of the user's cached profile, and the row cached under it, in one round trip
+READ_PROFILE_LUA = """
+local generation = redis.call('GET', KEYS[1]) or '0'
+return {generation, redis.call('GET', ARGV[1] .. generation)}
+"""
+
+request_memo: ContextVar[Optional[dict]] = ContextVar('request_memo', default=None)
+
+
+class RequestMemoMiddleware:
+    """ASGI middleware giving each request its own memo of looked up profiles."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        token = request_memo.set({})
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            request_memo.reset(token)
+
+
+class CachedRow(dict):
+    """Profile row restored from the cache, supporting attribute access like database records."""
+
+    def __getattr__(self, name):
+        try:
+            return self[name]
+        except KeyError:
+            raise AttributeError(name)
+
+
+class ProfileCache:
+    """Two-tier read-through cache of the public columns of `users` rows.
+
+    Rows are memoized for the duration of a request, then looked up in Redis,
+    then loaded from PostgreSQL. Only `fields` are cached, so credentials never
+    leave the database. Rows are cached by username under the user's generation,
+    which `invalidate` bumps: a load started before the invalidation writes to the
+    previous generation, which is never read again. The email key only points to
+    the username, and is checked against the row it points to.
+
+    Attributes:
+        ttl (int): Lifetime of rows cached in Redis, in seconds.
+        fields (Sequence[str]): Columns which are cached and returned.
+        memo_hits (int): Lookups served from the request memo.
+        hits (int): Lookups served from Redis.
+        misses (int): Lookups which loaded the row from the database.
+    """
+
+    def __init__(self, ttl: int, fields: Sequence[str], enabled: bool = True):
+        self.ttl = ttl
+        self.fields = tuple(fields)
+        self.enabled = enabled
+        self.memo_hits = 0
+        self.hits = 0
+        self.misses = 0
+        self._client = None
+        self._read_script = None
+
+    @property
+    def _redis(self) -> redis.Redis:
+        return services.redis
+
+    def _read(self):
+        client = self._redis
+        if client is not self._client:
+            self._client = client
+            self._read_script = client.register_script(READ_PROFILE_LUA)
+        return self._read_script
+
+    @staticmethod
+    def _generation_key(username: str) -> str:
+        return f'profile:v{CACHE_VERSION}:generation:{username}'
+
+    @staticmethod
+    def _username_key(username: str, generation: str = '') -> str:
+        return f'profile:v{CACHE_VERSION}:username:{username}:{generation}'
+
+    @staticmethod
+    def _email_key(email: str) -> str:
+        return f'profile:v{CACHE_VERSION}:email:{email}'
+
+    async def get_by_username(self, username: str, loader: Callable[[], Awaitable]):
+        return await self._get(('username', username), username, loader)
+
+    async def get_by_email(self, email: str, loader: Callable[[], Awaitable]):
+        memo = request_memo.get()
+        if memo is not None and ('email', email) in memo:
+            self.memo_hits += 1
+            return memo[('email', email)]
+        row = None
+        if self.enabled:
+            try:
+                username = await self._redis.get(self._email_key(email))
+                if username:
+                    row = await self._get(('username', username), username, loader)
+                    if row is not None and row.email != email:
+                        row = None
+            except redis.RedisError:
+                logger.exception('Unable to read profile from cache')
+        if row is None:
+            # the username, hence the generation, is unknown before loading: only the email key is cached
+            row = await self._load(loader)
+            if row is not None:
+                await self._set(self._email_key(email), row.username)
+        if memo is not None:
+            memo[('email', email)] = row
+        return row
+
+    async def invalidate(self, username: str, email: str = None):
+        memo = request_memo.get()
+        if memo is not None:
+            memo.clear()
+        if not self.enabled:
+            return
+        generation_key = self._generation_key(username)
+        try:
+            async with self._redis.pipeline(transaction=False) as pipe:
+                # outlives every row cached under the previous generations
+                pipe.incr(generation_key).expire(generation_key, 2 * self.ttl)
+                if email:
+                    pipe.delete(self._email_key(email))
+                await pipe.execute()
+        except redis.RedisError:
+            logger.exception('Unable to invalidate cached profile')
+
+    def metrics(self) -> dict:
+        return {'memo_hits': self.memo_hits, 'hits': self.hits, 'misses': self.misses}
+
+    async def _get(self, memo_key: tuple, username: str, loader: Callable[[], Awaitable]):
+        memo = request_memo.get()
+        if memo is not None and memo_key in memo:
+            self.memo_hits += 1
+            return memo[memo_key]
+        row = None
+        generation = None
+        if self.enabled:
+            try:
+                generation, cached = await self._read()(
+                    keys=[self._generation_key(username)], args=[self._username_key(username)])
+                if cached:
+                    self.hits += 1
+                    row = CachedRow(json.loads(cached))
+            except redis.RedisError:
+                logger.exception('Unable to read profile from cache')
+        if row is None:
+            row = await self._load(loader, generation)
+        if memo is not None:
+            memo[memo_key] = row
+        return row
+
+    async def _load(self, loader: Callable[[], Awaitable], generation: str = None) -> Optional[CachedRow]:
+        self.misses += 1
+        row = await loader()
+        if row is None:
+            return
+        row = CachedRow({field: row[field] for field in self.fields})
+        if generation is not None:
+            await self._set(self._username_key(row.username, generation), json.dumps(jsonable_encoder(row)))
+        return row
+
+    async def _set(self, key: str, value: str):
+        if not self.enabled:
+            return
+        try:
+            await self._redis.set(key, value, ex=self.ttl)
+        except redis.RedisError:
+            logger.exception('Unable to write profile to cache')
+
+
+profile_cache = ProfileCache(ttl=cfg.profile_cache_ttl_seconds,
+                             fields=[column.name for column in public_profile_columns],
+                             enabled=cfg.profile_cache_enabled)
+metrics.register('profile_cache', profile_cache.metrics)
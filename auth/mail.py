@@ -1,16 +1,149 @@
-from fastapi_mail import MessageSchema, FastMail
-from starlette.background import BackgroundTasks
+import asyncio
+import logging
+from dataclasses import dataclass, field
+from email.message import EmailMessage
+from typing import List, Optional
 
-from config import email_conf
+from aiosmtplib import SMTPException
+from fastapi_mail import ConnectionConfig
+from fastapi_mail.connection import Connection
+from jinja2 import Environment, FileSystemLoader, select_autoescape
 
+from config import cfg, get_email_conf
 
-async def send_email(recipients: list, template_name: str, context: dict, subject: str):
+logger = logging.getLogger(__name__)
 
-    message = MessageSchema(
-        subject=subject,
-        recipients=recipients,
-        template_body=context
-    )
 
-    fm = FastMail(email_conf)
-    BackgroundTasks().add_task(fm.send_message, message, template_name=template_name)
+@dataclass
+class OutgoingEmail:
+    recipients: List[str]
+    subject: str
+    html: str
+    attempts: int = field(default=0)
+
+
+class MailQueue:
+    """Outbound emails queue, sent by a background asyncio worker.
+
+    Emails are rendered when queued, with templates compiled once and cached.
+    The worker sends queued emails in batches over a single SMTP connection;
+    emails which fail are retried with exponential backoff, up to `max_retries` times.
+
+    Attributes:
+        conf (ConnectionConfig): SMTP settings, by default the application ones, read on first use.
+        batch_size (int): Max number of emails sent over one SMTP connection.
+        max_retries (int): Max number of retries of a failed email.
+        backoff (float): Delay before the first retry, in seconds; doubled on each next one.
+    """
+
+    def __init__(self, conf: Optional[ConnectionConfig] = None, batch_size: int = 20, max_retries: int = 3,
+                 backoff: float = 1.0, max_queue_size: int = 1000):
+        self._conf = conf
+        self.batch_size = batch_size
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_queue_size = max_queue_size
+        self._templates: Optional[Environment] = None
+        self._queue: Optional[asyncio.Queue] = None
+        self._worker: Optional[asyncio.Task] = None
+        self._retries = set()
+
+    @property
+    def conf(self) -> ConnectionConfig:
+        if self._conf is None:
+            self._conf = get_email_conf()
+        return self._conf
+
+    @property
+    def templates(self) -> Environment:
+        if self._templates is None:
+            self._templates = Environment(loader=FileSystemLoader(self.conf.TEMPLATE_FOLDER),
+                                          autoescape=select_autoescape())
+        return self._templates
+
+    async def start(self):
+        self._queue = asyncio.Queue(maxsize=self.max_queue_size)
+        self._worker = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Stop the worker once every queued email is sent; pending retries are dropped."""
+        if not self._worker:
+            return
+        for retry in self._retries:
+            retry.cancel()
+        await self._queue.put(None)
+        await self._worker
+        self._worker = None
+
+    def render(self, template_name: str, context: dict) -> str:
+        return self.templates.get_template(template_name).render(**context)
+
+    async def put(self, email: OutgoingEmail):
+        if self._queue is None:
+            raise RuntimeError('Mail queue is not started')
+        await self._queue.put(email)
+
+    async def _run(self):
+        stopping = False
+        while not stopping:
+            email = await self._queue.get()
+            if email is None:
+                break
+            batch = [email]
+            while len(batch) < self.batch_size and not self._queue.empty():
+                email = self._queue.get_nowait()
+                if email is None:
+                    stopping = True
+                    break
+                batch.append(email)
+            await self._send(batch)
+
+    async def _send(self, batch: List[OutgoingEmail]):
+        if self.conf.SUPPRESS_SEND:
+            return
+        failed = []
+        try:
+            async with Connection(self.conf) as connection:
+                for email in batch:
+                    try:
+                        await connection.session.send_message(self._build_message(email))
+                    except SMTPException:
+                        failed.append(email)
+        except Exception:
+            logger.exception('Unable to send a batch of %s emails', len(batch))
+            failed = batch
+        for email in failed:
+            self._schedule_retry(email)
+
+    def _build_message(self, email: OutgoingEmail) -> EmailMessage:
+        message = EmailMessage()
+        message['Subject'] = email.subject
+        message['From'] = self.conf.MAIL_FROM
+        message['To'] = ', '.join(email.recipients)
+        message.set_content(email.html, subtype='html')
+        return message
+
+    def _schedule_retry(self, email: OutgoingEmail):
+        email.attempts += 1
+        if email.attempts > self.max_retries:
+            logger.error('Dropping email "%s" to %s after %s attempts', email.subject, email.recipients, email.attempts)
+            return
+
+        async def retry():
+            await asyncio.sleep(self.backoff * 2 ** (email.attempts - 1))
+            await self.put(email)
+
+        task = asyncio.create_task(retry())
+        self._retries.add(task)
+        task.add_done_callback(self._retries.discard)
+
+
+mail_queue = MailQueue(batch_size=cfg.mail_batch_size,
+                       max_retries=cfg.mail_max_retries)
+
+
+async def send_email(recipients: list, template_name: str, context: dict, subject: str):
+    await mail_queue.put(OutgoingEmail(
+        recipients=recipients,
+        subject=subject,
+        html=mail_queue.render(template_name, context)))
@@ -8,6 +8,10 @@ from database.core import Base
 
 class Notification(Base):
     __tablename__ = 'notification'
+    __table_args__ = (
+        # unread counts and listings of a user, see NotificationService
+        sa.Index('ix_notification_user_username_read_created_at', 'user_username', 'read', 'created_at'),
+    )
 
     id = sa.Column(sa.Integer, primary_key=True)
     user_username = sa.Column(sa.String, sa.ForeignKey("users.username", ondelete="CASCADE"), nullable=False)
@@ -31,6 +35,11 @@ friendship = Friendship.__table__
 
 class User(Base):
     __tablename__ = 'users'
+    __table_args__ = (
+        # profiles search, see ProfilesService.find_profiles_by_username_search
+        sa.Index('ix_users_username_trgm', 'username',
+                 postgresql_using='gin', postgresql_ops={'username': 'gin_trgm_ops'}),
+    )
 
     id = sa.Column(sa.Integer, primary_key=True)
     username = sa.Column(sa.String(), unique=True, nullable=False)
@@ -52,9 +61,14 @@ class User(Base):
 
 user = User.__table__
 
+# users columns which may leave the database, e.g. to the profile cache: no password hash nor otp secret
+public_profile_columns = [column for column in user.c if column.name not in ('password', 'otp_secret')]
+
 
 friendship_request = sa.Table(
     "friendship_request", Base.metadata,
     sa.Column("from_user", sa.String),
-    sa.Column("to_user", sa.String)
+    sa.Column("to_user", sa.String),
+    sa.UniqueConstraint("from_user", "to_user"),
+    sa.Index("ix_friendship_request_to_user", "to_user"),
 )
@@ -0,0 +1,73 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, TypeVar
+
+import bcrypt
+
+from common.metrics import metrics
+from config import cfg
+
+T = TypeVar('T')
+
+
+class PasswordHasher:
+    """Bcrypt hashing and checking, run on a dedicated thread pool.
+
+    Bcrypt calls take tens to hundreds of milliseconds, so they are kept out of
+    the event loop. At most `max_concurrency` calls are submitted to the pool at
+    once, the others wait in the queue.
+
+    Attributes:
+        rounds (int): Bcrypt cost factor of new hashes.
+        max_concurrency (int): Max number of calls running at once.
+        waiting (int): Number of calls waiting for a free worker (queue depth).
+        running (int): Number of calls being run.
+        completed (int): Number of finished calls.
+    """
+
+    def __init__(self, rounds: int = 12, max_concurrency: int = 4):
+        self.rounds = rounds
+        self.max_concurrency = max_concurrency
+        self.waiting = 0
+        self.running = 0
+        self.completed = 0
+        self._executor = ThreadPoolExecutor(max_workers=max_concurrency, thread_name_prefix='bcrypt')
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+
+    async def _run(self, func: Callable[..., T], *args) -> T:
+        self.waiting += 1
+        async with self._semaphore:
+            self.waiting -= 1
+            self.running += 1
+            try:
+                return await asyncio.get_running_loop().run_in_executor(self._executor, func, *args)
+            finally:
+                self.running -= 1
+                self.completed += 1
+
+    async def hash(self, password: str) -> str:
+        hashed = await self._run(bcrypt.hashpw, password.encode(), bcrypt.gensalt(self.rounds))
+        return hashed.decode()
+
+    async def check(self, password: str, password_hash: str) -> bool:
+        return await self._run(bcrypt.checkpw, password.encode(), password_hash.encode())
+
+    def needs_rehash(self, password_hash: str) -> bool:
+        """Whether the hash was created with another cost factor than the configured one."""
+        # bcrypt hash format: $<version>$<cost>$<salt and checksum>
+        try:
+            return int(password_hash.split('$')[2]) != self.rounds
+        except (IndexError, ValueError):
+            return True
+
+    def metrics(self) -> dict:
+        return {
+            'waiting': self.waiting,
+            'running': self.running,
+            'completed': self.completed,
+            'max_concurrency': self.max_concurrency,
+        }
+
+
+password_hasher = PasswordHasher(rounds=cfg.bcrypt_rounds, max_concurrency=cfg.password_hash_concurrency)
+metrics.register('password_hasher', password_hasher.metrics)
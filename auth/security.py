@@ -1,15 +1,91 @@
-from typing import Optional, Dict
+import hashlib
+import time
+from collections import OrderedDict
+from typing import Optional, Dict, NamedTuple, Set, Tuple
 
 import jwt
 from fastapi import HTTPException
 from starlette import status
 from starlette.requests import Request
 
-from auth.models import User
 from config import cfg
 
 
-def get_user(request: Request) -> User:
+class Principal(NamedTuple):
+    """Authenticated user, as stored inside the jwt."""
+    username: str
+    email: str
+
+
+class ClaimsCache:
+    """Bounded LRU cache of validated access tokens claims, keyed by token digest.
+
+    An entry lives until the token expires, but no longer than `ttl` seconds. Caching
+    doesn't change which tokens are accepted: access tokens are never revoked, e.g. on
+    password change, they are valid until they expire.
+
+    Attributes:
+        max_size (int): Max number of cached tokens.
+        ttl (int): Max lifetime of an entry, in seconds.
+    """
+
+    def __init__(self, max_size: int, ttl: int):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries: OrderedDict[bytes, Tuple[Principal, float]] = OrderedDict()
+        self._by_username: Dict[str, Set[bytes]] = {}
+
+    @staticmethod
+    def _key(token: str) -> bytes:
+        return hashlib.sha256(token.encode()).digest()
+
+    def get(self, token: str) -> Optional[Principal]:
+        key = self._key(token)
+        entry = self._entries.get(key)
+        if entry is None:
+            return
+        principal, expires_at = entry
+        if expires_at <= time.time():
+            self._drop(key)
+            return
+        self._entries.move_to_end(key)
+        return principal
+
+    def set(self, token: str, principal: Principal, exp: Optional[float] = None):
+        key = self._key(token)
+        expires_at = time.time() + self.ttl
+        if exp is not None:
+            expires_at = min(expires_at, exp)
+        self._entries[key] = (principal, expires_at)
+        self._entries.move_to_end(key)
+        self._by_username.setdefault(principal.username, set()).add(key)
+        while len(self._entries) > self.max_size:
+            self._drop(next(iter(self._entries)))
+
+    def evict_user(self, username: str):
+        """Drop every cached token of the user from this cache.
+
+        This is not a revocation: the tokens are decoded again on next use, and stay
+        valid until they expire, as they would without the cache.
+        """
+        for key in self._by_username.pop(username, set()):
+            self._entries.pop(key, None)
+
+    def _drop(self, key: bytes):
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+        keys = self._by_username.get(entry[0].username)
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self._by_username[entry[0].username]
+
+
+claims_cache = ClaimsCache(max_size=cfg.jwt_cache_size, ttl=cfg.jwt_cache_ttl_seconds)
+
+
+def get_user(request: Request) -> Principal:
     """
     Protect route from anonymous access, requiring and returning current
     authenticated user.
@@ -22,7 +98,7 @@ def get_user(request: Request) -> User:
 
 
 
-def get_optional_user(request: Request) -> Optional[User]:
+def get_optional_user(request: Request) -> Optional[Principal]:
     """
     Return authenticated user or None if session is anonymous.
 
@@ -36,20 +112,31 @@ def get_optional_user(request: Request) -> Optional[User]:
             raise
 
 
-def extract_user_from_token(access_token: str, verify_exp: bool = True) -> User:
+def extract_user_from_token(access_token: str, verify_exp: bool = True) -> Principal:
     """
-    Extract User object from jwt token, with optional expiration check.
+    Extract user from jwt token, with optional expiration check.
+    Claims of verified tokens are cached until the token expires.
 
     :param access_token: encoded access token string
     :param verify_exp: whether to perform verification or not
-    :return: User object stored inside the jwt
+    :return: user stored inside the jwt
     """
-
-    return User(**jwt.decode(
+    if not access_token:
+        # e.g. websocket opened without ?token=, rejected like any malformed token
+        raise jwt.DecodeError('Missing token')
+    if verify_exp:
+        principal = claims_cache.get(access_token)
+        if principal:
+            return principal
+    claims = jwt.decode(
         access_token,
         key=cfg.jwt_secret,
         algorithms=[cfg.jwt_algorithm],
-        options={"verify_exp": verify_exp})["user"])
+        options={"verify_exp": verify_exp})
+    principal = Principal(username=claims["user"]["username"], email=claims["user"]["email"])
+    if verify_exp:
+        claims_cache.set(access_token, principal, claims.get("exp"))
+    return principal
 
 
 def decode_jwt_refresh_token(
@@ -70,7 +157,7 @@ def decode_jwt_refresh_token(
         options={"verify_exp": verify_exp})
 
 
-def _check_and_extract_user(request: Request) -> User:
+def _check_and_extract_user(request: Request) -> Principal:
     authorization_header = request.headers.get("Authorization")
     if not authorization_header:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED)
@@ -2,7 +2,6 @@ import datetime as dt
 import secrets
 from typing import Optional, Dict
 
-import bcrypt
 import jwt
 import pyotp
 from asyncpg import UniqueViolationError
@@ -11,10 +10,12 @@ from jwt import ExpiredSignatureError
 from sqlalchemy import insert, select, update
 from starlette import status
 
+from auth.cache import profile_cache
 from auth.exceptions import LoginFailed, \
     EmailAlreadyTaken, UsernameAlreadyTaken, UserDoesNotExist, ExpiredJwtRefreshToken
 from auth.mail import send_email
-from auth.models import user
+from auth.models import user, public_profile_columns
+from auth.passwords import password_hasher
 from auth.schemas import Profile, JwtTokenPayload, JwtData, JwtTokenData, \
     JwtRefreshTokenData, JwtUser
 from auth.security import decode_jwt_refresh_token
@@ -22,6 +23,8 @@ from auth.social.facebook import FacebookAdapter
 from auth.social.google import GoogleAdapter
 from config import cfg
 from database.core import db
+from profile.index import profile_index
+from profile.service import search_cache
 
 
 class AuthService:
@@ -29,28 +32,45 @@ class AuthService:
     _facebook_adapter = FacebookAdapter()
 
     async def find_profile_by_username(self, username: str):
-        return await db.fetch_one(select([user])
-                                  .where(user.c.username == username))
+        return await profile_cache.get_by_username(username, lambda: db.fetch_one(
+            select(public_profile_columns).where(user.c.username == username)))
 
     async def find_profile_by_email(self, email: str):
-        return await db.fetch_one(select([user])
-                                  .where(user.c.email == email.lower()))
+        email = email.lower()
+        return await profile_cache.get_by_email(email, lambda: db.fetch_one(
+            select(public_profile_columns).where(user.c.email == email)))
+
+    async def find_credentials_by_username(self, username: str):
+        """Full row, with the password hash and otp secret, always read from the database."""
+        return await db.fetch_one(select([user]).where(user.c.username == username))
+
+    async def find_credentials_by_email(self, email: str):
+        """Full row, with the password hash and otp secret, always read from the database."""
+        return await db.fetch_one(select([user]).where(user.c.email == email.lower()))
 
     async def update_profile_data(self, username: str, values: Dict) \
             -> Optional[Profile]:
-        return await db.fetch_one(update(user)
-                                  .where(user.c.username == username)
-                                  .values(**values)
-                                  .returning(user))
+        result = await db.fetch_one(update(user)
+                                    .where(user.c.username == username)
+                                    .values(**values)
+                                    .returning(user))
+        if result:
+            await profile_cache.invalidate(username, values.get('email'))
+            profile_index.upsert(result.username, result.first_name, result.last_name)
+            # cached search pages of this worker; the other workers' expire with the cache ttl
+            search_cache.clear()
+        return result
 
     async def register(self, profile: Profile, enable_2fa: bool) -> Profile:
-        profile.password = bcrypt.hashpw(profile.password.encode(), bcrypt.gensalt()).decode()
+        profile.password = await password_hasher.hash(profile.password)
         profile.email = profile.email.lower()
         if enable_2fa:
             profile.otp_secret = pyotp.random_base32()
         try:
             result = await db.fetch_one(insert(user).values(
                 profile.dict(exclude_none=True)).returning(user))
+            profile_index.upsert(result.username, result.first_name, result.last_name)
+            search_cache.clear()
             await self.send_activation_email(profile)
             return result
         except UniqueViolationError as e:
@@ -61,9 +81,12 @@ class AuthService:
             raise e
 
     async def login(self, email: str, password: str, one_time_pass: str = None) -> [bool, JwtData]:
-        profile = await self.find_profile_by_email(email=email)
+        profile = await self.find_credentials_by_email(email=email)
         if not profile or not await self._check_password(password, profile.password):
             raise HTTPException(detail='Wrong email or password', status_code=status.HTTP_400_BAD_REQUEST)
+        if password_hasher.needs_rehash(profile.password):
+            await self.update_profile_data(username=profile.username,
+                                           values=dict(password=await password_hasher.hash(password)))
         if not profile.is_active:
             raise HTTPException(detail='User is not active', status_code=status.HTTP_400_BAD_REQUEST)
         if profile.otp_secret and not one_time_pass:
@@ -80,11 +103,11 @@ class AuthService:
     async def social_login(self, code: str, social_provider: str) -> JwtData:
         match social_provider:
             case "google":
-                access_token = self._google_adapter.get_access_token_data(code=code)
-                profile_info = self._google_adapter.get_profile_data(access_token)
+                access_token = await self._google_adapter.get_access_token_data(code=code)
+                profile_info = await self._google_adapter.get_profile_data(access_token)
             case "facebook":
-                access_token = self._facebook_adapter.get_access_token_data(code=code)
-                profile_info = self._facebook_adapter.get_profile_data(access_token)
+                access_token = await self._facebook_adapter.get_access_token_data(code=code)
+                profile_info = await self._facebook_adapter.get_profile_data(access_token)
             case _:
                 raise HTTPException(detail='Wrong social provider', status_code=status.HTTP_400_BAD_REQUEST)
 
@@ -97,6 +120,7 @@ class AuthService:
             )
             await db.fetch_one(insert(user).values(
                 profile.dict(exclude_none=True)).returning(user))
+            profile_index.upsert(profile.username, profile.first_name, profile.last_name)
         jwt_user_data = JwtUser(email=profile.email, username=profile.username)
         jwt_data = await self._generate_jwt_access_token(jwt_user_data)
         jwt_refresh_data = await self._generate_jwt_refresh_token(jwt_user_data)
@@ -111,37 +135,32 @@ class AuthService:
                         detail='Two factor auth is already connected',
                         status_code=status.HTTP_400_BAD_REQUEST)
                 otp_secret = pyotp.random_base32()
-                return await db.fetch_one(
-                    update(user)
-                    .where(user.c.username == profile.username)
-                    .values({'otp_secret': otp_secret})
-                    .returning(user))
+                return await self.update_profile_data(username=profile.username,
+                                                      values={'otp_secret': otp_secret})
             case 'disconnect':
                 if profile.otp_secret is None:
                     raise HTTPException(
                         detail='Two factor auth is not connected',
                         status_code=status.HTTP_400_BAD_REQUEST)
-                return await db.fetch_one(
-                    update(user)
-                    .where(user.c.username == profile.username)
-                    .values({'otp_secret': None}).returning(user))
+                return await self.update_profile_data(username=profile.username,
+                                                      values={'otp_secret': None})
             case _:
                 raise HTTPException(
                     detail='Wrong query param',
                     status_code=status.HTTP_400_BAD_REQUEST)
 
     async def change_password(self, username: str, current_password: str, new_password: str):
-        current_user = await self.find_profile_by_username(username)
+        current_user = await self.find_credentials_by_username(username)
         if not await self._check_password(current_password, current_user.password):
             raise LoginFailed()
-        new_password = bcrypt.hashpw(new_password.encode(), bcrypt.gensalt()).decode()
+        new_password = await password_hasher.hash(new_password)
         return await self.update_profile_data(username=username, values=dict(password=new_password))
 
     async def change_profile_data(self, username: str, data):
         return await self.update_profile_data(username=username, values=data.dict(exclude_unset=True))
 
     async def _check_password(self, password: str, password_hash: str) -> bool:
-        return bcrypt.checkpw(password.encode(), password_hash.encode())
+        return await password_hasher.check(password, password_hash)
 
     async def _generate_jwt_access_token(self, user: JwtUser) -> JwtTokenData:
         iat = dt.datetime.now(dt.timezone.utc)
@@ -202,12 +221,12 @@ class AuthService:
         except ExpiredSignatureError:
             raise HTTPException(detail='Token has already expired', status_code=status.HTTP_400_BAD_REQUEST)
         user = await self.find_profile_by_email(user_email)
-        new_password = bcrypt.hashpw(reset_password.new_password.encode(), bcrypt.gensalt()).decode()
+        new_password = await password_hasher.hash(reset_password.new_password)
         return await self.update_profile_data(username=user.username, values=dict(password=new_password))
 
     async def create_temp_password(self, email):
         temp_password = secrets.token_urlsafe(6)
-        hashed = bcrypt.hashpw(temp_password.encode(), bcrypt.gensalt()).decode()
+        hashed = await password_hasher.hash(temp_password)
         subject = "Facezhuk Temp Password"
         recipient = [email]
         context = {'email': email, 'temp_password': temp_password}
@@ -224,7 +243,7 @@ class AuthService:
         subject = "Facezhuk Activation"
         recipient = [profile.email]
         context = {'first_name': profile.first_name, 'last_name': profile.last_name, 'token': token}
-        template_name = 'activation.html'
+        template_name = 'activate.html'
         print('activation email', token)
         await send_email(recipient, template_name, context, subject)
 
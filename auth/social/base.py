@@ -0,0 +1,82 @@
+import asyncio
+from typing import Optional
+
+import httpx
+
+from common.services import services
+from config import cfg
+
+
+class SocialAdapter:
+    """Base Adapter for Social Authentication.
+
+    Subclasses describe the requests of the provider in `access_token_request`
+    and `profile_request`, the adapter sends them with the shared HTTP client
+    (`services.http`).
+    Server errors and network failures of the profile request are retried with
+    exponential backoff. The authorization code is single-use, so the access token
+    request is only retried when the connection failed, before it was sent.
+
+    Attributes:
+        access_token_url (str): URL that is used for getting access token from social provider.
+        profile_url (str): URL that is used for getting profile info from social provider.
+        retries (int): Number of retries of a failed request.
+        backoff (float): Delay before the first retry, in seconds; doubled on each next one.
+    """
+    access_token_url: str
+    profile_url: str
+    backoff = 0.2
+
+    def __init__(self, client: httpx.AsyncClient = None, access_token_url: str = None, profile_url: str = None):
+        self._client = client
+        self.retries = cfg.social_http_retries
+        if access_token_url:
+            self.access_token_url = access_token_url
+        if profile_url:
+            self.profile_url = profile_url
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        return self._client or services.http
+
+    def access_token_request(self, code: str) -> dict:
+        """Arguments of `httpx.AsyncClient.request` exchanging authorization code for access token."""
+        raise NotImplementedError
+
+    def profile_request(self, access_token: str) -> dict:
+        """Arguments of `httpx.AsyncClient.request` exchanging access token for profile info."""
+        raise NotImplementedError
+
+    async def _request(self, idempotent: bool, **kwargs) -> httpx.Response:
+        retryable = httpx.TransportError if idempotent else (httpx.ConnectError, httpx.ConnectTimeout)
+        for attempt in range(self.retries + 1):
+            try:
+                resp = await self.client.request(**kwargs)
+                if not idempotent or resp.status_code < 500 or attempt == self.retries:
+                    return resp
+            except retryable:
+                if attempt == self.retries:
+                    raise
+            await asyncio.sleep(self.backoff * 2 ** attempt)
+
+    async def get_access_token_data(self, code: str) -> Optional[str]:
+        """Method for exchanging authorization code for access token.
+
+        Args:
+            code (str): Authorization code.
+        """
+        resp = await self._request(idempotent=False, **self.access_token_request(code))
+        if resp.status_code != 200:
+            raise ValueError(
+                'Unable to obtain Access Token. Please double-check the info you are sending to `access_token_url`'
+            )
+        return resp.json().get('access_token', None)
+
+    async def get_profile_data(self, access_token: str) -> dict:
+        """Method for exchanging access token for profile info.
+
+        Args:
+            access_token (str): Access token.
+        """
+        resp = await self._request(idempotent=True, **self.profile_request(access_token))
+        return resp.json()
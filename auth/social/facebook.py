@@ -1,9 +1,8 @@
-import requests
-
+from auth.social.base import SocialAdapter
 from config import cfg
 
 
-class FacebookAdapter:
+class FacebookAdapter(SocialAdapter):
     """Custom Adapter for Facebook Social Authentication.
 
     Attributes:
@@ -13,11 +12,9 @@ class FacebookAdapter:
     access_token_url = "https://graph.facebook.com/v14.0/oauth/access_token"
     profile_url = "https://graph.facebook.com/me"
 
-    def get_access_token_data(self, code: str):
-        """Method for exchanging authorization code for access token.
-
-        Here we specify all necessary info (i.e. client_id, client_secret) for Facebook provider
-        and send request to `access_token_url` to get access token.
+    def access_token_request(self, code: str) -> dict:
+        """Here we specify all necessary info (i.e. client_id, client_secret) for Facebook provider
+        to send a request to `access_token_url` and get access token.
 
         Args:
             code (str): Authorization code.
@@ -34,18 +31,10 @@ class FacebookAdapter:
             'code': code,
             'scope': scope
         }
-        resp = requests.get(self.access_token_url, params=params)
-        if resp.status_code != 200:
-            raise ValueError(
-                'Unable to obtain Access Token. Please double-check the info you are sending to `access_token_url`'
-            )
-        access_token = resp.json().get('access_token', None)
-        return access_token
-
-    def get_profile_data(self, access_token: str):
-        """Method for exchanging access token for profile info.
+        return dict(method='GET', url=self.access_token_url, params=params)
 
-        Here we use `access_token` to get Facebook account's profile info.
+    def profile_request(self, access_token: str) -> dict:
+        """Here we use `access_token` to get Facebook account's profile info.
 
         Args:
             access_token (str): Access token.
@@ -55,6 +44,4 @@ class FacebookAdapter:
             'fields': 'email',
             'access_token': access_token
         }
-        resp = requests.get(self.profile_url, params=params)
-        profile_info = resp.json()
-        return profile_info
+        return dict(method='GET', url=self.profile_url, params=params)
@@ -1,9 +1,8 @@
-import requests
-
+from auth.social.base import SocialAdapter
 from config import cfg
 
 
-class GoogleAdapter:
+class GoogleAdapter(SocialAdapter):
     """Custom Adapter for Google Social Authentication.
 
     Attributes:
@@ -13,11 +12,9 @@ class GoogleAdapter:
     access_token_url = "https://accounts.google.com/o/oauth2/token"
     profile_url = "https://www.googleapis.com/oauth2/v1/userinfo"
 
-    def get_access_token_data(self, code: str):
-        """Method for exchanging authorization code for access token.
-
-        Here we specify all necessary info (i.e. client_id, client_secret) for Google provider
-        and send request to `access_token_url` to get access token.
+    def access_token_request(self, code: str) -> dict:
+        """Here we specify all necessary info (i.e. client_id, client_secret) for Google provider
+        to send a request to `access_token_url` and get access token.
 
         Args:
             code (str): Authorization code.
@@ -36,26 +33,13 @@ class GoogleAdapter:
             'scope': scope,
             'grant_type': grant_type
         }
-        resp = requests.post(self.access_token_url, data=data)
-        if resp.status_code != 200:
-            raise ValueError(
-                'Unable to obtain Access Token. Please double-check the info you are sending to `access_token_url`'
-            )
-        access_token = resp.json().get('access_token', None)
-        return access_token
-
-    def get_profile_data(self, access_token: str):
-        """Method for exchanging access token for profile info.
+        return dict(method='POST', url=self.access_token_url, data=data)
 
-        Here we use `access_token` to get Google account's profile info.
+    def profile_request(self, access_token: str) -> dict:
+        """Here we use `access_token` to get Google account's profile info.
 
         Args:
             access_token (str): Access token.
 
         """
-        resp = requests.get(
-            self.profile_url,
-            headers={"Authorization": f"Bearer {access_token}"},
-        )
-        profile_info = resp.json()
-        return profile_info
+        return dict(method='GET', url=self.profile_url, headers={"Authorization": f"Bearer {access_token}"})
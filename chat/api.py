@@ -1,12 +1,16 @@
-from fastapi import Depends
+from typing import Optional
+
+from fastapi import Depends, HTTPException, Query
 from fastapi_pagination import LimitOffsetPage
 from fastapi_utils.cbv import cbv
 from fastapi_utils.inferring_router import InferringRouter
+from starlette import status
 
-from auth.models import User
-from auth.security import get_user
-from chat.schemas import ChatMessage, Chat
+from auth.security import get_user, Principal
+from chat.exceptions import InvalidCursor
+from chat.schemas import ChatMessage, Chat, ChatHistoryPage
 from chat.service import ChatService
+from common.responses import render
 from notification.manager import notifier
 
 chat_router = InferringRouter()
@@ -24,24 +28,57 @@ class ChatApi:
     @chat_router.get(
         "/chat/{chat_id}/messages",
         response_model=LimitOffsetPage[ChatMessage])
-    async def get_messages(self, chat_id: str, user: User = Depends(get_user)):
+    async def get_messages(self, chat_id: str, user: Principal = Depends(get_user)):
         """Get messages belonging to a specific chat."""
-        return await self._service.get_chat_messages(chat_id)
+        return render(LimitOffsetPage[ChatMessage], await self._service.get_chat_messages(chat_id))
+
+    @chat_router.get(
+        "/chat/{chat_id}/history",
+        response_model=ChatHistoryPage)
+    async def get_history(
+            self,
+            chat_id: str,
+            before: Optional[str] = Query(None),
+            after: Optional[str] = Query(None),
+            limit: int = Query(50, ge=1, le=100),
+            user: Principal = Depends(get_user)):
+        """Get messages of a specific chat, newest first, paginated with cursors.
+        Pass `nextCursor` as `before` to scroll back, `previousCursor` as `after` to get newer messages.
+        """
+        if before and after:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail='Only one of `before` and `after` can be specified')
+        try:
+            history = await self._service.get_chat_history(chat_id, limit, before=before, after=after)
+            return render(ChatHistoryPage, history)
+        except InvalidCursor as e:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=str(e))
 
     @chat_router.get(
         "/chats",
         response_model=LimitOffsetPage[Chat])
-    async def get_chats(self, user: User = Depends(get_user)):
-        """Get all user's chats."""
+    async def get_chats(self, user: Principal = Depends(get_user)):
+        """Get all user's chats, most recently active first,
+        with the last message and the number of unread messages."""
         return await self._service.get_chats(user.username)
 
+    @chat_router.post(
+        "/chat/{chat_id}/read",
+        status_code=status.HTTP_204_NO_CONTENT)
+    async def mark_chat_as_read(self, chat_id: str, user: Principal = Depends(get_user)):
+        """Reset the number of unread messages of a specific chat."""
+        await self._service.mark_chat_as_read(chat_id, user.username)
+
     @chat_router.post(
         "/chat/messages/{friend_username}/")
     async def create_message(
             self,
             friend_username: str,
             message_in: ChatMessage,
-            user: User = Depends(get_user)):
+            user: Principal = Depends(get_user)):
         """Send new message to interlocutor."""
-        self._service.save_chat_message(user.username, friend_username, new_message=message_in)
+        await self._service.save_chat_message(user.username, friend_username, new_message=message_in)
         await notifier.broadcast(friend_username, f'New Message Received from {user.username}')
@@ -0,0 +1,71 @@
+import datetime as dt
+from itertools import islice
+from typing import Iterable, Iterator, List
+
+from chat.models import chat_message
+from common.utils import prepare_object_for_postgresql
+
+STAGING_TABLE = 'chat_message_staging'
+
+
+def _batches(items: Iterable, size: int) -> Iterator[List]:
+    iterator = iter(items)
+    while batch := list(islice(iterator, size)):
+        yield batch
+
+
+class ChatMessageBulkLoader:
+    """Bulk loader of MongoDB chat messages into the `chat_message` table.
+
+    Every batch is copied with COPY into a temporary staging table and then moved
+    into `chat_message` with a single `INSERT ... SELECT`, which resolves conflicts
+    on `mongo_id`: existing rows are kept with `ignore` or overwritten with `update`.
+    Works on asyncpg connections, with binary COPY.
+
+    Attributes:
+        batch_size (int): Number of messages copied per transaction.
+        on_conflict (str): `ignore` or `update`, what to do with already archived messages.
+    """
+    columns = [column.name for column in chat_message.c]
+
+    def __init__(self, batch_size: int = 5000, on_conflict: str = 'ignore'):
+        if on_conflict not in ('ignore', 'update'):
+            raise ValueError(f'Unknown conflict handling: {on_conflict}')
+        self.batch_size = batch_size
+        self.on_conflict = on_conflict
+
+    def _create_staging_table_sql(self) -> str:
+        return (f'CREATE TEMP TABLE IF NOT EXISTS {STAGING_TABLE} '
+                f'(LIKE {chat_message.name} INCLUDING DEFAULTS) ON COMMIT DELETE ROWS')
+
+    def _merge_sql(self) -> str:
+        columns = ', '.join(self.columns)
+        if self.on_conflict == 'update':
+            updates = ', '.join(f'{c} = EXCLUDED.{c}' for c in self.columns if c != 'mongo_id')
+            conflict = f'DO UPDATE SET {updates}'
+        else:
+            conflict = 'DO NOTHING'
+        return (f'INSERT INTO {chat_message.name} ({columns}) '
+                f'SELECT DISTINCT ON (mongo_id) {columns} FROM {STAGING_TABLE} '
+                f'ON CONFLICT (mongo_id) {conflict}')
+
+    def _records(self, messages: List[dict]) -> List[tuple]:
+        records = []
+        for message in messages:
+            row = prepare_object_for_postgresql(message)
+            if isinstance(row.get('created_at'), str):
+                row['created_at'] = dt.datetime.fromisoformat(row['created_at'].replace('Z', '+00:00'))
+            records.append(tuple(row.get(column) for column in self.columns))
+        return records
+
+    async def load(self, connection, messages: Iterable[dict]) -> int:
+        """Load messages through an asyncpg connection, returning the number of written rows."""
+        written = 0
+        for batch in _batches(messages, self.batch_size):
+            async with connection.transaction():
+                await connection.execute(self._create_staging_table_sql())
+                await connection.copy_records_to_table(
+                    STAGING_TABLE, records=self._records(batch), columns=self.columns)
+                status = await connection.execute(self._merge_sql())
+            written += int(status.split()[-1])
+        return written
@@ -0,0 +1,108 @@
+import asyncio
+import logging
+from typing import List, Optional, Tuple
+
+from pymongo import UpdateOne
+
+from chat.models import chat_activity_update
+from config import cfg
+from database.core import mongo
+
+logger = logging.getLogger(__name__)
+
+
+class MessageWriteBuffer:
+    """Write-behind buffer for chat messages.
+
+    Messages are collected in a bounded queue and written with a single `insert_many`
+    once `batch_size` messages are gathered or `flush_interval` seconds have passed
+    since the first one of the batch; chats of the batch are upserted in one bulk write.
+    When the queue is full, producers wait until the writer catches up.
+
+    Attributes:
+        batch_size (int): Max number of messages written at once.
+        flush_interval (float): Max time in seconds a message waits for its batch.
+        max_queue_size (int): Max number of messages waiting to be written.
+    """
+
+    def __init__(self, batch_size: int = 100, flush_interval: float = 0.05, max_queue_size: int = 10000):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_queue_size = max_queue_size
+        self._queue: Optional[asyncio.Queue] = None
+        self._writer: Optional[asyncio.Task] = None
+
+    @property
+    def running(self) -> bool:
+        return self._writer is not None
+
+    async def start(self):
+        self._queue = asyncio.Queue(maxsize=self.max_queue_size)
+        self._writer = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Stop the writer, flushing every queued message."""
+        if not self._writer:
+            return
+        await self._queue.put(None)
+        await self._writer
+        self._writer = None
+
+    async def put(self, message: dict) -> asyncio.Future:
+        """Queue the message, returning a future resolved once its batch is acknowledged."""
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((message, future))
+        return future
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        stopping = False
+        while not stopping:
+            item = await self._queue.get()
+            if item is None:
+                break
+            batch = [item]
+            deadline = loop.time() + self.flush_interval
+            while len(batch) < self.batch_size:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    item = await asyncio.wait_for(self._queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    break
+                if item is None:
+                    stopping = True
+                    break
+                batch.append(item)
+            await self._flush(batch)
+
+    async def _write(self, messages: List[dict]):
+        chats = {}
+        for message in messages:
+            chats.setdefault(message['chatId'], []).append(message)
+        await mongo.messages.insert_many(messages, ordered=False)
+        await mongo.chats.bulk_write(
+            [UpdateOne({'chatId': chat_id}, chat_activity_update(chat_messages), upsert=True)
+             for chat_id, chat_messages in chats.items()],
+            ordered=False)
+
+    async def _flush(self, batch: List[Tuple[dict, asyncio.Future]]):
+        try:
+            await self._write([message for message, _ in batch])
+        except Exception as e:
+            logger.exception('Failed to write a batch of %s chat messages', len(batch))
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+                    # retrieved here so that non-durable writes don't log it a second time
+                    future.exception()
+            return
+        for _, future in batch:
+            if not future.done():
+                future.set_result(None)
+
+
+message_buffer = MessageWriteBuffer(batch_size=cfg.chat_write_buffer_batch_size,
+                                    flush_interval=cfg.chat_write_buffer_flush_ms / 1000,
+                                    max_queue_size=cfg.chat_write_buffer_max_size)
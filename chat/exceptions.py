@@ -1,2 +1,7 @@
 class NonExistentChatGroup(Exception):
     pass
+
+
+class InvalidCursor(Exception):
+    def __init__(self, msg="Cursor is invalid", *args, **kwargs):
+        super().__init__(msg, *args, **kwargs)
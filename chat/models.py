@@ -1,5 +1,6 @@
 import datetime as dt
-from typing import Optional
+from collections import Counter
+from typing import List, Optional
 from uuid import UUID
 
 from bson import ObjectId
@@ -10,7 +11,7 @@ from database.core import Base
 
 chat_message = Table(
     "chat_message", Base.metadata,
-    Column("mongo_id", String),
+    Column("mongo_id", String, unique=True),
     Column("from_username", String),
     Column("to_username", String),
     Column("chat_id", String),
@@ -19,6 +20,24 @@ chat_message = Table(
 )
 
 
+def chat_activity_update(messages: List[dict]) -> dict:
+    """Update of the chat document for its newly sent messages, given in sending order.
+
+    Keeps the inbox data denormalized on the chat: preview of the last message,
+    time of the last activity and unread messages count of each interlocutor.
+    """
+    last_message = messages[-1]
+    unread = Counter(message['toUsername'] for message in messages)
+    return {
+        '$setOnInsert': {'interlocutors': [last_message['fromUsername'], last_message['toUsername']]},
+        '$set': {'lastMessage': {'fromUsername': last_message['fromUsername'],
+                                 'content': last_message['content'],
+                                 'createdAt': last_message['createdAt']}},
+        '$max': {'lastActivityAt': last_message['createdAt']},
+        '$inc': {f'unread.{username}': count for username, count in unread.items()},
+    }
+
+
 class ChatMessage(BaseModel):
     created_at: Optional[dt.datetime]
     from_profile_id: UUID
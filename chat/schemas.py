@@ -1,4 +1,5 @@
-from typing import Optional
+import datetime as dt
+from typing import List, Optional
 
 from common.schemas import BaseSchema
 
@@ -9,6 +10,29 @@ class ChatMessage(BaseSchema):
     content: str
 
 
+class ChatLastMessage(BaseSchema):
+    from_username: str
+    content: str
+    created_at: dt.datetime
+
+
 class Chat(BaseSchema):
     chat_id: str
     interlocutors: list = []
+    last_message: Optional[ChatLastMessage]
+    last_activity_at: Optional[dt.datetime]
+    unread_count: int = 0
+
+
+class ChatHistoryMessage(ChatMessage):
+    id: str
+    chat_id: str
+    created_at: dt.datetime
+
+
+class ChatHistoryPage(BaseSchema):
+    items: List[ChatHistoryMessage]
+    # pass as `before` to get older messages, absent when the beginning of the chat is reached
+    next_cursor: Optional[str]
+    # pass as `after` to get newer messages
+    previous_cursor: Optional[str]
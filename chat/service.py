@@ -1,15 +1,20 @@
+import asyncio
+import base64
 import datetime as dt
 import uuid
+from typing import Tuple
 
-from fastapi import Body
+from bson import ObjectId
+from bson.errors import InvalidId
 from fastapi.encoders import jsonable_encoder
-from fastapi.responses import JSONResponse
+from fastapi_pagination.api import create_page, resolve_params
 from fastapi_pagination.ext.motor import paginate
-from starlette import status
 
-from chat.models import ChatMessage
-from database.core import mongo_db_messages_collection, mongo_db_chats_collection, async_mongo_db_messages_collection, \
-    async_mongo_db_chats_collection
+from chat.buffer import message_buffer
+from chat.exceptions import InvalidCursor
+from chat.models import ChatMessage, chat_activity_update
+from config import cfg
+from database.core import mongo
 
 
 class ChatService:
@@ -19,9 +24,10 @@ class ChatService:
         chat_id = str(uuid.uuid5(uuid.NAMESPACE_X500, '+'.join(ids)))
         return chat_id
 
-    def save_chat_message(self, from_username, friend_username, new_message: ChatMessage = Body(...)):
+    async def save_chat_message(self, from_username: str, friend_username: str, new_message: ChatMessage) -> dict:
+        chat_id = self.generate_chat_id(from_username, friend_username)
         msg = {
-            'chatId': self.generate_chat_id(from_username, friend_username),
+            'chatId': chat_id,
             'createdAt': dt.datetime.now(),
             'isBackupCreated': False,
             'fromUsername': from_username,
@@ -29,27 +35,88 @@ class ChatService:
             'content': new_message.content
         }
         message = jsonable_encoder(msg)
-        n_msg = mongo_db_messages_collection.insert_one(message)
-        chat_collection = mongo_db_chats_collection.find_one({"chatId": message['chatId']})
-        if not chat_collection:
-            chat_data = {'chatId': message['chatId'],
-                         'interlocutors': [from_username, friend_username]}
-            mongo_db_chats_collection.insert_one(chat_data)
-        created_msg = mongo_db_messages_collection.find_one({"_id": n_msg.inserted_id})
-        created_msg['_id'] = str(created_msg['_id'])
-        created_msg['createdAt'] = str(created_msg['createdAt'])
-        return JSONResponse(status_code=status.HTTP_201_CREATED, content=created_msg)
+        if message_buffer.running:
+            message['_id'] = ObjectId()
+            acknowledged = await message_buffer.put(message)
+            if cfg.chat_write_buffer_durable:
+                await acknowledged
+            return {**message, '_id': str(message['_id'])}
+        inserted, _ = await asyncio.gather(
+            mongo.messages.insert_one(message),
+            mongo.chats.update_one(
+                {'chatId': chat_id},
+                chat_activity_update([message]),
+                upsert=True))
+        message['_id'] = str(inserted.inserted_id)
+        return message
 
     async def get_chat_messages(self, chat_id: str):
         query_filter = {'chatId': chat_id}
-        messages = await paginate(collection=async_mongo_db_messages_collection,
+        messages = await paginate(collection=mongo.messages,
                                   query_filter=query_filter,
-                                  sort=[("created_at", -1)])
+                                  sort=[("createdAt", -1), ("_id", -1)])
         return messages
 
+    def encode_cursor(self, message: dict) -> str:
+        return base64.urlsafe_b64encode(f"{message['createdAt']}|{message['_id']}".encode()).decode()
+
+    def decode_cursor(self, cursor: str) -> Tuple[str, ObjectId]:
+        try:
+            created_at, _id = base64.urlsafe_b64decode(cursor.encode()).decode().split('|')
+            return created_at, ObjectId(_id)
+        except (ValueError, InvalidId):
+            raise InvalidCursor()
+
+    async def get_chat_history(self, chat_id: str, limit: int, before: str = None, after: str = None) -> dict:
+        """Keyset paginated chat history, newest messages first.
+
+        Messages are ordered by (`createdAt`, `_id`), so a page costs the same
+        however deep in the history it is.
+        """
+        query_filter = {'chatId': chat_id}
+        direction = 1 if after else -1
+        cursor = after or before
+        if cursor:
+            created_at, _id = self.decode_cursor(cursor)
+            op = '$gt' if after else '$lt'
+            query_filter['$or'] = [{'createdAt': {op: created_at}},
+                                   {'createdAt': created_at, '_id': {op: _id}}]
+        messages = await mongo.messages \
+            .find(query_filter) \
+            .sort([('createdAt', direction), ('_id', direction)]) \
+            .limit(limit + 1) \
+            .to_list(length=limit + 1)
+        has_older = len(messages) > limit
+        messages = messages[:limit]
+        if after:
+            # the page was read forward from `after`, so older messages always exist
+            messages.reverse()
+            has_older = bool(messages)
+        if messages:
+            previous_cursor = self.encode_cursor(messages[0])
+        else:
+            previous_cursor = after
+        return {
+            'items': [{**m, 'id': str(m['_id'])} for m in messages],
+            'next_cursor': self.encode_cursor(messages[-1]) if has_older else None,
+            'previous_cursor': previous_cursor,
+        }
+
     async def get_chats(self, username: str):
         query_filter = {'interlocutors': username}
-        chats = await paginate(collection=async_mongo_db_chats_collection,
-                               query_filter=query_filter,
-                               sort=[("created_at", -1)])
-        return chats
+        params = resolve_params()
+        raw_params = params.to_raw_params()
+        total = await mongo.chats.count_documents(query_filter)
+        chats = await mongo.chats \
+            .find(query_filter) \
+            .sort([("lastActivityAt", -1)]) \
+            .skip(raw_params.offset) \
+            .limit(raw_params.limit) \
+            .to_list(length=raw_params.limit)
+        items = [{**chat, 'unreadCount': chat.get('unread', {}).get(username, 0)} for chat in chats]
+        return create_page(items, total, params)
+
+    async def mark_chat_as_read(self, chat_id: str, username: str):
+        await mongo.chats.update_one(
+            {'chatId': chat_id, 'interlocutors': username},
+            {'$set': {f'unread.{username}': 0}})
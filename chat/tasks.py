@@ -1,9 +1,10 @@
+import asyncio
+
 from celery import Celery
 
-from chat.models import chat_message
-from common.utils import prepare_object_for_postgresql
+from chat.archive import ChatMessageBulkLoader
 from config import cfg
-from database.core import mongo_db_messages_collection, engine
+from database.core import db, mongo
 
 BROKER_URL = cfg.broker_url
 
@@ -12,15 +13,53 @@ celery = Celery('EOD_TASKS', broker=BROKER_URL)
 # Loads settings for Backend to store results of jobs
 celery.config_from_object('celeryconfig')
 
+loader = ChatMessageBulkLoader(batch_size=cfg.chat_backup_batch_size, on_conflict=cfg.chat_backup_on_conflict)
+
 
 @celery.task
 def save_message_into_postgresql():
-    collection = mongo_db_messages_collection
-    messages = collection.find({'isBackupCreated': False})
-    for message in messages:
-        inserted = chat_message.insert().values(**prepare_object_for_postgresql(message))
-        engine.execute(inserted)
-    collection.update_many(
-        {"isBackupCreated": False},
-        {'$set': {'isBackupCreated': True}}
-    )
+    """Copy messages that are not backed up yet from MongoDB to PostgreSQL.
+
+    `isBackupCreated` is the durable checkpoint: each run reads the messages not
+    flagged yet, whatever their `_id`, in `_id` order and in batches, off the partial
+    index holding only them. Each batch is written with COPY and then exactly its
+    `_id`s are flagged in MongoDB. If the task dies between these two steps, the
+    batch is read again on the next run and the conflicting rows are resolved on
+    the unique `mongo_id`.
+    """
+    asyncio.run(_save_message_into_postgresql())
+
+
+async def _save_message_into_postgresql():
+    mongo.connect()
+    await db.connect()
+    try:
+        async with db.connection() as connection:
+            await _copy_messages(connection.raw_connection)
+    finally:
+        await db.disconnect()
+        mongo.close()
+
+
+async def _copy_messages(connection) -> int:
+    """Copy the messages which are not backed up yet, returning their number."""
+    collection = mongo.messages
+    # high-water mark of this run only, so that each batch starts after the previous one
+    last_id = None
+    copied = 0
+    while True:
+        query_filter = {'isBackupCreated': False}
+        if last_id is not None:
+            query_filter['_id'] = {'$gt': last_id}
+        messages = await collection.find(query_filter).sort('_id', 1).to_list(cfg.chat_backup_batch_size)
+        if not messages:
+            break
+        await loader.load(connection, messages)
+        ids = [message['_id'] for message in messages]
+        await collection.update_many(
+            {'_id': {'$in': ids}},
+            {'$set': {'isBackupCreated': True}}
+        )
+        last_id = ids[-1]
+        copied += len(ids)
+    return copied
@@ -0,0 +1,55 @@
+import asyncio
+import logging
+from typing import Callable, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class MetricsReporter:
+    """Periodic log of the runtime metrics of the worker.
+
+    Components register a snapshot function of their counters under a name, the
+    reporter logs every snapshot each `interval` seconds, one line per source.
+
+    Attributes:
+        sources (Dict[str, Callable[[], dict]]): Snapshot function of each source.
+    """
+
+    def __init__(self):
+        self.sources: Dict[str, Callable[[], dict]] = {}
+        self._reporter: Optional[asyncio.Task] = None
+
+    def register(self, name: str, snapshot: Callable[[], dict]):
+        self.sources[name] = snapshot
+
+    def collect(self) -> Dict[str, dict]:
+        return {name: snapshot() for name, snapshot in self.sources.items()}
+
+    def report(self):
+        for name, snapshot in self.sources.items():
+            try:
+                logger.info('Metrics of %s: %s', name, snapshot())
+            except Exception:
+                logger.exception('Unable to collect the metrics of %s', name)
+
+    async def start(self, interval: float):
+        if interval > 0:
+            self._reporter = asyncio.create_task(self._report_periodically(interval))
+
+    async def stop(self):
+        if not self._reporter:
+            return
+        self._reporter.cancel()
+        try:
+            await self._reporter
+        except asyncio.CancelledError:
+            pass
+        self._reporter = None
+
+    async def _report_periodically(self, interval: float):
+        while True:
+            await asyncio.sleep(interval)
+            self.report()
+
+
+metrics = MetricsReporter()
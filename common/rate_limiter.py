@@ -1,14 +1,250 @@
-import sys
+import logging
+import math
+import time
+from typing import Optional, Tuple
 
-from fastapi_limiter.depends import RateLimiter
+import jwt
+import redis.asyncio as redis
+from fastapi import HTTPException
+from starlette import status
 from starlette.requests import Request
 from starlette.responses import Response
 
+from auth.security import get_user
+from common.cache import TTLCache
+from common.services import services
+from config import cfg
 
-class RateLimitTo(RateLimiter):
-    """Wrapper over RateLimiter to bypass rate limiting during pytest runs."""
+logger = logging.getLogger(__name__)
+
+ALGORITHMS = ('token_bucket', 'sliding_window')
+
+# both scripts take KEYS[1] = limit key, ARGV = limit, window (ms), requested tokens
+# and return {granted tokens, retry after (ms) when nothing is granted}
+TOKEN_BUCKET_LUA = """
+local time = redis.call('TIME')
+local now = time[1] * 1000 + math.floor(time[2] / 1000)
+local limit, window, requested = tonumber(ARGV[1]), tonumber(ARGV[2]), tonumber(ARGV[3])
+local rate = limit / window
+local bucket = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local tokens = tonumber(bucket[1]) or limit
+local ts = tonumber(bucket[2]) or now
+tokens = math.min(limit, tokens + math.max(0, now - ts) * rate)
+local granted = math.min(requested, math.floor(tokens))
+tokens = tokens - granted
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'ts', now)
+redis.call('PEXPIRE', KEYS[1], window)
+local retry = 0
+if granted == 0 then
+    retry = math.ceil((1 - tokens) / rate)
+end
+return {granted, retry}
+"""
+
+SLIDING_WINDOW_LUA = """
+local time = redis.call('TIME')
+local now = time[1] * 1000 + math.floor(time[2] / 1000)
+local limit, window, requested = tonumber(ARGV[1]), tonumber(ARGV[2]), tonumber(ARGV[3])
+local current = math.floor(now / window)
+local elapsed = (now % window) / window
+local data = redis.call('HMGET', KEYS[1], 'window', 'count', 'previous')
+local stored, count, previous = tonumber(data[1]), tonumber(data[2]) or 0, tonumber(data[3]) or 0
+if stored ~= current then
+    if stored == current - 1 then previous = count else previous = 0 end
+    count = 0
+end
+local granted = math.max(0, math.min(requested, math.floor(limit - previous * (1 - elapsed) - count)))
+redis.call('HSET', KEYS[1], 'window', current, 'count', count + granted, 'previous', previous)
+redis.call('PEXPIRE', KEYS[1], window * 2)
+local retry = 0
+if granted == 0 then
+    if previous > 0 and count < limit then
+        retry = math.ceil((1 - (limit - 1 - count) / previous - elapsed) * window)
+    else
+        retry = math.ceil((1 - elapsed) * window)
+    end
+    retry = math.max(retry, 1)
+end
+return {granted, retry}
+"""
+
+
+def _token_bucket(state: Optional[list], now: float, limit: int, window: int, requested: int) -> Tuple[list, int, int]:
+    rate = limit / window
+    tokens, ts = state or (limit, now)
+    tokens = min(limit, tokens + max(0.0, now - ts) * rate)
+    granted = min(requested, math.floor(tokens))
+    tokens -= granted
+    return [tokens, now], granted, 0 if granted else math.ceil((1 - tokens) / rate)
+
+
+def _sliding_window(state: Optional[list], now: float, limit: int, window: int,
+                    requested: int) -> Tuple[list, int, int]:
+    current, elapsed = divmod(now, window)
+    elapsed /= window
+    stored, count, previous = state or (None, 0, 0)
+    if stored != current:
+        previous = count if stored == current - 1 else 0
+        count = 0
+    granted = max(0, min(requested, math.floor(limit - previous * (1 - elapsed) - count)))
+    retry = 0
+    if not granted:
+        if previous and count < limit:
+            retry = math.ceil((1 - (limit - 1 - count) / previous - elapsed) * window)
+        else:
+            retry = math.ceil((1 - elapsed) * window)
+        retry = max(retry, 1)
+    return [current, count + granted, previous], granted, retry
+
+
+class LimiterBackend:
+    """Shared state of rate limits.
+
+    `acquire` takes up to `requested` tokens of a limit of `limit` hits per `window`
+    milliseconds, returning the number of granted tokens and, when none is granted,
+    the time to wait before retrying, in milliseconds.
+    """
+
+    async def acquire(self, key: str, algorithm: str, limit: int, window: int, requested: int) -> Tuple[int, int]:
+        raise NotImplementedError
+
+
+class NoopLimiterBackend(LimiterBackend):
+    """Grants every request, for tests and local development."""
+
+    async def acquire(self, key: str, algorithm: str, limit: int, window: int, requested: int) -> Tuple[int, int]:
+        return requested, 0
+
+
+class MemoryLimiterBackend(LimiterBackend):
+    """Limits kept in the process, each worker limits on its own."""
+
+    def __init__(self, max_keys: int = 10000):
+        # an evicted key starts over with a full limit, which only makes the limiter more lenient
+        self._states = TTLCache(max_size=max_keys, ttl=24 * 60 * 60)
+
+    async def acquire(self, key: str, algorithm: str, limit: int, window: int, requested: int) -> Tuple[int, int]:
+        step = _token_bucket if algorithm == 'token_bucket' else _sliding_window
+        state, granted, retry = step(self._states.get(key), time.monotonic() * 1000, limit, window, requested)
+        self._states.set(key, state)
+        return granted, retry
+
+
+class RedisLimiterBackend(LimiterBackend):
+    """Limits shared by all workers, updated atomically by Lua scripts on the Redis clock.
+
+    When Redis is unavailable requests are let through.
+    """
+
+    def __init__(self, prefix: str = 'ratelimit'):
+        self.prefix = prefix
+        self._client = None
+        self._scripts = {}
+
+    def _script(self, algorithm: str):
+        client = services.redis
+        if client is not self._client:
+            self._client = client
+            self._scripts = {'token_bucket': client.register_script(TOKEN_BUCKET_LUA),
+                             'sliding_window': client.register_script(SLIDING_WINDOW_LUA)}
+        return self._scripts[algorithm]
+
+    async def acquire(self, key: str, algorithm: str, limit: int, window: int, requested: int) -> Tuple[int, int]:
+        try:
+            granted, retry = await self._script(algorithm)(
+                keys=[f'{self.prefix}:{algorithm}:{key}'], args=[limit, window, requested])
+        except redis.RedisError:
+            logger.exception('Unable to check rate limit, letting the request through')
+            return requested, 0
+        return int(granted), int(retry)
+
+
+def create_backend() -> LimiterBackend:
+    match cfg.rate_limit_backend:
+        case 'redis':
+            return RedisLimiterBackend()
+        case 'memory':
+            return MemoryLimiterBackend(max_keys=cfg.rate_limit_local_keys)
+        case 'noop':
+            return NoopLimiterBackend()
+        case backend:
+            raise ValueError(f'Unknown rate limit backend: {backend}')
+
+
+limiter_backend = create_backend()
+
+
+class _Lease:
+    __slots__ = ('tokens', 'expires_at', 'blocked_until')
+
+    def __init__(self, tokens: int, expires_at: float, blocked_until: float = 0.0):
+        self.tokens = tokens
+        self.expires_at = expires_at
+        self.blocked_until = blocked_until
+
+
+class RateLimitTo:
+    """Rate limit dependency, limiting each user (or client IP for anonymous requests) per route.
+
+    Tokens are taken from the backend in batches of up to `batch_size` and spent
+    locally, so most requests are admitted without a round-trip; a key which ran
+    out is rejected locally until its retry time. Batches are only valid for one
+    window, so a worker can't hoard tokens, and the limit is approximate: tokens
+    leased by a worker are not available to the others until spent or expired.
+
+    Attributes:
+        times (int): Number of allowed hits per window.
+        window (int): Window length, in milliseconds.
+        algorithm (str): `token_bucket` or `sliding_window`.
+        batch_size (int): Max number of tokens taken from the backend at once.
+    """
+
+    def __init__(self, times: int = 1, milliseconds: int = 0, seconds: int = 0, minutes: int = 0, hours: int = 0,
+                 algorithm: str = None, backend: LimiterBackend = None, batch_size: int = None):
+        self.times = times
+        self.window = milliseconds + 1000 * (seconds + 60 * (minutes + 60 * hours))
+        self.algorithm = algorithm or cfg.rate_limit_algorithm
+        if self.algorithm not in ALGORITHMS:
+            raise ValueError(f'Unknown rate limit algorithm: {self.algorithm}')
+        self._backend = backend
+        self.batch_size = max(1, min(times, batch_size or cfg.rate_limit_batch_size))
+        self._leases = TTLCache(max_size=cfg.rate_limit_local_keys, ttl=self.window / 1000)
+
+    @property
+    def backend(self) -> LimiterBackend:
+        return self._backend or limiter_backend
+
+    @staticmethod
+    def identify(request: Request) -> str:
+        endpoint = request.scope.get('endpoint')
+        route = f'{endpoint.__module__}.{endpoint.__qualname__}' if endpoint else request.scope['path']
+        try:
+            identity = f'user:{get_user(request).username}'
+        except (HTTPException, jwt.InvalidTokenError):
+            identity = f'ip:{request.client.host if request.client else "unknown"}'
+        return f'{request.method}:{route}:{identity}'
+
+    async def admit(self, key: str) -> int:
+        """Spend a token of the key, returning 0 if admitted or the time to wait in milliseconds."""
+        now = time.monotonic()
+        lease = self._leases.get(key)
+        if lease is not None:
+            if lease.blocked_until > now:
+                return math.ceil((lease.blocked_until - now) * 1000)
+            if lease.tokens > 0 and lease.expires_at > now:
+                lease.tokens -= 1
+                return 0
+        granted, retry = await self.backend.acquire(key, self.algorithm, self.times, self.window, self.batch_size)
+        if not granted:
+            self._leases.set(key, _Lease(0, now, blocked_until=now + retry / 1000))
+            return retry
+        self._leases.set(key, _Lease(granted - 1, now + self.window / 1000))
+        return 0
 
     async def __call__(self, request: Request, response: Response):
-        if "pytest" in sys.modules:
-            return
-        await super().__call__(request, response)
+        retry = await self.admit(self.identify(request))
+        if retry:
+            raise HTTPException(
+                status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+                detail='Too Many Requests',
+                headers={'Retry-After': str(math.ceil(retry / 1000))})
@@ -0,0 +1,120 @@
+import datetime as dt
+import json
+import logging
+from collections.abc import Mapping
+from functools import lru_cache
+from typing import Any, Callable, Dict, List, Tuple, Type, Union
+
+from fastapi.encoders import jsonable_encoder
+from pydantic import BaseModel
+from pydantic.fields import (ModelField, SHAPE_SINGLETON, SHAPE_LIST, SHAPE_SET, SHAPE_SEQUENCE,
+                             SHAPE_TUPLE_ELLIPSIS, SHAPE_FROZENSET, SHAPE_DEQUE, SHAPE_ITERABLE)
+from starlette.responses import JSONResponse
+
+from common.schemas import dt_to_iso8601z
+from config import cfg
+
+try:
+    import orjson
+except ImportError:  # optional, responses are rendered with the json module without it
+    orjson = None
+
+logger = logging.getLogger(__name__)
+
+SEQUENCE_SHAPES = {SHAPE_LIST, SHAPE_SET, SHAPE_SEQUENCE, SHAPE_TUPLE_ELLIPSIS, SHAPE_FROZENSET, SHAPE_DEQUE,
+                   SHAPE_ITERABLE}
+NATIVE_TYPES = {str, int, float, bool, list, dict, Any}
+
+
+class FastJSONResponse(JSONResponse):
+    """JSON response rendered with orjson when it is installed.
+
+    Content must already be made of JSON types, see `ModelSerializer`.
+    """
+
+    def render(self, content: Any) -> bytes:
+        if orjson is not None:
+            return orjson.dumps(content)
+        return json.dumps(content, ensure_ascii=False, allow_nan=False, separators=(',', ':')).encode('utf-8')
+
+
+def _datetime(value: Union[dt.datetime, str]) -> str:
+    # datetimes stored in MongoDB are iso strings
+    if isinstance(value, str):
+        value = dt.datetime.fromisoformat(value.replace('Z', '+00:00'))
+    return dt_to_iso8601z(value)
+
+
+class ModelSerializer:
+    """Serializer of a response model, turning data into JSON types as the default
+    FastAPI path (validation, then `jsonable_encoder(by_alias=True)`) would.
+
+    Field aliases and value conversions are resolved once per model. Data is not
+    validated: it is read from model instances or mappings (database records, MongoDB
+    documents), keyed either by alias or by field name.
+    """
+
+    def __init__(self, model: Type[BaseModel]):
+        self.model = model
+        self.encoders = getattr(model.__config__, 'json_encoders', {})
+        self.fields: List[Tuple[str, str, Any, Callable]] = [
+            (field.name, field.alias, None if field.required else field.get_default(), self._converter(field))
+            for field in model.__fields__.values()]
+
+    def _converter(self, field: ModelField) -> Callable:
+        if isinstance(field.type_, type) and issubclass(field.type_, BaseModel):
+            convert = serializer_for(field.type_).dump
+        elif field.type_ is dt.datetime:
+            convert = _datetime
+        elif field.type_ in NATIVE_TYPES:
+            convert = None
+        else:
+            convert = self._encode
+        if field.shape in SEQUENCE_SHAPES:
+            if convert is None:
+                return list
+            return self._sequence(convert)
+        elif field.shape != SHAPE_SINGLETON:
+            convert = self._encode
+        return convert
+
+    @staticmethod
+    def _sequence(convert: Callable) -> Callable:
+        def convert_items(values):
+            return [None if value is None else convert(value) for value in values]
+        return convert_items
+
+    def _encode(self, value: Any) -> Any:
+        return jsonable_encoder(value, custom_encoder=self.encoders)
+
+    def dump(self, obj: Any) -> Dict[str, Any]:
+        result = {}
+        if isinstance(obj, Mapping):
+            for name, alias, default, convert in self.fields:
+                value = obj[alias] if alias in obj else obj.get(name, default)
+                result[alias] = value if value is None or convert is None else convert(value)
+        else:
+            for name, alias, default, convert in self.fields:
+                value = getattr(obj, name, default)
+                result[alias] = value if value is None or convert is None else convert(value)
+        return result
+
+
+def check_renderer():
+    """Warn when `cfg.fast_json_responses` is on without orjson, on startup."""
+    if cfg.fast_json_responses and orjson is None:
+        logger.warning('FAST_JSON_RESPONSES is on but orjson is not installed, '
+                       'responses are rendered with the slower json module')
+
+
+@lru_cache(maxsize=None)
+def serializer_for(model: Type[BaseModel]) -> ModelSerializer:
+    return ModelSerializer(model)
+
+
+def render(model: Type[BaseModel], content: Any) -> Any:
+    """Return content as a `FastJSONResponse` of the model when `cfg.fast_json_responses` is on,
+    otherwise return it unchanged, to be validated and serialized by FastAPI."""
+    if not cfg.fast_json_responses:
+        return content
+    return FastJSONResponse(serializer_for(model).dump(content))
@@ -0,0 +1,68 @@
+import inspect
+from typing import Any, Callable, Dict, Optional
+
+import httpx
+import redis.asyncio as redis
+
+from config import cfg
+
+
+class ServiceContainer:
+    """Lazily built clients shared by the application.
+
+    Clients are registered as factories and built on first access, so importing
+    a module never opens a connection. `aclose` tears down the clients which were
+    built, in reverse order, and the next access builds them again.
+    """
+
+    def __init__(self):
+        self._factories: Dict[str, Callable[[], Any]] = {}
+        self._closers: Dict[str, Optional[Callable[[Any], Any]]] = {}
+        self._instances: Dict[str, Any] = {}
+
+    def register(self, name: str, factory: Callable[[], Any], close: Callable[[Any], Any] = None):
+        self._factories[name] = factory
+        self._closers[name] = close
+
+    def get(self, name: str) -> Any:
+        if name not in self._instances:
+            if name not in self._factories:
+                raise KeyError(f'Unknown service: {name}')
+            self._instances[name] = self._factories[name]()
+        return self._instances[name]
+
+    def __getattr__(self, name: str) -> Any:
+        if name.startswith('_'):
+            raise AttributeError(name)
+        try:
+            return self.get(name)
+        except KeyError:
+            raise AttributeError(name)
+
+    def is_built(self, name: str) -> bool:
+        return name in self._instances
+
+    async def aclose(self):
+        for name in reversed(list(self._instances)):
+            instance = self._instances.pop(name)
+            close = self._closers[name]
+            if close is not None:
+                result = close(instance)
+                if inspect.isawaitable(result):
+                    await result
+
+
+services = ServiceContainer()
+
+# cache and limiter storage
+services.register(
+    'redis',
+    lambda: redis.from_url(cfg.cache_uri, encoding="utf-8", decode_responses=True),
+    close=lambda client: client.close())
+
+# social providers requests, keeping connections alive between logins
+services.register(
+    'http',
+    lambda: httpx.AsyncClient(timeout=cfg.social_http_timeout_seconds,
+                              limits=httpx.Limits(max_connections=100, max_keepalive_connections=20)),
+    close=lambda client: client.aclose())
@@ -1,54 +1,157 @@
+from functools import lru_cache
 from pathlib import Path
+from typing import Any, Callable
 
-from environs import Env
+from environs import Env, EnvError
 from fastapi_mail import ConnectionConfig
-from pydantic import BaseSettings
 
 env = Env()
 env.read_env()
 
 
-class Settings(BaseSettings):
-    debug = env.bool('DEBUG')
-    fastapi_log_level = env.str('FASTAPI_LOG_LEVEL')
+class setting:
+    """Environment variable parsed on first access, then cached on the instance.
 
-    postgres_uri = env.str('POSTGRES_URI')
-    test_postgres_uri = env.str('TEST_POSTGRES_URI')
+    Attributes:
+        parse (Callable): `Env` parser, e.g. `env.int`.
+        name (str): Name of the environment variable.
+        default (tuple): Default value, if any; the variable is required without it.
+    """
 
-    mongo_db_name = env.str('MONGO_DB_NAME')
-    mongo_db_username = env.str('MONGO_DB_USERNAME')
-    mongo_db_password = env.str('MONGO_DB_PASSWORD')
-    mongo_db_messages_collection = env.str('MONGO_DB_MESSAGES_COLLECTION')
-    mongo_db_chats_collection = env.str('MONGO_DB_CHATS_COLLECTION')
-    mongo_db_uri = env.str('MONGO_DB_URI')
+    def __init__(self, parse: Callable[..., Any], name: str, *default: Any):
+        self.parse = parse
+        self.name = name
+        self.default = default
 
-    cache_uri = env.str('CACHE_URI')
-    broker_url = env.str('BROKER_URL')
+    def __set_name__(self, owner, attr: str):
+        self.attr = attr
 
-    jwt_secret = env.str('JWT_SECRET')
-    jwt_algorithm = env.str('JWT_ALGORITHM')
-    jwt_expiration_seconds = env.int('JWT_EXPIRATION_SECONDS')
-    jwt_refresh_expiration_seconds = env.int('JWT_REFRESH_EXPIRATION_SECONDS')
+    def __get__(self, instance, owner=None):
+        if instance is None:
+            return self
+        value = self.parse(self.name, *self.default)
+        instance.__dict__[self.attr] = value
+        return value
 
-    google_client_secret = env.str('GOOGLE_CLIENT_SECRET')
-    google_client_id = env.str('GOOGLE_CLIENT_ID')
-    google_redirect_uri = env.str('GOOGLE_REDIRECT_URI')
 
-    facebook_client_secret = env.str('FACEBOOK_CLIENT_SECRET')
-    facebook_client_id = env.str('FACEBOOK_CLIENT_ID')
-    facebook_redirect_uri = env.str('FACEBOOK_REDIRECT_URI')
+class Settings:
+    """Application settings, read from the environment.
 
-    activation_token_duration = env.int('ACTIVATION_TOKEN_DURATION')
-    reset_password_token_duration = env.int('RESET_PASSWORD_TOKEN_DURATION')
+    Each setting is parsed on first access, so importing a module only requires
+    the variables it reads at import time. `validate` checks all of them at once,
+    on startup.
+    """
 
+    debug = setting(env.bool, 'DEBUG', False)
+    fast_json_responses = setting(env.bool, 'FAST_JSON_RESPONSES', False)
+    fastapi_log_level = setting(env.str, 'FASTAPI_LOG_LEVEL')
+    metrics_log_interval_seconds = setting(env.float, 'METRICS_LOG_INTERVAL_SECONDS', 60)
+
+    postgres_uri = setting(env.str, 'POSTGRES_URI')
+    test_postgres_uri = setting(env.str, 'TEST_POSTGRES_URI')
+    postgres_pool_min_size = setting(env.int, 'POSTGRES_POOL_MIN_SIZE', 5)
+    postgres_pool_max_size = setting(env.int, 'POSTGRES_POOL_MAX_SIZE', 20)
+    postgres_pool_acquire_timeout_seconds = setting(env.float, 'POSTGRES_POOL_ACQUIRE_TIMEOUT_SECONDS', 5)
+    postgres_pool_max_inactive_seconds = setting(env.float, 'POSTGRES_POOL_MAX_INACTIVE_SECONDS', 300)
+    postgres_statement_cache_size = setting(env.int, 'POSTGRES_STATEMENT_CACHE_SIZE', 1024)
+
+    mongo_db_name = setting(env.str, 'MONGO_DB_NAME')
+    mongo_db_username = setting(env.str, 'MONGO_DB_USERNAME')
+    mongo_db_password = setting(env.str, 'MONGO_DB_PASSWORD')
+    mongo_db_messages_collection = setting(env.str, 'MONGO_DB_MESSAGES_COLLECTION')
+    mongo_db_chats_collection = setting(env.str, 'MONGO_DB_CHATS_COLLECTION')
+    mongo_db_uri = setting(env.str, 'MONGO_DB_URI')
+    mongo_min_pool_size = setting(env.int, 'MONGO_MIN_POOL_SIZE', 0)
+    mongo_max_pool_size = setting(env.int, 'MONGO_MAX_POOL_SIZE', 100)
+    mongo_wait_queue_timeout_ms = setting(env.int, 'MONGO_WAIT_QUEUE_TIMEOUT_MS', 5000)
+    mongo_read_preference = setting(env.str, 'MONGO_READ_PREFERENCE', 'primary')
+    mongo_write_concern = setting(env.str, 'MONGO_WRITE_CONCERN', '1')
+    mongo_ensure_indexes = setting(env.bool, 'MONGO_ENSURE_INDEXES', True)
+
+    chat_write_buffer_enabled = setting(env.bool, 'CHAT_WRITE_BUFFER_ENABLED', False)
+    chat_write_buffer_batch_size = setting(env.int, 'CHAT_WRITE_BUFFER_BATCH_SIZE', 100)
+    chat_write_buffer_flush_ms = setting(env.int, 'CHAT_WRITE_BUFFER_FLUSH_MS', 50)
+    chat_write_buffer_max_size = setting(env.int, 'CHAT_WRITE_BUFFER_MAX_SIZE', 10000)
+    chat_write_buffer_durable = setting(env.bool, 'CHAT_WRITE_BUFFER_DURABLE', True)
+    chat_backup_batch_size = setting(env.int, 'CHAT_BACKUP_BATCH_SIZE', 1000)
+    chat_backup_on_conflict = setting(env.str, 'CHAT_BACKUP_ON_CONFLICT', 'ignore')
+
+    cache_uri = setting(env.str, 'CACHE_URI')
+    rate_limit_backend = setting(env.str, 'RATE_LIMIT_BACKEND', 'redis')
+    rate_limit_algorithm = setting(env.str, 'RATE_LIMIT_ALGORITHM', 'token_bucket')
+    rate_limit_batch_size = setting(env.int, 'RATE_LIMIT_BATCH_SIZE', 5)
+    rate_limit_local_keys = setting(env.int, 'RATE_LIMIT_LOCAL_KEYS', 10000)
+    broker_url = setting(env.str, 'BROKER_URL')
+
+    notification_backend = setting(env.str, 'NOTIFICATION_BACKEND', 'memory')
+    notification_channel_mode = setting(env.str, 'NOTIFICATION_CHANNEL_MODE', 'sharded')
+    notification_channel_shards = setting(env.int, 'NOTIFICATION_CHANNEL_SHARDS', 16)
+    notification_unread_count_ttl_seconds = setting(env.int, 'NOTIFICATION_UNREAD_COUNT_TTL_SECONDS', 60)
+
+    jwt_secret = setting(env.str, 'JWT_SECRET')
+    jwt_algorithm = setting(env.str, 'JWT_ALGORITHM')
+    jwt_expiration_seconds = setting(env.int, 'JWT_EXPIRATION_SECONDS')
+    jwt_refresh_expiration_seconds = setting(env.int, 'JWT_REFRESH_EXPIRATION_SECONDS')
+    jwt_cache_size = setting(env.int, 'JWT_CACHE_SIZE', 10000)
+    jwt_cache_ttl_seconds = setting(env.int, 'JWT_CACHE_TTL_SECONDS', 300)
+
+    social_http_timeout_seconds = setting(env.float, 'SOCIAL_HTTP_TIMEOUT_SECONDS', 10)
+    social_http_retries = setting(env.int, 'SOCIAL_HTTP_RETRIES', 2)
+
+    google_client_secret = setting(env.str, 'GOOGLE_CLIENT_SECRET')
+    google_client_id = setting(env.str, 'GOOGLE_CLIENT_ID')
+    google_redirect_uri = setting(env.str, 'GOOGLE_REDIRECT_URI')
+
+    facebook_client_secret = setting(env.str, 'FACEBOOK_CLIENT_SECRET')
+    facebook_client_id = setting(env.str, 'FACEBOOK_CLIENT_ID')
+    facebook_redirect_uri = setting(env.str, 'FACEBOOK_REDIRECT_URI')
+
+    bcrypt_rounds = setting(env.int, 'BCRYPT_ROUNDS', 12)
+    password_hash_concurrency = setting(env.int, 'PASSWORD_HASH_CONCURRENCY', 4)
+
+    mail_username = setting(env.str, 'MAIL_USERNAME')
+    mail_password = setting(env.str, 'MAIL_PASSWORD')
+    mail_from = setting(env.str, 'MAIL_FROM')
+    mail_port = setting(env.int, 'MAIL_PORT')
+    mail_server = setting(env.str, 'MAIL_SERVER')
+    mail_suppress_send = setting(env.int, 'MAIL_SUPPRESS_SEND', 0)
+    mail_batch_size = setting(env.int, 'MAIL_BATCH_SIZE', 20)
+    mail_max_retries = setting(env.int, 'MAIL_MAX_RETRIES', 3)
+
+    profile_cache_enabled = setting(env.bool, 'PROFILE_CACHE_ENABLED', True)
+    profile_cache_ttl_seconds = setting(env.int, 'PROFILE_CACHE_TTL_SECONDS', 300)
+    profile_prefix_index_enabled = setting(env.bool, 'PROFILE_PREFIX_INDEX_ENABLED', False)
+    profile_prefix_index_rebuild_seconds = setting(env.float, 'PROFILE_PREFIX_INDEX_REBUILD_SECONDS', 300)
+    profile_search_cache_size = setting(env.int, 'PROFILE_SEARCH_CACHE_SIZE', 1000)
+    profile_search_cache_ttl_seconds = setting(env.int, 'PROFILE_SEARCH_CACHE_TTL_SECONDS', 30)
+
+    activation_token_duration = setting(env.int, 'ACTIVATION_TOKEN_DURATION')
+    reset_password_token_duration = setting(env.int, 'RESET_PASSWORD_TOKEN_DURATION')
+
+    def validate(self):
+        """Parse every setting, raising an `EnvError` which lists the missing or invalid ones."""
+        errors = []
+        for name, value in vars(type(self)).items():
+            if isinstance(value, setting):
+                try:
+                    getattr(self, name)
+                except EnvError as e:
+                    errors.append(str(e))
+        if errors:
+            raise EnvError('Invalid settings: ' + '; '.join(errors))
 
-email_conf = ConnectionConfig(
-    MAIL_USERNAME=env.str('MAIL_USERNAME'),
-    MAIL_PASSWORD=env.str('MAIL_PASSWORD'),
-    MAIL_FROM=env.str('MAIL_FROM'),
-    MAIL_PORT=env.int('MAIL_PORT'),
-    MAIL_SERVER=env.str('MAIL_SERVER'),
-    TEMPLATE_FOLDER=Path(__file__).parent / 'templates',
-)
 
 cfg = Settings()
+
+
+@lru_cache()
+def get_email_conf() -> ConnectionConfig:
+    return ConnectionConfig(
+        MAIL_USERNAME=cfg.mail_username,
+        MAIL_PASSWORD=cfg.mail_password,
+        MAIL_FROM=cfg.mail_from,
+        MAIL_PORT=cfg.mail_port,
+        MAIL_SERVER=cfg.mail_server,
+        TEMPLATE_FOLDER=Path(__file__).parent / 'templates',
+        SUPPRESS_SEND=cfg.mail_suppress_send,
+    )
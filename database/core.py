@@ -1,37 +1,279 @@
-from databases import Database
+import asyncio
+import logging
+import threading
+import time
+from typing import Callable, Dict, Optional
+
+from asyncpg.pool import Pool
+from databases import Database, DatabaseURL
 from motor import motor_asyncio
-from pymongo import MongoClient
-from sqlalchemy import create_engine
+from pymongo import monitoring
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker
 
+from common.metrics import metrics
 from config import cfg
 
+logger = logging.getLogger(__name__)
+
 # SQLAlchemy Metadata instance
 Base = declarative_base()
 
+
+class PoolMetrics:
+    """Checkout statistics of the PostgreSQL connection pool.
+
+    Attributes:
+        checkouts (int): Number of acquired connections.
+        in_use (int): Number of connections currently checked out.
+        waiting (int): Number of callers waiting for a free connection.
+        timeouts (int): Number of checkouts which gave up after the acquire timeout.
+        total_wait (float): Cumulated checkout wait, in seconds.
+        max_wait (float): Longest checkout wait, in seconds.
+    """
+
+    def __init__(self):
+        self.checkouts = 0
+        self.in_use = 0
+        self.waiting = 0
+        self.timeouts = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+
+    def observe(self, wait: float):
+        self.checkouts += 1
+        self.in_use += 1
+        self.total_wait += wait
+        self.max_wait = max(self.max_wait, wait)
+
+    def snapshot(self) -> dict:
+        return {
+            'checkouts': self.checkouts,
+            'in_use': self.in_use,
+            'waiting': self.waiting,
+            'timeouts': self.timeouts,
+            'avg_wait': self.total_wait / self.checkouts if self.checkouts else 0.0,
+            'max_wait': self.max_wait,
+        }
+
+
+class _InstrumentedPool:
+    """asyncpg pool proxy recording checkouts and bounding them with a timeout."""
+
+    def __init__(self, pool, metrics: PoolMetrics, acquire_timeout: float):
+        self._pool = pool
+        self._metrics = metrics
+        self._acquire_timeout = acquire_timeout
+
+    async def acquire(self):
+        started = time.perf_counter()
+        self._metrics.waiting += 1
+        try:
+            connection = await self._pool.acquire(timeout=self._acquire_timeout)
+        except asyncio.TimeoutError:
+            self._metrics.timeouts += 1
+            raise
+        finally:
+            self._metrics.waiting -= 1
+        self._metrics.observe(time.perf_counter() - started)
+        return connection
+
+    async def release(self, connection):
+        self._metrics.in_use -= 1
+        return await self._pool.release(connection)
+
+    def __getattr__(self, name):
+        return getattr(self._pool, name)
+
+
+class PooledDatabase(Database):
+    """Database whose asyncpg pool is warmed up on connect and instrumented.
+
+    This is the single PostgreSQL access layer of the application, the API and
+    the background tasks alike.
+
+    Attributes:
+        acquire_timeout (float): Max time to wait for a free connection, in seconds.
+        pool_metrics (PoolMetrics): Checkout statistics of the pool.
+    """
+
+    def __init__(self, url: Callable[[], str], acquire_timeout: float, **options):
+        # the url is only resolved on connect, so that importing the module doesn't require the setting
+        super().__init__('postgresql://', **options)
+        self._url_factory = url
+        self.min_size = options.get('min_size', 1)
+        self.acquire_timeout = acquire_timeout
+        self.pool_metrics = PoolMetrics()
+
+    async def connect(self):
+        if self.is_connected:
+            return
+        self.url = DatabaseURL(self._url_factory())
+        self._backend = type(self._backend)(self.url, **self.options)
+        await super().connect()
+        # `_pool` is private to the postgres backend of `databases`, so it's checked before use
+        pool = getattr(self._backend, '_pool', None)
+        if not isinstance(pool, Pool):
+            logger.warning('No asyncpg pool found on the %s backend, it is neither warmed up nor instrumented',
+                           type(self._backend).__name__)
+            return
+        # asyncpg opens `min_size` connections eagerly; check them all before serving requests
+        connections = await asyncio.gather(*(pool.acquire() for _ in range(self.min_size)))
+        try:
+            await asyncio.gather(*(connection.fetchval('SELECT 1') for connection in connections))
+        finally:
+            await asyncio.gather(*(pool.release(connection) for connection in connections))
+        self._backend._pool = _InstrumentedPool(pool, self.pool_metrics, self.acquire_timeout)
+
+    def pool_size(self) -> dict:
+        pool = getattr(self._backend, '_pool', None)
+        if pool is None:
+            return {'size': 0, 'idle': 0}
+        return {'size': pool.get_size(), 'idle': pool.get_idle_size()}
+
+
 # Database instance
-db = Database(f"postgresql://{cfg.postgres_uri}",
-              min_size=1,
-              max_size=5)
+db = PooledDatabase(lambda: f"postgresql://{cfg.postgres_uri}",
+                    acquire_timeout=cfg.postgres_pool_acquire_timeout_seconds,
+                    min_size=cfg.postgres_pool_min_size,
+                    max_size=cfg.postgres_pool_max_size,
+                    statement_cache_size=cfg.postgres_statement_cache_size,
+                    max_inactive_connection_lifetime=cfg.postgres_pool_max_inactive_seconds)
+metrics.register('postgres_pool', lambda: dict(db.pool_metrics.snapshot(), **db.pool_size()))
+
+
+class MongoMetrics(monitoring.CommandListener, monitoring.ConnectionPoolListener):
+    """Command latency and connection pool statistics of the MongoDB client.
+
+    Events are published from the driver threads, so counters are updated under a lock.
+
+    Attributes:
+        commands (dict): Per command name, number of calls, failures, total and max duration in seconds.
+        connections (int): Number of open connections.
+        checked_out (int): Number of connections currently checked out.
+        checkout_failures (int): Number of checkouts which failed, e.g. on `waitQueueTimeoutMS`.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.commands: Dict[str, dict] = {}
+        self.connections = 0
+        self.checked_out = 0
+        self.checkout_failures = 0
+
+    def _observe(self, event, failed: bool):
+        duration = event.duration_micros / 1e6
+        with self._lock:
+            stats = self.commands.setdefault(
+                event.command_name, {'calls': 0, 'failures': 0, 'total': 0.0, 'max': 0.0})
+            stats['calls'] += 1
+            stats['failures'] += failed
+            stats['total'] += duration
+            stats['max'] = max(stats['max'], duration)
+
+    def _count(self, name: str, delta: int):
+        with self._lock:
+            setattr(self, name, getattr(self, name) + delta)
+
+    def started(self, event):
+        pass
+
+    def succeeded(self, event):
+        self._observe(event, failed=False)
+
+    def failed(self, event):
+        self._observe(event, failed=True)
+
+    def pool_created(self, event):
+        pass
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_cleared(self, event):
+        pass
+
+    def pool_closed(self, event):
+        pass
+
+    def connection_created(self, event):
+        self._count('connections', 1)
+
+    def connection_ready(self, event):
+        pass
+
+    def connection_closed(self, event):
+        self._count('connections', -1)
+
+    def connection_check_out_started(self, event):
+        pass
+
+    def connection_check_out_failed(self, event):
+        self._count('checkout_failures', 1)
+
+    def connection_checked_out(self, event):
+        self._count('checked_out', 1)
+
+    def connection_checked_in(self, event):
+        self._count('checked_out', -1)
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                'connections': self.connections,
+                'checked_out': self.checked_out,
+                'checkout_failures': self.checkout_failures,
+                'commands': {name: dict(stats, avg=stats['total'] / stats['calls'])
+                             for name, stats in self.commands.items()},
+            }
+
+
+class MongoClientManager:
+    """The MongoDB client of the process, created on startup and closed on shutdown.
+
+    Attributes:
+        client (AsyncIOMotorClient): The client, None until `connect` is called.
+        metrics (MongoMetrics): Command latency and connection pool statistics.
+    """
+
+    def __init__(self):
+        self.client: Optional[motor_asyncio.AsyncIOMotorClient] = None
+        self.metrics = MongoMetrics()
+
+    def connect(self):
+        if self.client is not None:
+            return
+        write_concern = cfg.mongo_write_concern
+        self.client = motor_asyncio.AsyncIOMotorClient(
+            cfg.mongo_db_uri,
+            username=cfg.mongo_db_username,
+            password=cfg.mongo_db_password,
+            minPoolSize=cfg.mongo_min_pool_size,
+            maxPoolSize=cfg.mongo_max_pool_size,
+            waitQueueTimeoutMS=cfg.mongo_wait_queue_timeout_ms,
+            readPreference=cfg.mongo_read_preference,
+            w=int(write_concern) if write_concern.isdigit() else write_concern,
+            event_listeners=[self.metrics])
 
-engine = create_engine(f"postgresql://{cfg.postgres_uri}")
-Session = sessionmaker(bind=engine)
-session = Session()
+    def close(self):
+        if self.client is not None:
+            self.client.close()
+            self.client = None
 
-mongo_client_async = motor_asyncio.AsyncIOMotorClient(cfg.mongo_db_uri,
-                                                      username=cfg.mongo_db_username,
-                                                      password=cfg.mongo_db_password)
+    @property
+    def db(self) -> motor_asyncio.AsyncIOMotorDatabase:
+        if self.client is None:
+            raise RuntimeError('MongoDB client is not connected')
+        return self.client[cfg.mongo_db_name]
 
-mongo_client = MongoClient(cfg.mongo_db_uri,
-                           username=cfg.mongo_db_username,
-                           password=cfg.mongo_db_password)
+    @property
+    def messages(self) -> motor_asyncio.AsyncIOMotorCollection:
+        return self.db.get_collection(cfg.mongo_db_messages_collection)
 
-mongo_db = mongo_client[cfg.mongo_db_name]
-mongo_db_async = mongo_client_async[cfg.mongo_db_name]
+    @property
+    def chats(self) -> motor_asyncio.AsyncIOMotorCollection:
+        return self.db.get_collection(cfg.mongo_db_chats_collection)
 
-mongo_db_messages_collection = mongo_db.get_collection(cfg.mongo_db_messages_collection)
-mongo_db_chats_collection = mongo_db.get_collection(cfg.mongo_db_chats_collection)
 
-async_mongo_db_messages_collection = mongo_db_async.get_collection(cfg.mongo_db_messages_collection)
-async_mongo_db_chats_collection = mongo_db_async.get_collection(cfg.mongo_db_chats_collection)
+# MongoDB client manager
+mongo = MongoClientManager()
+metrics.register('mongo', mongo.metrics.snapshot)
@@ -0,0 +1,108 @@
+"""MongoDB indexes registry.
+
+Indexes of each collection are declared here and created idempotently on startup
+(see `cfg.mongo_ensure_indexes`) or from the command line:
+
+    python -m database.indexes apply
+    python -m database.indexes check
+"""
+import asyncio
+import json
+import sys
+from typing import Dict, List, Tuple
+
+from bson import ObjectId
+from pymongo import ASCENDING, DESCENDING, IndexModel
+
+from database.core import mongo
+
+# Indexes declared per collection, by its `mongo` attribute
+INDEXES: Dict[str, List[IndexModel]] = {
+    'messages': [
+        # chat history, keyset pagination
+        IndexModel([('chatId', ASCENDING), ('createdAt', ASCENDING), ('_id', ASCENDING)]),
+        # backup task, holds only messages which are not copied to PostgreSQL yet
+        IndexModel([('isBackupCreated', ASCENDING), ('_id', ASCENDING)],
+                   partialFilterExpression={'isBackupCreated': False}),
+    ],
+    'chats': [
+        IndexModel([('chatId', ASCENDING)]),
+        # chats list, most recently active first
+        IndexModel([('interlocutors', ASCENDING), ('lastActivityAt', DESCENDING)]),
+    ],
+}
+
+# Representative queries of each collection, expected to be served by an index
+PROBE_QUERIES: Dict[str, List[Tuple[dict, list]]] = {
+    'messages': [
+        ({'chatId': ''}, [('createdAt', DESCENDING), ('_id', DESCENDING)]),
+        ({'isBackupCreated': False, '_id': {'$gt': ObjectId('0' * 24)}}, [('_id', ASCENDING)]),
+    ],
+    'chats': [
+        ({'chatId': ''}, []),
+        ({'interlocutors': ''}, [('lastActivityAt', DESCENDING)]),
+    ],
+}
+
+
+async def apply_indexes() -> Dict[str, List[str]]:
+    """Create missing indexes; existing ones with the same definition are left untouched.
+    Return the names of the declared indexes, per collection."""
+    return {getattr(mongo, name).name: await getattr(mongo, name).create_indexes(indexes)
+            for name, indexes in INDEXES.items()}
+
+
+def _plan_stages(plan: dict) -> List[str]:
+    stages = [plan.get('stage')]
+    for key in ('inputStage', 'queryPlan'):
+        if key in plan:
+            stages += _plan_stages(plan[key])
+    for child in plan.get('inputStages', []):
+        stages += _plan_stages(child)
+    return stages
+
+
+async def check_indexes() -> Dict[str, dict]:
+    """Report, per collection, declared indexes which don't exist, existing indexes which
+    are not declared or were never used since the server start, and probe queries
+    which fall back to a collection scan."""
+    report = {}
+    for name, indexes in INDEXES.items():
+        collection = getattr(mongo, name)
+        declared = {index.document['name'] for index in indexes}
+        existing = set(await collection.index_information()) - {'_id_'}
+        usage = {stats['name']: stats['accesses']['ops']
+                 async for stats in collection.aggregate([{'$indexStats': {}}])}
+        collscans = []
+        for query_filter, sort in PROBE_QUERIES.get(name, []):
+            cursor = collection.find(query_filter)
+            if sort:
+                cursor = cursor.sort(sort)
+            plan = await cursor.explain()
+            if 'COLLSCAN' in _plan_stages(plan['queryPlanner']['winningPlan']):
+                collscans.append({'filter': str(query_filter), 'sort': str(sort)})
+        report[collection.name] = {
+            'missing': sorted(declared - existing),
+            'undeclared': sorted(existing - declared),
+            'unused': sorted(name for name in existing if usage.get(name) == 0),
+            'collscans': collscans,
+        }
+    return report
+
+
+async def _run(command):
+    mongo.connect()
+    try:
+        return await command()
+    finally:
+        mongo.close()
+
+
+if __name__ == '__main__':
+    match sys.argv[1:]:
+        case ['apply']:
+            print(json.dumps(asyncio.run(_run(apply_indexes)), indent=2))
+        case ['check']:
+            print(json.dumps(asyncio.run(_run(check_indexes)), indent=2))
+        case _:
+            sys.exit('Usage: python -m database.indexes apply|check')
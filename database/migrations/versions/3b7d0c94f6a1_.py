@@ -0,0 +1,23 @@
+"""empty message
+
+Revision ID: 3b7d0c94f6a1
+Revises: e81b47f05c3a
+Create Date: 2026-10-18 13:02:41.518204
+
+"""
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = '3b7d0c94f6a1'
+down_revision = 'e81b47f05c3a'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index('ix_notification_user_username_read_created_at', 'notification',
+                    ['user_username', 'read', 'created_at'])
+
+
+def downgrade():
+    op.drop_index('ix_notification_user_username_read_created_at', table_name='notification')
@@ -0,0 +1,25 @@
+"""empty message
+
+Revision ID: 5c1e0a7d2b94
+Revises: 9201cbe9ced7
+Create Date: 2026-10-18 10:12:31.418204
+
+"""
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = '5c1e0a7d2b94'
+down_revision = '9201cbe9ced7'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # drop duplicated backups left by the previous backup task before adding the constraint
+    op.execute('DELETE FROM chat_message a USING chat_message b '
+               'WHERE a.ctid < b.ctid AND a.mongo_id = b.mongo_id')
+    op.create_unique_constraint('chat_message_mongo_id_key', 'chat_message', ['mongo_id'])
+
+
+def downgrade():
+    op.drop_constraint('chat_message_mongo_id_key', 'chat_message', type_='unique')
@@ -0,0 +1,23 @@
+"""empty message
+
+Revision ID: a3f9d62c8e17
+Revises: 5c1e0a7d2b94
+Create Date: 2026-10-18 11:02:47.903126
+
+"""
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = 'a3f9d62c8e17'
+down_revision = '5c1e0a7d2b94'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    op.execute('CREATE INDEX ix_users_username_trgm ON users USING gin (username gin_trgm_ops)')
+
+
+def downgrade():
+    op.drop_index('ix_users_username_trgm', table_name='users')
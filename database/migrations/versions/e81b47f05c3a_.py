@@ -0,0 +1,28 @@
+"""empty message
+
+Revision ID: e81b47f05c3a
+Revises: a3f9d62c8e17
+Create Date: 2026-10-18 11:48:15.260733
+
+"""
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = 'e81b47f05c3a'
+down_revision = 'a3f9d62c8e17'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # drop duplicated requests before adding the constraint
+    op.execute('DELETE FROM friendship_request a USING friendship_request b '
+               'WHERE a.ctid < b.ctid AND a.from_user = b.from_user AND a.to_user = b.to_user')
+    op.create_unique_constraint('friendship_request_from_user_to_user_key', 'friendship_request',
+                                ['from_user', 'to_user'])
+    op.create_index('ix_friendship_request_to_user', 'friendship_request', ['to_user'])
+
+
+def downgrade():
+    op.drop_index('ix_friendship_request_to_user', table_name='friendship_request')
+    op.drop_constraint('friendship_request_from_user_to_user_key', 'friendship_request', type_='unique')
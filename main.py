@@ -1,24 +1,29 @@
-import redis.asyncio as redis
 import uvicorn
 from fastapi import APIRouter, WebSocket
 from fastapi import FastAPI
 from fastapi.encoders import jsonable_encoder
-from fastapi_limiter import FastAPILimiter
 from fastapi_pagination import add_pagination
-from motor.motor_asyncio import AsyncIOMotorClient
 from starlette.middleware.cors import CORSMiddleware
 from starlette.requests import Request
 from starlette.responses import JSONResponse
 from starlette.websockets import WebSocketDisconnect
 
 from auth.api import auth_router
+from auth.cache import RequestMemoMiddleware
+from auth.mail import mail_queue
 from chat.api import chat_router
+from chat.buffer import message_buffer
 from common.exceptions import HTTPExceptionJSON
+from common.metrics import metrics
+from common.responses import check_renderer
+from common.services import services
 from config import cfg
-from database.core import db
+from database.core import db, mongo
+from database.indexes import apply_indexes
 from notification.api import notification_router
 from notification.manager import notifier
 from profile.api import profiles_router
+from profile.index import profile_index
 
 # Init FastAPI app
 app = FastAPI(debug=cfg.debug)
@@ -33,6 +38,9 @@ if not cfg.debug:
         allow_headers=["*"],
     )
 
+# Per-request memo of profile lookups
+app.add_middleware(RequestMemoMiddleware)
+
 # Add routers
 api_router = APIRouter(prefix="/api")
 api_router.include_router(auth_router, tags=["Auth"])
@@ -43,12 +51,13 @@ app.include_router(api_router)
 
 @app.websocket("/ws")
 async def websocket_endpoint(websocket: WebSocket):
-    await notifier.connect(websocket)
+    if not await notifier.connect(websocket):
+        return
     try:
         while True:
             await websocket.receive_text()
     except WebSocketDisconnect:
-        notifier.remove(websocket)
+        await notifier.remove(websocket)
 
 
 # Add exception handlers
@@ -66,21 +75,40 @@ async def http_exception_handler(
 # Startup event handler
 @app.on_event("startup")
 async def startup():
-    # Connect FastAPILimiter
-    _redis = redis.from_url(cfg.cache_uri, encoding="utf-8", decode_responses=True)
-    await FastAPILimiter.init(_redis)
-    # Connect to database
+    # Fail fast on missing settings, which are otherwise only read when used
+    cfg.validate()
+    check_renderer()
+    # Connect to databases
     await db.connect()
-    # Connect to MongoDB
-    app.mongodb_client = AsyncIOMotorClient(cfg.mongo_db_uri)
-    app.mongodb = app.mongodb_client[cfg.mongo_db_name]
+    mongo.connect()
+    # Build profiles typeahead index, rebuilt periodically
+    if cfg.profile_prefix_index_enabled:
+        await profile_index.start(cfg.profile_prefix_index_rebuild_seconds)
+    # Start outbound emails queue
+    await mail_queue.start()
+    # Start notifications fan-out
+    await notifier.start()
+    # Create MongoDB indexes
+    if cfg.mongo_ensure_indexes:
+        await apply_indexes()
+    # Start chat messages write-behind buffer
+    if cfg.chat_write_buffer_enabled:
+        await message_buffer.start()
+    # Log runtime metrics periodically
+    await metrics.start(cfg.metrics_log_interval_seconds)
 
 
 # Shutdown event handler
 @app.on_event("shutdown")
 async def shutdown():
+    await metrics.stop()
+    await message_buffer.stop()
+    await profile_index.stop()
+    await mail_queue.stop()
+    await notifier.stop()
     await db.disconnect()
-    app.mongodb_client.close()
+    mongo.close()
+    await services.aclose()
 
 add_pagination(app)
 
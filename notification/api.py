@@ -1,3 +1,4 @@
+import datetime as dt
 from typing import List, Optional
 
 from fastapi import Query, Depends
@@ -5,10 +6,10 @@ from fastapi_pagination import LimitOffsetPage
 from fastapi_utils.cbv import cbv
 from fastapi_utils.inferring_router import InferringRouter
 
-from auth.models import User
-from auth.security import get_user
+from auth.security import get_user, Principal
 from common.rate_limiter import RateLimitTo
-from notification.schemas import NotificationRead
+from common.responses import render
+from notification.schemas import NotificationRead, UnreadCount, MarkedNotifications
 from notification.service import NotificationService
 
 notification_router = InferringRouter()
@@ -30,9 +31,9 @@ class NotificationApi:
     async def get_notifications(
             self,
             is_read: Optional[bool] = Query(None),
-            user: User = Depends(get_user)):
+            user: Principal = Depends(get_user)):
         """Get notifications for a specific profile."""
-        return await self._service.get_notifications(user.username, is_read)
+        return render(LimitOffsetPage[NotificationRead], await self._service.get_notifications(user.username, is_read))
 
     @notification_router.patch(
         "/notifications",
@@ -42,6 +43,26 @@ class NotificationApi:
             self,
             notification_ids: List[int],
             is_read: Optional[bool] = Query(None),
-            user: User = Depends(get_user)):
+            user: Principal = Depends(get_user)):
         """Mark specified notifications as read."""
-        return await self._service.mark_notifications_as(notification_ids, is_read)
+        return await self._service.mark_notifications_as(user.username, notification_ids, is_read)
+
+    @notification_router.get(
+        "/notifications/unread_count",
+        response_model=UnreadCount,
+        dependencies=[Depends(RateLimitTo(times=5, seconds=1))])
+    async def get_unread_count(self, user: Principal = Depends(get_user)):
+        """Get the number of unread notifications, for badges."""
+        return UnreadCount(count=await self._service.get_unread_count(user.username))
+
+    @notification_router.post(
+        "/notifications/read",
+        response_model=MarkedNotifications,
+        dependencies=[Depends(RateLimitTo(times=5, seconds=1))])
+    async def mark_all_notifications_as_read(
+            self,
+            up_to_id: Optional[int] = Query(None),
+            up_to: Optional[dt.datetime] = Query(None),
+            user: Principal = Depends(get_user)):
+        """Mark all unread notifications as read, optionally only up to an id or a creation time."""
+        return MarkedNotifications(marked=await self._service.mark_all_as_read(user.username, up_to_id, up_to))
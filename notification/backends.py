@@ -0,0 +1,196 @@
+import asyncio
+import json
+import logging
+import time
+import zlib
+from typing import Awaitable, Callable, Iterable, Optional, Tuple
+
+import redis.asyncio as redis
+
+from config import cfg
+
+logger = logging.getLogger(__name__)
+
+Deliver = Callable[[str, str], Awaitable[None]]
+
+
+class DeliveryMetrics:
+    """Counters of a fan-out backend.
+
+    Attributes:
+        published (int): Messages handed over to the backend by this worker.
+        delivered (int): Messages received by this worker for its locally connected users.
+        last_lag (float): Seconds between publishing and receiving the last delivered message.
+        max_lag (float): Worst observed delivery lag, in seconds.
+    """
+
+    def __init__(self):
+        self.published = 0
+        self.delivered = 0
+        self.last_lag = 0.0
+        self.max_lag = 0.0
+        self._total_lag = 0.0
+
+    def observe(self, published_at: float):
+        lag = max(time.time() - published_at, 0.0)
+        self.delivered += 1
+        self.last_lag = lag
+        self.max_lag = max(self.max_lag, lag)
+        self._total_lag += lag
+
+    def snapshot(self) -> dict:
+        return {
+            'published': self.published,
+            'delivered': self.delivered,
+            'last_lag': self.last_lag,
+            'max_lag': self.max_lag,
+            'avg_lag': self._total_lag / self.delivered if self.delivered else 0.0,
+        }
+
+
+class NotificationBackend:
+    """Base fan-out backend.
+
+    A backend carries a message published for a username to every worker, where it is
+    passed to `deliver` which sends it to the user's locally connected sockets.
+    """
+
+    def __init__(self):
+        self.metrics = DeliveryMetrics()
+        self._deliver: Optional[Deliver] = None
+
+    async def start(self, deliver: Deliver):
+        self._deliver = deliver
+
+    async def stop(self):
+        pass
+
+    async def subscribe(self, username: str):
+        """Called when the first socket of a user connects to this worker."""
+
+    async def unsubscribe(self, username: str):
+        """Called when the last socket of a user disconnects from this worker."""
+
+    async def publish(self, username: str, message: str):
+        await self.publish_many([(username, message)])
+
+    async def publish_many(self, messages: Iterable[Tuple[str, str]]):
+        raise NotImplementedError
+
+
+class InMemoryBackend(NotificationBackend):
+    """Delivers messages within the current process only."""
+
+    async def publish_many(self, messages: Iterable[Tuple[str, str]]):
+        for username, message in messages:
+            self.metrics.published += 1
+            self.metrics.observe(time.time())
+            await self._deliver(username, message)
+
+
+class RedisBackend(NotificationBackend):
+    """Redis pub/sub backend, delivering messages to every worker.
+
+    With `per_user` channels a worker subscribes only to the users connected to it;
+    with `sharded` channels usernames are hashed into a fixed number of channels
+    and every worker subscribes to all of them once, on start. When the connection
+    is lost, the listener reconnects and subscribes again to the same channels,
+    waiting `reconnect_backoff` seconds after the first failure, doubled on each
+    next one up to `max_reconnect_backoff`.
+    """
+
+    def __init__(self, url: str, channel_mode: str = 'sharded', shards: int = 16, prefix: str = 'notifications',
+                 reconnect_backoff: float = 0.5, max_reconnect_backoff: float = 30.0):
+        super().__init__()
+        if channel_mode not in ('sharded', 'per_user'):
+            raise ValueError(f'Unknown notification channel mode: {channel_mode}')
+        self.url = url
+        self.channel_mode = channel_mode
+        self.shards = shards
+        self.prefix = prefix
+        self.reconnect_backoff = reconnect_backoff
+        self.max_reconnect_backoff = max_reconnect_backoff
+        self._redis = None
+        self._pubsub = None
+        self._listener = None
+
+    def channel_for(self, username: str) -> str:
+        if self.channel_mode == 'per_user':
+            return f'{self.prefix}:user:{username}'
+        return f'{self.prefix}:shard:{zlib.crc32(username.encode()) % self.shards}'
+
+    async def start(self, deliver: Deliver):
+        await super().start(deliver)
+        self._redis = redis.from_url(self.url, encoding="utf-8", decode_responses=True)
+        self._pubsub = self._redis.pubsub(ignore_subscribe_messages=True)
+        if self.channel_mode == 'sharded':
+            await self._pubsub.subscribe(*(f'{self.prefix}:shard:{shard}' for shard in range(self.shards)))
+        self._listener = asyncio.create_task(self._listen())
+
+    async def stop(self):
+        if self._listener:
+            self._listener.cancel()
+            try:
+                await self._listener
+            except asyncio.CancelledError:
+                pass
+        if self._pubsub:
+            await self._pubsub.close()
+        if self._redis:
+            await self._redis.close()
+
+    async def subscribe(self, username: str):
+        if self.channel_mode == 'per_user':
+            await self._pubsub.subscribe(self.channel_for(username))
+
+    async def unsubscribe(self, username: str):
+        if self.channel_mode == 'per_user':
+            await self._pubsub.unsubscribe(self.channel_for(username))
+
+    async def publish_many(self, messages: Iterable[Tuple[str, str]]):
+        async with self._redis.pipeline(transaction=False) as pipe:
+            for username, message in messages:
+                pipe.publish(self.channel_for(username),
+                             json.dumps({'user': username, 'message': message, 'ts': time.time()}))
+                self.metrics.published += 1
+            await pipe.execute()
+
+    async def _listen(self):
+        failures = 0
+        while True:
+            try:
+                await self._receive()
+                failures = 0
+            except Exception:
+                delay = min(self.reconnect_backoff * 2 ** failures, self.max_reconnect_backoff)
+                failures += 1
+                logger.exception('Notifications subscription failed, reconnecting in %.1fs', delay)
+                # the pubsub reconnects on the next read, subscribing again to its channels
+                await asyncio.sleep(delay)
+
+    async def _receive(self):
+        if not self._pubsub.subscribed:
+            # per-user mode before anyone has connected to this worker
+            await asyncio.sleep(0.1)
+            return
+        event = await self._pubsub.get_message(timeout=1.0)
+        if event is None or event['type'] != 'message':
+            return
+        try:
+            payload = json.loads(event['data'])
+            self.metrics.observe(payload['ts'])
+            await self._deliver(payload['user'], payload['message'])
+        except Exception:
+            logger.exception('Unable to deliver notification %r', event['data'])
+
+
+def create_backend() -> NotificationBackend:
+    match cfg.notification_backend:
+        case 'memory':
+            return InMemoryBackend()
+        case 'redis':
+            return RedisBackend(cfg.cache_uri,
+                                channel_mode=cfg.notification_channel_mode,
+                                shards=cfg.notification_channel_shards)
+        case _:
+            raise ValueError(f'Unknown notification backend: {cfg.notification_backend}')
@@ -0,0 +1,56 @@
+import logging
+from typing import Awaitable, Callable
+
+import redis.asyncio as redis
+
+from common.services import services
+from config import cfg
+
+logger = logging.getLogger(__name__)
+
+
+class UnreadCountCache:
+    """Read-through Redis cache of unread notifications counts, shared by all workers.
+
+    Counts are dropped whenever notifications of the user are created or marked,
+    the TTL only bounds the staleness caused by writes which bypass the invalidation.
+
+    Attributes:
+        ttl (int): Lifetime of a cached count, in seconds.
+    """
+
+    def __init__(self, ttl: int):
+        self.ttl = ttl
+
+    @property
+    def _redis(self) -> redis.Redis:
+        return services.redis
+
+    @staticmethod
+    def _key(username: str) -> str:
+        return f'notifications:unread:{username}'
+
+    async def get(self, username: str, loader: Callable[[], Awaitable[int]]) -> int:
+        try:
+            cached = await self._redis.get(self._key(username))
+            if cached is not None:
+                return int(cached)
+        except redis.RedisError:
+            logger.exception('Unable to read unread notifications count from cache')
+        count = await loader()
+        try:
+            await self._redis.set(self._key(username), count, ex=self.ttl)
+        except redis.RedisError:
+            logger.exception('Unable to write unread notifications count to cache')
+        return count
+
+    async def invalidate(self, *usernames: str):
+        if not usernames:
+            return
+        try:
+            await self._redis.delete(*(self._key(username) for username in usernames))
+        except redis.RedisError:
+            logger.exception('Unable to invalidate unread notifications counts')
+
+
+unread_count_cache = UnreadCountCache(ttl=cfg.notification_unread_count_ttl_seconds)
@@ -1,35 +1,85 @@
-from typing import List
+from typing import Dict, Iterable, Optional, Set, Tuple
 
+import jwt
 from fastapi import WebSocket
-from jwt import InvalidSignatureError
+from starlette import status
 
 from auth.security import extract_user_from_token
+from common.metrics import metrics
+from notification.backends import NotificationBackend, create_backend
 
 
 class ConnectionManager:
-    def __init__(self):
-        self.connections: List[WebSocket] = []
+    """Registry of active websocket connections.
 
-    def get_client_username(self, websocket: WebSocket):
+    Client's username is resolved from the token once, on connect, and sockets are
+    indexed by it, so sending a message touches only the recipient's own sockets.
+    Messages are fanned out to all workers through the notification backend, each
+    worker delivering them to the users connected to it.
+
+    Attributes:
+        connections (Dict[str, Set[WebSocket]]): Open sockets of each connected user (tabs, devices).
+        backend (NotificationBackend): Fan-out backend shared by all workers.
+    """
+
+    def __init__(self, backend: NotificationBackend = None):
+        self.connections: Dict[str, Set[WebSocket]] = {}
+        self._usernames: Dict[WebSocket, str] = {}
+        self.backend = backend or create_backend()
+
+    async def start(self):
+        await self.backend.start(self.send_local)
+
+    async def stop(self):
+        await self.backend.stop()
+
+    def get_client_username(self, websocket: WebSocket) -> Optional[str]:
         token = websocket.query_params.get('token')
         try:
             user = extract_user_from_token(token)
             return user.username
-        except InvalidSignatureError:
+        except jwt.InvalidTokenError:
             return
 
-    async def connect(self, websocket: WebSocket):
+    async def connect(self, websocket: WebSocket) -> bool:
+        """Accept and register the socket; sockets without a valid token are closed."""
+        username = self.get_client_username(websocket)
+        if not username:
+            await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
+            return False
         await websocket.accept()
-        self.connections.append(websocket)
+        if username not in self.connections:
+            self.connections[username] = set()
+            await self.backend.subscribe(username)
+        self.connections[username].add(websocket)
+        self._usernames[websocket] = username
+        return True
+
+    async def remove(self, websocket: WebSocket):
+        username = self._usernames.pop(websocket, None)
+        sockets = self.connections.get(username)
+        if sockets is None:
+            return
+        sockets.discard(websocket)
+        if not sockets:
+            del self.connections[username]
+            await self.backend.unsubscribe(username)
 
     async def broadcast(self, username: str, message: str):
-        living_connections = []
-        while len(self.connections) > 0:
-            websocket = self.connections.pop()
-            if username == self.get_client_username(websocket):
+        await self.backend.publish(username, message)
+
+    async def broadcast_many(self, messages: Iterable[Tuple[str, str]]):
+        await self.backend.publish_many(messages)
+
+    async def send_local(self, username: str, message: str):
+        """Send the message to the user's sockets connected to this worker."""
+        for websocket in list(self.connections.get(username, ())):
+            try:
                 await websocket.send_text(message)
-            living_connections.append(websocket)
-        self.connections = living_connections
+            except Exception:
+                # the peer has gone away without a disconnect frame
+                await self.remove(websocket)
 
 
 notifier = ConnectionManager()
+metrics.register('notifications', lambda: notifier.backend.metrics.snapshot())
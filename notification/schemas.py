@@ -15,3 +15,11 @@ class NotificationRead(BaseSchema):
     user_username: str
     data: NotificationReadData
     read: bool
+
+
+class UnreadCount(BaseSchema):
+    count: int
+
+
+class MarkedNotifications(BaseSchema):
+    marked: int
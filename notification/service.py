@@ -1,32 +1,74 @@
+import datetime as dt
 from typing import Optional, List
 
 from fastapi_pagination.ext.databases import paginate
-from sqlalchemy import insert, select, desc, literal, update
+from sqlalchemy import insert, select, desc, literal, update, func
 
 from auth.models import notification
 from database.core import db
+from notification.cache import unread_count_cache
 from notification.models import Notification
 
 
 class NotificationService:
 
     async def create_notification(self, new_notification: Notification) -> Notification:
-        return await db.fetch_one(
+        result = await db.fetch_one(
             insert(notification)
             .values(new_notification.dict(exclude_unset=True))
             .returning(notification))
+        await unread_count_cache.invalidate(new_notification.user_username)
+        return result
 
     async def get_notifications(self, user_username: str, is_read: bool = None):
         return await paginate(db, select([notification]).where(notification.c.user_username == user_username)
                               .where(notification.c.read == is_read)
                               .order_by(desc(notification.c.created_at)))
 
+    async def get_unread_count(self, user_username: str) -> int:
+        return await unread_count_cache.get(user_username, lambda: db.fetch_val(
+            select([func.count()])
+            .where(notification.c.user_username == user_username)
+            .where(notification.c.read.is_(False))))
+
     async def mark_notifications_as(
             self,
+            user_username: str,
             notification_ids: List[int],
             is_read: Optional[bool] = None) -> List[Notification]:
-        return await db.fetch_all(
+        result = await db.fetch_all(
             update(notification)
+            .where(notification.c.user_username == user_username)
             .where(notification.c.id.in_([literal(e) for e in notification_ids]))
             .values(**(dict(read=is_read) if is_read is not None else {}))
             .returning(notification))
+        await unread_count_cache.invalidate(user_username)
+        return result
+
+    async def mark_all_as_read(
+            self,
+            user_username: str,
+            up_to_id: Optional[int] = None,
+            up_to: Optional[dt.datetime] = None) -> int:
+        """Mark unread notifications of the user as read in a single statement.
+
+        Args:
+            user_username (str): Owner of the notifications.
+            up_to_id (int): Only mark notifications with an id lower or equal to it.
+            up_to (datetime): Only mark notifications created before or at this time.
+
+        Returns:
+            Number of marked notifications.
+        """
+        query = (update(notification)
+                 .where(notification.c.user_username == user_username)
+                 .where(notification.c.read.is_(False)))
+        if up_to_id is not None:
+            query = query.where(notification.c.id <= up_to_id)
+        if up_to is not None:
+            query = query.where(notification.c.created_at <= up_to)
+        marked = query.values(read=True).returning(notification.c.id).cte('marked')
+        count = await db.fetch_val(select([func.count()]).select_from(marked))
+        if count:
+            await unread_count_cache.invalidate(user_username)
+        return count
@@ -1,16 +1,16 @@
-from fastapi import Depends, HTTPException
+from typing import List
+
+from fastapi import BackgroundTasks, Body, Depends, HTTPException
 from fastapi_pagination import LimitOffsetPage
 from fastapi_utils.cbv import cbv
 from fastapi_utils.inferring_router import InferringRouter
 from starlette import status
 
-from auth.models import User
-from auth.security import get_user
+from auth.security import get_user, Principal
 from common.rate_limiter import RateLimitTo
 from notification.manager import notifier
-from notification.models import NotificationData, Notification
-from notification.service import NotificationService
-from profile.schemas import FullProfile, IncomingFriendRequest, OutgoingFriendRequest, BaseProfile, FullProfileOut
+from profile.schemas import FullProfile, IncomingFriendRequest, OutgoingFriendRequest, BaseProfile, FullProfileOut, \
+    FriendRequestResult
 from profile.service import ProfilesService
 
 profiles_router = InferringRouter()
@@ -22,10 +22,8 @@ class ProfilesApi:
 
     Attributes:
         _service (ProfilesService): Profiles Service for handling extra work.
-        _service (NotificationService): NotificationService Service for handling extra work with notifications.
     """
     _service = ProfilesService()
-    _notifications = NotificationService()
 
     @profiles_router.get(
         "/profiles",
@@ -39,7 +37,7 @@ class ProfilesApi:
         "/profiles/{profile_username}",
         response_model=FullProfile,
         dependencies=[Depends(RateLimitTo(times=10, seconds=1))])
-    async def get_profile_by_username(self, profile_username: str, user: User = Depends(get_user)):
+    async def get_profile_by_username(self, profile_username: str, user: Principal = Depends(get_user)):
         """Get profile's data by profile id."""
         profile = await self._service.find_profile_by_username(profile_username)
         if not profile:
@@ -55,32 +53,42 @@ class ProfilesApi:
     async def create_friend_request(
             self,
             target_profile_username: str,
-            user: User = Depends(get_user)):
+            background_tasks: BackgroundTasks,
+            user: Principal = Depends(get_user)):
         """Send a friend request from one profile to another."""
         if user.username == target_profile_username:
             raise HTTPException(
                 status_code=status.HTTP_400_BAD_REQUEST,
                 detail='You cannot send request to yourself')
-        if not await self._service.find_profile_by_username(target_profile_username):
-            raise HTTPException(
-                status_code=status.HTTP_400_BAD_REQUEST,
-                detail='This user does not exist')
-        if await self._service.check_friend_request_exists(user.username, target_profile_username):
-            raise HTTPException(
-                status_code=status.HTTP_400_BAD_REQUEST,
-                detail='There already exists a pending friend request')
-        await self._service.create_friend_request(
-            from_user=user.username,
-            to_user=target_profile_username)
-        await notifier.broadcast(target_profile_username, f'New Friendship Request from {user.username}')
-        await self._notifications.create_notification(Notification(
-                user_username=target_profile_username,
-                data=NotificationData(
-                    event="New Friendship Request",
-                    from_user=user.username
-                )
-            )
-        )
+        statuses = await self._service.create_friend_requests(user.username, [target_profile_username])
+        match statuses[target_profile_username]:
+            case 'not_found':
+                raise HTTPException(
+                    status_code=status.HTTP_400_BAD_REQUEST,
+                    detail='This user does not exist')
+            case 'exists':
+                raise HTTPException(
+                    status_code=status.HTTP_400_BAD_REQUEST,
+                    detail='There already exists a pending friend request')
+        background_tasks.add_task(
+            notifier.broadcast, target_profile_username, f'New Friendship Request from {user.username}')
+
+    @profiles_router.post(
+        "/profiles/outgoing_friend_requests",
+        response_model=List[FriendRequestResult],
+        dependencies=[Depends(RateLimitTo(times=10, seconds=1))])
+    async def create_friend_requests(
+            self,
+            background_tasks: BackgroundTasks,
+            target_profile_usernames: List[str] = Body(..., max_items=100),
+            user: Principal = Depends(get_user)):
+        """Send friend requests to several profiles at once, e.g. on contacts import.
+        Returns the status of each request: `created`, `not_found`, `self` or `exists`."""
+        statuses = await self._service.create_friend_requests(user.username, target_profile_usernames)
+        background_tasks.add_task(notifier.broadcast_many, [
+            (username, f'New Friendship Request from {user.username}')
+            for username, request_status in statuses.items() if request_status == 'created'])
+        return [{'username': username, 'status': request_status} for username, request_status in statuses.items()]
 
     @profiles_router.post(
         "/profiles/friends/{requester_profile_username}",
@@ -89,7 +97,7 @@ class ProfilesApi:
     async def accept_friend_request(
             self,
             requester_profile_username: str,
-            user: User = Depends(get_user)):
+            user: Principal = Depends(get_user)):
         """Accept an incoming friend request."""
         is_added = await self._service.add_friend(
             requester_profile_username=requester_profile_username,
@@ -103,7 +111,7 @@ class ProfilesApi:
         "/profiles/incoming_friend_requests/{requester_username}",
         status_code=status.HTTP_204_NO_CONTENT,
         dependencies=[Depends(RateLimitTo(times=10, seconds=1))])
-    async def reject_incoming_friend_request(self, requester_username: str, user: User = Depends(get_user)):
+    async def reject_incoming_friend_request(self, requester_username: str, user: Principal = Depends(get_user)):
         """Reject an incoming friend request."""
         return await self._service.delete_friend_request(
             from_user=requester_username,
@@ -113,7 +121,7 @@ class ProfilesApi:
         "/profiles/outgoing_friend_requests/{target_profile_username}",
         status_code=status.HTTP_204_NO_CONTENT,
         dependencies=[Depends(RateLimitTo(times=10, seconds=1))])
-    async def cancel_outgoing_friend_request(self, target_profile_username: str, user: User = Depends(get_user)):
+    async def cancel_outgoing_friend_request(self, target_profile_username: str, user: Principal = Depends(get_user)):
         """Cancel an outgoing friend request."""
         return await self._service.delete_friend_request(
             from_user=user.username,
@@ -123,7 +131,7 @@ class ProfilesApi:
         "/profiles/friends/{friend_profile_username}",
         status_code=status.HTTP_204_NO_CONTENT,
         dependencies=[Depends(RateLimitTo(times=10, seconds=1))])
-    async def remove_friend(self, friend_profile_username: str, user: User = Depends(get_user)):
+    async def remove_friend(self, friend_profile_username: str, user: Principal = Depends(get_user)):
         """Remove a friend from logged user's friends list."""
         is_friends = await self._service.delete_friend(user.username, friend_profile_username)
         if not is_friends:
@@ -135,7 +143,7 @@ class ProfilesApi:
         "/profiles/friends/",
         response_model=LimitOffsetPage[FullProfileOut],
         dependencies=[Depends(RateLimitTo(times=10, seconds=1))])
-    async def get_friends(self, user: User = Depends(get_user)):
+    async def get_friends(self, user: Principal = Depends(get_user)):
         """Get specified profile's friends."""
         return await self._service.get_friends(user.username)
 
@@ -143,7 +151,7 @@ class ProfilesApi:
         "/profiles/outgoing_friend_requests/",
         response_model=LimitOffsetPage[OutgoingFriendRequest],
         dependencies=[Depends(RateLimitTo(times=10, seconds=1))])
-    async def get_outgoing_friend_requests(self, user: User = Depends(get_user)):
+    async def get_outgoing_friend_requests(self, user: Principal = Depends(get_user)):
         """Get outgoing friend requests."""
         return await self._service.find_outgoing_friend_requests(user.username)
 
@@ -151,6 +159,6 @@ class ProfilesApi:
         "/profiles/incoming_friend_requests/",
         response_model=LimitOffsetPage[IncomingFriendRequest],
         dependencies=[Depends(RateLimitTo(times=10, seconds=1))])
-    async def get_incoming_friend_requests(self, user: User = Depends(get_user)):
+    async def get_incoming_friend_requests(self, user: Principal = Depends(get_user)):
         """Get incoming friend requests."""
         return await self._service.find_incoming_friend_requests(user.username)
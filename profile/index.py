@@ -0,0 +1,128 @@
+import asyncio
+import logging
+import sys
+import time
+from bisect import bisect_left, insort
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import select
+
+from auth.models import user
+from database.core import db
+
+logger = logging.getLogger(__name__)
+
+# separates the indexed term from the username in index keys, sorts before any printable character
+SEPARATOR = '\x00'
+
+
+class ProfilePrefixIndex:
+    """Per-worker prefix index of profiles, for typeahead search.
+
+    Lowercased usernames, first and last names are kept in a single sorted array of
+    `<term>\\x00<username>` keys, so the profiles matching a prefix are a contiguous
+    range of it, found with a binary search. The index is built on startup and
+    applies the profile changes made by this worker right away. Changes made by the
+    other workers are only picked up by the periodic rebuild, so they show up after
+    at most `rebuild_interval` seconds.
+
+    Attributes:
+        build_seconds (float): Duration of the last full build.
+    """
+
+    def __init__(self):
+        self._keys: List[str] = []
+        self._profiles: Dict[str, Tuple[Optional[str], Optional[str]]] = {}
+        self.build_seconds = 0.0
+        self.ready = False
+        self._rebuilder: Optional[asyncio.Task] = None
+
+    @staticmethod
+    def _terms(username: str, first_name: Optional[str], last_name: Optional[str]) -> set:
+        return {term.lower() for term in (username, first_name, last_name) if term}
+
+    async def build(self):
+        started = time.perf_counter()
+        keys, profiles = [], {}
+        async for row in db.iterate(select([user.c.username, user.c.first_name, user.c.last_name])):
+            profiles[row['username']] = (row['first_name'], row['last_name'])
+            terms = self._terms(row['username'], row['first_name'], row['last_name'])
+            keys += [f'{term}{SEPARATOR}{row["username"]}' for term in terms]
+        keys.sort()
+        self._keys, self._profiles = keys, profiles
+        self.build_seconds = time.perf_counter() - started
+        self.ready = True
+        logger.info('Profile prefix index built: %s', self.stats())
+
+    async def start(self, rebuild_interval: float):
+        await self.build()
+        self._rebuilder = asyncio.create_task(self._rebuild_periodically(rebuild_interval))
+
+    async def stop(self):
+        if not self._rebuilder:
+            return
+        self._rebuilder.cancel()
+        try:
+            await self._rebuilder
+        except asyncio.CancelledError:
+            pass
+        self._rebuilder = None
+
+    async def _rebuild_periodically(self, interval: float):
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                # a change of this worker applied during the build is lost until the next one
+                await self.build()
+            except Exception:
+                logger.exception('Unable to rebuild the profile prefix index')
+
+    def upsert(self, username: str, first_name: Optional[str], last_name: Optional[str]):
+        if not self.ready:
+            return
+        self.remove(username)
+        self._profiles[username] = (first_name, last_name)
+        for term in self._terms(username, first_name, last_name):
+            insort(self._keys, f'{term}{SEPARATOR}{username}')
+
+    def remove(self, username: str):
+        if username not in self._profiles:
+            return
+        for term in self._terms(username, *self._profiles.pop(username)):
+            key = f'{term}{SEPARATOR}{username}'
+            position = bisect_left(self._keys, key)
+            if position < len(self._keys) and self._keys[position] == key:
+                del self._keys[position]
+
+    def search(self, prefix: str, limit: int, offset: int) -> Tuple[List[dict], int]:
+        """Profiles having a username, first or last name starting with the prefix,
+        ordered by the matched term, and the total number of them.
+
+        The scan stops once the page is filled. When profiles are left past it, the
+        total is the number of matching terms, an upper bound of the number of
+        profiles, as a profile may match by several of its terms.
+        """
+        prefix = prefix.lower()
+        start = bisect_left(self._keys, prefix)
+        end = bisect_left(self._keys, prefix + '\uffff', lo=start)
+        usernames, position = {}, start
+        while position < end and len(usernames) < offset + limit:
+            usernames[self._keys[position].rsplit(SEPARATOR, 1)[1]] = None
+            position += 1
+        total = len(usernames) if position == end else end - start
+        items = [{'username': username,
+                  'first_name': self._profiles[username][0],
+                  'last_name': self._profiles[username][1]}
+                 for username in list(usernames)[offset:offset + limit]]
+        return items, total
+
+    def stats(self) -> dict:
+        return {
+            'profiles': len(self._profiles),
+            'keys': len(self._keys),
+            'size_bytes': sys.getsizeof(self._keys) + sum(sys.getsizeof(key) for key in self._keys),
+            'build_seconds': self.build_seconds,
+        }
+
+
+profile_index = ProfilePrefixIndex()
@@ -30,3 +30,8 @@ class IncomingFriendRequest(BaseSchema):
 
 class OutgoingFriendRequest(BaseSchema):
     to_user: str
+
+
+class FriendRequestResult(BaseSchema):
+    username: str
+    status: str
@@ -1,48 +1,123 @@
+import json
+from typing import Dict, List
+
+from fastapi_pagination.api import create_page, resolve_params
 from fastapi_pagination.ext.databases import paginate
-from fastapi_pagination.ext.sqlalchemy import paginate as paginate_sqlalchemy
-from sqlalchemy import select, desc, insert, delete, and_
+from sqlalchemy import select, desc, delete, and_, func
+from sqlalchemy.dialects.postgresql import insert
+
+from auth.cache import profile_cache
+from auth.models import user, friendship_request, friendship, public_profile_columns
+from common.cache import TTLCache
+from config import cfg
+from database.core import db
+from notification.cache import unread_count_cache
+from notification.models import NotificationData
+from profile.index import profile_index
+
+# pg_trgm index is not used for patterns shorter than a trigram
+TRIGRAM_LENGTH = 3
 
-from auth.models import user, friendship_request, User
-from database.core import db, session
+CREATE_FRIEND_REQUESTS_SQL = """
+WITH sender AS (
+    -- typed once: the parameter is used both as a value and in comparisons with varchar columns
+    SELECT CAST(:from_user AS varchar) AS username
+), targets AS (
+    SELECT DISTINCT t.username FROM unnest(CAST(:to_users AS varchar[])) AS t(username)
+), found AS (
+    SELECT u.username FROM users u JOIN targets t ON t.username = u.username
+), created AS (
+    INSERT INTO friendship_request (from_user, to_user)
+    SELECT s.username, f.username FROM found f CROSS JOIN sender s
+    WHERE f.username <> s.username AND NOT EXISTS (
+        SELECT 1 FROM friendship_request r WHERE r.from_user = f.username AND r.to_user = s.username)
+    ON CONFLICT (from_user, to_user) DO NOTHING
+    RETURNING to_user
+), notified AS (
+    INSERT INTO notification (user_username, data)
+    SELECT c.to_user, CAST(:data AS json) FROM created c
+    RETURNING id
+)
+SELECT t.username, f.username IS NOT NULL AS found, c.to_user IS NOT NULL AS created
+FROM targets t
+LEFT JOIN found f ON f.username = t.username
+LEFT JOIN created c ON c.to_user = t.username
+"""
+
+search_cache = TTLCache(max_size=cfg.profile_search_cache_size, ttl=cfg.profile_search_cache_ttl_seconds)
 
 
 class ProfilesService:
 
     async def find_profiles_by_username_search(self, username: str):
-        return await paginate(db, select([
-            user.c.id, user.c.username, user.c.first_name, user.c.last_name, user.c.phone])
-        .where(user.c.username.ilike(f"%{username}%"))
-        .order_by(
-            desc(user.c.username.ilike(f"{username}%"))))
+        """Search profiles by a part of the username, profiles whose username starts with it go first.
+
+        Queries as long as a trigram are served by the trigram index and ranked by
+        similarity. Shorter ones can't use it and scan the table, so their pages,
+        the most requested ones, are cached for a short time.
+        """
+        params = resolve_params()
+        raw_params = params.to_raw_params()
+        if cfg.profile_prefix_index_enabled and profile_index.ready:
+            items, total = profile_index.search(username, raw_params.limit, raw_params.offset)
+            return create_page(items, total, params)
+        cache_key = (username.lower(), raw_params.limit, raw_params.offset)
+        is_short_query = len(username) < TRIGRAM_LENGTH
+        if is_short_query and (page := search_cache.get(cache_key)) is not None:
+            return page
+        pattern = username.lower().replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+        ranking = [desc(func.lower(user.c.username).like(f"{pattern}%"))]
+        if not is_short_query:
+            ranking.append(desc(func.similarity(user.c.username, username)))
+        query = select([user.c.id, user.c.username, user.c.first_name, user.c.last_name, user.c.phone]) \
+            .where(user.c.username.ilike(f"%{pattern}%")) \
+            .order_by(*ranking, user.c.username)
+        page = await paginate(db, query, params)
+        if is_short_query:
+            search_cache.set(cache_key, page)
+        return page
 
     async def find_profile_by_username(self, profile_username: str):
-        return await db.fetch_one(select([user]).where(user.c.username == profile_username))
+        return await profile_cache.get_by_username(profile_username, lambda: db.fetch_one(
+            select(public_profile_columns).where(user.c.username == profile_username)))
+
+    async def create_friend_requests(self, from_user: str, to_users: List[str]) -> Dict[str, str]:
+        """Send friend requests to several profiles at once, creating their notifications.
 
-    async def create_friend_request(self, from_user: str, to_user: str):
-        request = {
+        Validation, requests and notifications are done in one statement, returning
+        the status of each target profile: `created`, `not_found`, `self` (sending to
+        yourself) or `exists` (there already is a pending request between the two).
+        """
+        rows = await db.fetch_all(CREATE_FRIEND_REQUESTS_SQL, values={
             'from_user': from_user,
-            'to_user': to_user
-        }
-        return await db.fetch_one(insert(friendship_request).values(request).returning(friendship_request))
-
-    async def check_friend_request_exists(self, requester_profile_username: str, target_profile_username: str):
-        return await db.fetch_one(select([friendship_request])
-                                      .where(
-            (and_(friendship_request.c.from_user == requester_profile_username,
-             friendship_request.c.to_user == target_profile_username) |
-            (and_(friendship_request.c.from_user == target_profile_username,
-            friendship_request.c.to_user == requester_profile_username))))
-        )
+            'to_users': to_users,
+            'data': json.dumps(NotificationData(event='New Friendship Request', from_user=from_user).dict()),
+        })
+        statuses = {}
+        for row in rows:
+            if row['created']:
+                statuses[row['username']] = 'created'
+            elif not row['found']:
+                statuses[row['username']] = 'not_found'
+            elif row['username'] == from_user:
+                statuses[row['username']] = 'self'
+            else:
+                statuses[row['username']] = 'exists'
+        await unread_count_cache.invalidate(*(name for name, status in statuses.items() if status == 'created'))
+        return statuses
 
     async def add_friend(self, requester_profile_username: str, accepter_profile_username: str):
-        accepter = session.query(User).filter(User.username == accepter_profile_username).first()
-        requester = session.query(User).filter(User.username == requester_profile_username).first()
-        if requester in accepter.friends:
-            return False
-        accepter.friends.append(requester)
-        requester.friends.append(accepter)
-        session.commit()
-        await self.delete_friend_request(requester_profile_username, accepter_profile_username)
+        async with db.transaction():
+            added = await db.fetch_all(
+                insert(friendship)
+                .values([
+                    {'user_username': accepter_profile_username, 'friend_username': requester_profile_username},
+                    {'user_username': requester_profile_username, 'friend_username': accepter_profile_username}])
+                .on_conflict_do_nothing()
+                .returning(friendship.c.user_username))
+            if not added:
+                return False
+            await self.delete_friend_request(requester_profile_username, accepter_profile_username)
         return True
 
     async def delete_friend_request(self, from_user: str, to_user: str):
@@ -51,18 +126,22 @@ class ProfilesService:
             friendship_request.c.to_user == to_user))
 
     async def delete_friend(self, username: str, friend_profile_username: str):
-        current_user = session.query(User).filter(User.username == username).first()
-        friend = session.query(User).filter(User.username == friend_profile_username).first()
-        if friend not in current_user.friends:
-            return False
-        current_user.friends.remove(friend)
-        friend.friends.remove(current_user)
-        session.commit()
-        return True
+        deleted = await db.fetch_all(
+            delete(friendship)
+            .where(
+                and_(friendship.c.user_username == username,
+                     friendship.c.friend_username == friend_profile_username) |
+                and_(friendship.c.user_username == friend_profile_username,
+                     friendship.c.friend_username == username))
+            .returning(friendship.c.user_username))
+        return bool(deleted)
 
     async def get_friends(self, profile_username: str):
-        current_user = session.query(User).filter(User.username == profile_username).first()
-        return paginate_sqlalchemy(current_user.friends)
+        return await paginate(db, select([
+            user.c.id, user.c.username, user.c.first_name, user.c.last_name, user.c.email, user.c.phone])
+            .select_from(friendship.join(user, user.c.username == friendship.c.friend_username))
+            .where(friendship.c.user_username == profile_username)
+            .order_by(user.c.username))
 
     async def find_outgoing_friend_requests(self, username: str):
         return await paginate(db, select([friendship_request]).where(friendship_request.c.from_user == username))
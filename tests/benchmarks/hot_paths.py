@@ -0,0 +1,216 @@
+"""Micro-benchmarks of the per-request hot paths, compared against stored baselines:
+
+    python -m tests.benchmarks.hot_paths
+    python -m tests.benchmarks.hot_paths -k broadcast --threshold 0.25
+    python -m tests.benchmarks.hot_paths --save
+
+Each benchmark is calibrated to run for about `--min-time` seconds per round; the
+median and min over `--rounds` rounds are reported in microseconds per call. A
+benchmark whose median is slower than its baseline by more than `--threshold` (a
+fraction) is a regression, making the command exit with 1. `--save` stores the
+results of the selected benchmarks as their baselines, in `baseline.json`. The
+committed baselines were recorded on the machine described in that file; record
+them again with `--save` before comparing on different hardware.
+"""
+import argparse
+import asyncio
+import datetime as dt
+import json
+import platform
+import statistics
+import sys
+import time
+from pathlib import Path
+from typing import Callable, Dict
+
+import jwt
+from bson import ObjectId
+from fastapi.encoders import jsonable_encoder
+
+from auth.schemas import JwtTokenPayload, JwtUser
+from auth.security import claims_cache, extract_user_from_token
+from auth.service import AuthService
+from chat.service import ChatService
+from common.responses import serializer_for
+from common.utils import prepare_object_for_postgresql, to_snake
+from config import cfg
+from notification.backends import InMemoryBackend
+from notification.manager import ConnectionManager
+from notification.schemas import NotificationRead
+
+BASELINE_PATH = Path(__file__).parent / 'baseline.json'
+
+# name -> factory doing the setup and returning the benchmarked callable, sync or async
+BENCHMARKS: Dict[str, Callable[[], Callable]] = {}
+
+
+def benchmark(name: str):
+    def register(factory: Callable[[], Callable]):
+        BENCHMARKS[name] = factory
+        return factory
+    return register
+
+
+def _access_token(username: str = 'jack') -> str:
+    iat = dt.datetime.now(dt.timezone.utc)
+    payload = JwtTokenPayload(iat=iat, exp=iat + dt.timedelta(hours=1),
+                              user=JwtUser(username=username, email=f'{username}@example.com'))
+    return jwt.encode(payload=payload.dict(), key=cfg.jwt_secret, algorithm=cfg.jwt_algorithm)
+
+
+def _notification_row(i: int = 1) -> dict:
+    return {'id': i, 'created_at': dt.datetime(2026, 1, 1, tzinfo=dt.timezone.utc), 'user_username': 'jack',
+            'data': {'event': 'New Friendship Request', 'from_user': 'test_user'}, 'read': False}
+
+
+@benchmark('generate_chat_id')
+def bench_generate_chat_id():
+    service = ChatService()
+    return lambda: service.generate_chat_id('jack', 'test_user')
+
+
+@benchmark('to_snake')
+def bench_to_snake():
+    return lambda: to_snake('isBackupCreated')
+
+
+@benchmark('prepare_object_for_postgresql')
+def bench_prepare_object_for_postgresql():
+    message = {'_id': ObjectId(), 'chatId': 'chat', 'createdAt': '2026-01-01T00:00:00', 'isBackupCreated': False,
+               'fromUsername': 'jack', 'toUsername': 'test_user', 'content': 'hello'}
+    return lambda: prepare_object_for_postgresql(message)
+
+
+@benchmark('extract_user_from_token')
+def bench_extract_user_from_token():
+    token = _access_token()
+    extract_user_from_token(token)
+    return lambda: extract_user_from_token(token)
+
+
+@benchmark('extract_user_from_token_uncached')
+def bench_extract_user_from_token_uncached():
+    token = _access_token()
+
+    def extract():
+        claims_cache.evict_user('jack')
+        return extract_user_from_token(token)
+    return extract
+
+
+@benchmark('generate_jwt_access_token')
+def bench_generate_jwt_access_token():
+    service, user = AuthService(), JwtUser(username='jack', email='jack@example.com')
+    return lambda: service._generate_jwt_access_token(user)
+
+
+class _FakeWebSocket:
+    def __init__(self, token: str):
+        self.query_params = {'token': token}
+
+    async def accept(self):
+        pass
+
+    async def send_text(self, message: str):
+        pass
+
+
+def _bench_broadcast(sockets: int):
+    def factory():
+        manager = ConnectionManager(InMemoryBackend())
+        token = _access_token()
+
+        async def setup():
+            await manager.start()
+            for _ in range(sockets):
+                await manager.connect(_FakeWebSocket(token))
+        asyncio.get_event_loop().run_until_complete(setup())
+        return lambda: manager.broadcast('jack', 'New Message Received from test_user')
+    return factory
+
+
+for _sockets in (1, 10, 100):
+    benchmark(f'broadcast_{_sockets}_sockets')(_bench_broadcast(_sockets))
+
+
+@benchmark('schema_validate_and_encode')
+def bench_schema_validate_and_encode():
+    row = _notification_row()
+    return lambda: jsonable_encoder(NotificationRead.parse_obj(row), by_alias=True)
+
+
+@benchmark('schema_json')
+def bench_schema_json():
+    notification = NotificationRead.parse_obj(_notification_row())
+    return lambda: notification.json(by_alias=True)
+
+
+@benchmark('schema_precomputed_serializer')
+def bench_schema_precomputed_serializer():
+    row, serializer = _notification_row(), serializer_for(NotificationRead)
+    return lambda: serializer.dump(row)
+
+
+def _timer(func: Callable) -> Callable[[int], float]:
+    """Function running `func` n times, returning the elapsed time in seconds."""
+    probe = func()
+    if not asyncio.iscoroutine(probe):
+        def run(n: int) -> float:
+            started = time.perf_counter()
+            for _ in range(n):
+                func()
+            return time.perf_counter() - started
+        return run
+    probe.close()
+
+    async def run_async(n: int) -> float:
+        started = time.perf_counter()
+        for _ in range(n):
+            await func()
+        return time.perf_counter() - started
+    return lambda n: asyncio.get_event_loop().run_until_complete(run_async(n))
+
+
+def measure(func: Callable, rounds: int, min_time: float) -> dict:
+    run = _timer(func)
+    number = 1
+    while (elapsed := run(number)) < min_time:
+        number = max(number * 2, int(number * min_time / max(elapsed, 1e-9)))
+    timings = [run(number) / number * 1e6 for _ in range(rounds)]
+    return {'median': round(statistics.median(timings), 3), 'min': round(min(timings), 3), 'calls': number}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('-k', dest='keyword', default='', help='only run benchmarks whose name contains it')
+    parser.add_argument('--rounds', type=int, default=5)
+    parser.add_argument('--min-time', type=float, default=0.1)
+    parser.add_argument('--threshold', type=float, default=0.2)
+    parser.add_argument('--save', action='store_true', help='store the results as the baselines')
+    args = parser.parse_args()
+
+    asyncio.set_event_loop(asyncio.new_event_loop())
+    results = {name: measure(factory(), args.rounds, args.min_time)
+               for name, factory in BENCHMARKS.items() if args.keyword in name}
+    baseline = json.loads(BASELINE_PATH.read_text()) if BASELINE_PATH.exists() else {'benchmarks': {}}
+
+    regressions = []
+    for name, result in results.items():
+        expected = baseline['benchmarks'].get(name)
+        change = f"{result['median'] / expected['median'] - 1:+.1%}" if expected else 'no baseline'
+        print(f"{name:<40} {result['median']:>12.3f} us  (min {result['min']:.3f})  {change}")
+        if expected and result['median'] > expected['median'] * (1 + args.threshold):
+            regressions.append(name)
+
+    if args.save:
+        baseline['machine'] = {'python': platform.python_version(), 'platform': platform.platform()}
+        baseline['benchmarks'].update(results)
+        BASELINE_PATH.write_text(json.dumps(baseline, indent=2, sort_keys=True) + '\n')
+        return
+    if regressions:
+        print(f"Regressions above {args.threshold:.0%}: {', '.join(regressions)}")
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,73 @@
+"""Response serialization benchmark, default FastAPI path against `FastJSONResponse`:
+
+    python -m tests.benchmarks.serialization --items 50 --runs 1000
+
+Default path: validation of the response model, `jsonable_encoder(by_alias=True)`, `JSONResponse`.
+Fast path: `serializer_for(model).dump`, `FastJSONResponse` (orjson when installed).
+Reported in microseconds per page.
+"""
+import argparse
+import datetime as dt
+import json
+import timeit
+
+from bson import ObjectId
+from fastapi.encoders import jsonable_encoder
+from fastapi_pagination import LimitOffsetPage
+from starlette.responses import JSONResponse
+
+from chat.schemas import ChatHistoryPage
+from common.responses import FastJSONResponse, orjson, serializer_for
+from notification.schemas import NotificationRead
+
+
+def history_page(size: int) -> dict:
+    items = []
+    for i in range(size):
+        message_id = ObjectId()
+        items.append({'_id': message_id, 'id': str(message_id), 'chatId': 'jack_test_user',
+                      'fromUsername': 'jack', 'toUsername': 'test_user', 'content': f'message {i}',
+                      'createdAt': (dt.datetime(2026, 1, 1) + dt.timedelta(seconds=i)).isoformat()})
+    return {'items': items, 'next_cursor': 'next', 'previous_cursor': 'previous'}
+
+
+def notifications_page(size: int) -> dict:
+    items = [{'id': i, 'created_at': dt.datetime(2026, 1, 1, tzinfo=dt.timezone.utc) + dt.timedelta(seconds=i),
+              'user_username': 'jack', 'data': {'event': 'New Friendship Request', 'from_user': 'test_user'},
+              'read': False}
+             for i in range(size)]
+    return {'items': items, 'total': size, 'limit': size, 'offset': 0}
+
+
+def measure(model, content, runs: int) -> dict:
+    def default():
+        return JSONResponse(jsonable_encoder(model.parse_obj(content), by_alias=True)).body
+
+    serializer = serializer_for(model)
+
+    def fast():
+        return FastJSONResponse(serializer.dump(content)).body
+
+    assert json.loads(default()) == json.loads(fast())
+    timings = {name: min(timeit.repeat(func, number=runs, repeat=5)) / runs * 1e6
+               for name, func in (('default', default), ('fast', fast))}
+    timings['speedup'] = timings['default'] / timings['fast']
+    return timings
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--items', type=int, default=50, help='items per page')
+    parser.add_argument('--runs', type=int, default=1000)
+    args = parser.parse_args()
+
+    report = {
+        'orjson': orjson is not None,
+        'chat_history': measure(ChatHistoryPage, history_page(args.items), args.runs),
+        'notifications': measure(LimitOffsetPage[NotificationRead], notifications_page(args.items), args.runs),
+    }
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,72 @@
+"""Application startup benchmark.
+
+Every run happens in a fresh interpreter, so imports are cold:
+
+    python -m tests.benchmarks.startup --runs 5
+    python -m tests.benchmarks.startup --runs 5 --lifespan
+
+Measured, in seconds:
+    import: `import main`
+    startup: startup handlers, connecting to the databases (only with `--lifespan`)
+    first_request, second_request: `GET /openapi.json`, built on first use
+"""
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+
+PROBE = '''
+import asyncio, json, sys, time
+
+started = time.perf_counter()
+import main
+timings = {'import': time.perf_counter() - started}
+
+
+async def requests():
+    from httpx import AsyncClient
+    async with AsyncClient(app=main.app, base_url='http://test') as client:
+        for name in ('first_request', 'second_request'):
+            started = time.perf_counter()
+            resp = await client.get('/openapi.json')
+            assert resp.status_code == 200
+            timings[name] = time.perf_counter() - started
+
+
+async def run():
+    if '--lifespan' in sys.argv:
+        from asgi_lifespan import LifespanManager
+        started = time.perf_counter()
+        async with LifespanManager(main.app):
+            timings['startup'] = time.perf_counter() - started
+            await requests()
+    else:
+        await requests()
+
+asyncio.run(run())
+print(json.dumps(timings))
+'''
+
+
+def measure(lifespan: bool) -> dict:
+    args = [sys.executable, '-c', PROBE] + (['--lifespan'] if lifespan else [])
+    output = subprocess.run(args, check=True, capture_output=True, text=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--lifespan', action='store_true', help='run startup handlers, requires the services')
+    args = parser.parse_args()
+
+    runs = [measure(args.lifespan) for _ in range(args.runs)]
+    report = {name: {'median': statistics.median(run[name] for run in runs),
+                     'max': max(run[name] for run in runs)}
+              for name in runs[0]}
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,205 @@
+"""End-to-end load test of every router, against the seeded population (see `seed`).
+
+    python -m tests.locustfiles.seed --reset
+    locust -f ./tests/locustfiles/api.py --headless -u 100 -r 10 -t 5m
+
+Latency percentiles and throughput per endpoint are written to `LOAD_REPORT`
+(`load-test-results.json` by default) when the run ends, and compared against
+`LOAD_BASELINE` (`tests/locustfiles/baseline.json` by default) when it exists:
+regressions above `LOAD_THRESHOLD` make locust exit with 1.
+"""
+import asyncio
+import itertools
+import json
+import logging
+import os
+import random
+import time
+import uuid
+from pathlib import Path
+
+import websockets
+from locust import HttpUser, between, events, task
+from locust.runners import WorkerRunner
+
+from tests.locustfiles import population, report
+
+DELIVERY_TIMEOUT = 5
+
+_indexes = itertools.count()
+
+
+class ApiUser(HttpUser):
+    """Seeded user, logged in on start."""
+    abstract = True
+    host = os.environ.get('LOAD_HOST', 'http://127.0.0.1:8000')
+    wait_time = between(0.5, 2)
+
+    def on_start(self):
+        self.index = next(_indexes) % population.USERS
+        self.username = population.username(self.index)
+        self.friends = [population.username(friend) for friend in population.friends(self.index)]
+        self.strangers = [population.username(other) for other in population.strangers(self.index)]
+        self.login()
+
+    def login(self):
+        resp = self.client.post('/api/login', json={'email': population.email(self.index),
+                                                    'password': population.PASSWORD}).json()
+        self.access_token = resp['accessToken']
+        self.refresh_token = resp['refreshToken']
+        self.headers = {'Authorization': f'Bearer {self.access_token}'}
+
+    def chat_id(self, friend: str) -> str:
+        # same as ChatService.generate_chat_id, without importing the application
+        return str(uuid.uuid5(uuid.NAMESPACE_X500, '+'.join(sorted([self.username, friend]))))
+
+
+class AuthUser(ApiUser):
+    weight = 1
+
+    @task(3)
+    def refresh(self):
+        resp = self.client.post('/api/refresh', cookies={'refresh_token': self.refresh_token})
+        if resp.ok:
+            self.refresh_token = resp.json()['refreshToken']
+
+    @task
+    def login_again(self):
+        self.login()
+
+
+class ProfilesUser(ApiUser):
+    weight = 3
+
+    @task(4)
+    def search(self):
+        query = population.username(random.randrange(population.USERS))[:random.randint(2, 12)]
+        self.client.get('/api/profiles', params={'username_query': query}, headers=self.headers,
+                        name='/api/profiles?username_query')
+
+    @task(4)
+    def get_profile(self):
+        self.client.get(f'/api/profiles/{random.choice(self.friends)}', headers=self.headers,
+                        name='/api/profiles/{username}')
+
+    @task(2)
+    def get_friends(self):
+        self.client.get('/api/profiles/friends/', headers=self.headers)
+
+    @task
+    def get_friend_requests(self):
+        self.client.get('/api/profiles/incoming_friend_requests/', headers=self.headers)
+        self.client.get('/api/profiles/outgoing_friend_requests/', headers=self.headers)
+
+    @task
+    def send_and_cancel_friend_request(self):
+        target = random.choice(self.strangers)
+        with self.client.post(f'/api/profiles/outgoing_friend_requests/{target}', headers=self.headers,
+                              name='/api/profiles/outgoing_friend_requests/{username}',
+                              catch_response=True) as resp:
+            # another user may have sent the same request concurrently
+            if resp.status_code == 400:
+                resp.success()
+        self.client.delete(f'/api/profiles/outgoing_friend_requests/{target}', headers=self.headers,
+                           name='/api/profiles/outgoing_friend_requests/{username}')
+
+
+class NotificationsUser(ApiUser):
+    weight = 3
+
+    @task(5)
+    def unread_count(self):
+        self.client.get('/api/notifications/unread_count', headers=self.headers)
+
+    @task(3)
+    def get_notifications(self):
+        self.client.get('/api/notifications', params={'limit': 20}, headers=self.headers)
+
+    @task
+    def mark_all_as_read(self):
+        self.client.post('/api/notifications/read', headers=self.headers)
+
+
+class ChatUser(ApiUser):
+    weight = 4
+
+    @task(3)
+    def send_message(self):
+        self.client.post(f'/api/chat/messages/{random.choice(self.friends)}/', json={'content': 'hello'},
+                         headers=self.headers, name='/api/chat/messages/{username}/')
+
+    @task(3)
+    def get_chats(self):
+        self.client.get('/api/chats', params={'limit': 20}, headers=self.headers)
+
+    @task(2)
+    def get_history(self):
+        self.client.get(f'/api/chat/{self.chat_id(random.choice(self.friends))}/history',
+                        params={'limit': 50}, headers=self.headers, name='/api/chat/{chat_id}/history')
+
+    @task
+    def get_messages(self):
+        self.client.get(f'/api/chat/{self.chat_id(random.choice(self.friends))}/messages',
+                        params={'limit': 50}, headers=self.headers, name='/api/chat/{chat_id}/messages')
+
+    @task
+    def mark_chat_as_read(self):
+        self.client.post(f'/api/chat/{self.chat_id(random.choice(self.friends))}/read',
+                         headers=self.headers, name='/api/chat/{chat_id}/read')
+
+
+class WebSocketUser(ApiUser):
+    """Keeps a websocket open and measures the delivery of notifications to it.
+
+    The user sends chat messages to itself, the time from sending to receiving the
+    notification is reported as `WS /ws delivery`. websockets is asyncio based, so
+    each user runs its own event loop, cooperative with gevent through the patched sockets.
+    """
+    weight = 1
+
+    def on_start(self):
+        super().on_start()
+        self.loop = asyncio.new_event_loop()
+        url = self.host.replace('http', 'ws', 1) + f'/ws?token={self.access_token}'
+        self.websocket = self.loop.run_until_complete(websockets.connect(url))
+
+    def on_stop(self):
+        self.loop.run_until_complete(self.websocket.close())
+        self.loop.close()
+
+    async def _receive_own_notification(self):
+        # notifications of messages sent by other users are skipped
+        expected = f'New Message Received from {self.username}'
+        while await self.websocket.recv() != expected:
+            pass
+
+    @task
+    def message_delivery(self):
+        started = time.perf_counter()
+        self.client.post(f'/api/chat/messages/{self.username}/', json={'content': 'ping'},
+                         headers=self.headers, name='/api/chat/messages/{username}/ (ws)')
+        exception = None
+        try:
+            self.loop.run_until_complete(asyncio.wait_for(self._receive_own_notification(), DELIVERY_TIMEOUT))
+        except (asyncio.TimeoutError, websockets.ConnectionClosed) as e:
+            exception = e
+        self.environment.events.request.fire(
+            request_type='WS', name='/ws delivery', response_time=(time.perf_counter() - started) * 1000,
+            response_length=0, exception=exception, context={})
+
+
+@events.quitting.add_listener
+def write_report(environment, **kwargs):
+    if isinstance(environment.runner, WorkerRunner):
+        return
+    results = report.collect(environment.stats)
+    with open(os.environ.get('LOAD_REPORT', 'load-test-results.json'), 'w') as f:
+        json.dump(results, f, indent=2)
+    baseline = Path(os.environ.get('LOAD_BASELINE', report.BASELINE_PATH))
+    if not baseline.exists():
+        return
+    regressions = report.compare(results, report.load(baseline), float(os.environ.get('LOAD_THRESHOLD', 0.2)))
+    for regression in regressions:
+        logging.error('Regression: %s', regression)
+    if regressions:
+        environment.process_exit_code = 1
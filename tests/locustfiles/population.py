@@ -0,0 +1,41 @@
+"""Load-test population, shared by the seeding script and the locustfiles.
+
+Sized with environment variables, so that `seed` and `locust` agree on it:
+    LOAD_USERS: number of seeded users
+    LOAD_FRIENDS: number of friends of each user
+    LOAD_MESSAGES: number of messages per conversation
+    LOAD_PASSWORD: password of every seeded user
+"""
+import os
+
+USERS = int(os.environ.get('LOAD_USERS', 200))
+FRIENDS = int(os.environ.get('LOAD_FRIENDS', 10))
+MESSAGES = int(os.environ.get('LOAD_MESSAGES', 20))
+PASSWORD = os.environ.get('LOAD_PASSWORD', 'load-test-password')
+
+USERNAME_PREFIX = 'load_user_'
+
+
+def username(index: int) -> str:
+    return f'{USERNAME_PREFIX}{index % USERS:05d}'
+
+
+def email(index: int) -> str:
+    return f'{username(index)}@load.example.com'
+
+
+def friends(index: int) -> list:
+    """Friends of a user: the `FRIENDS // 2` users before and after it, on a ring."""
+    half = FRIENDS // 2
+    return [(index + offset) % USERS for offset in range(-half, half + 1) if offset]
+
+
+def requester(index: int) -> int:
+    """User sending the seeded friend request to a user: the first one after its friends."""
+    return (index + FRIENDS // 2 + 1) % USERS
+
+
+def strangers(index: int) -> list:
+    """Users which are not friends of the user, nor linked to it by a seeded friend request."""
+    excluded = set(friends(index)) | {index % USERS, requester(index), (index - FRIENDS // 2 - 1) % USERS}
+    return [other for other in range(USERS) if other not in excluded]
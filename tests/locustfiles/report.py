@@ -0,0 +1,81 @@
+"""Machine-readable load-test results, and their comparison against a stored baseline.
+
+Results are written by the locustfiles when the run ends (see `LOAD_REPORT`), and
+can be compared or promoted to the baseline afterwards:
+
+    python -m tests.locustfiles.report compare results.json baseline.json --threshold 0.2
+    python -m tests.locustfiles.report baseline results.json
+"""
+import argparse
+import json
+import shutil
+import sys
+from pathlib import Path
+from typing import Dict, List
+
+PERCENTILES = (0.5, 0.9, 0.95, 0.99)
+BASELINE_PATH = Path(__file__).parent / 'baseline.json'
+
+
+def collect(stats) -> Dict[str, dict]:
+    """Latency percentiles (ms) and throughput (requests per second) per endpoint, from locust stats."""
+    report = {}
+    for (name, method), entry in sorted(stats.entries.items()):
+        if not entry.num_requests:
+            continue
+        report[f'{method} {name}'] = {
+            'requests': entry.num_requests,
+            'failures': entry.num_failures,
+            'rps': round(entry.total_rps, 2),
+            'avg': round(entry.avg_response_time, 2),
+            **{f'p{round(p * 100)}': entry.get_response_time_percentile(p) for p in PERCENTILES},
+        }
+    return report
+
+
+def compare(results: Dict[str, dict], baseline: Dict[str, dict], threshold: float) -> List[str]:
+    """Regressions of the results: endpoints whose p95 latency grew, or throughput or
+    success rate dropped, by more than `threshold` (a fraction) against the baseline."""
+    regressions = []
+    for endpoint, expected in baseline.items():
+        actual = results.get(endpoint)
+        if actual is None:
+            regressions.append(f'{endpoint}: not exercised')
+            continue
+        if actual['p95'] > expected['p95'] * (1 + threshold):
+            regressions.append(f"{endpoint}: p95 {actual['p95']}ms, baseline {expected['p95']}ms")
+        if actual['rps'] < expected['rps'] * (1 - threshold):
+            regressions.append(f"{endpoint}: {actual['rps']} rps, baseline {expected['rps']} rps")
+        failure_rate = actual['failures'] / actual['requests']
+        expected_failure_rate = expected['failures'] / expected['requests']
+        if failure_rate > expected_failure_rate + threshold / 10:
+            regressions.append(f'{endpoint}: {failure_rate:.1%} failures, baseline {expected_failure_rate:.1%}')
+    return regressions
+
+
+def load(path) -> Dict[str, dict]:
+    with open(path) as f:
+        return json.load(f)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest='command', required=True)
+    compare_parser = commands.add_parser('compare', help='compare results against a baseline')
+    compare_parser.add_argument('results')
+    compare_parser.add_argument('baseline', nargs='?', default=BASELINE_PATH)
+    compare_parser.add_argument('--threshold', type=float, default=0.2)
+    baseline_parser = commands.add_parser('baseline', help='store results as the baseline')
+    baseline_parser.add_argument('results')
+    args = parser.parse_args()
+
+    if args.command == 'baseline':
+        shutil.copyfile(args.results, BASELINE_PATH)
+        return
+    regressions = compare(load(args.results), load(args.baseline), args.threshold)
+    print('\n'.join(regressions) or 'No regressions')
+    sys.exit(1 if regressions else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,109 @@
+"""Seed the load-test population into PostgreSQL and MongoDB, see `population`:
+
+    python -m tests.locustfiles.seed --reset
+
+Users are active and share one password. Each user gets `LOAD_FRIENDS` friends,
+a pending friend request from a stranger, and a conversation of `LOAD_MESSAGES`
+messages with each of its friends. The data only depends on the population size,
+so seeding twice gives the same database.
+"""
+import argparse
+import asyncio
+import datetime as dt
+
+from fastapi.encoders import jsonable_encoder
+from pymongo import UpdateOne
+from sqlalchemy import delete, or_
+from sqlalchemy.dialects.postgresql import insert
+
+from auth.models import user, friendship, friendship_request, notification
+from auth.passwords import password_hasher
+from chat.models import chat_activity_update
+from chat.service import ChatService
+from database.core import db, mongo
+from tests.locustfiles import population
+
+BATCH_SIZE = 1000
+STARTED_AT = dt.datetime(2026, 1, 1)
+
+
+def _batches(rows: list):
+    for start in range(0, len(rows), BATCH_SIZE):
+        yield rows[start:start + BATCH_SIZE]
+
+
+async def reset():
+    prefix = f'{population.USERNAME_PREFIX}%'
+    async with db.transaction():
+        await db.execute(delete(notification).where(notification.c.user_username.like(prefix)))
+        await db.execute(delete(friendship_request).where(
+            or_(friendship_request.c.from_user.like(prefix), friendship_request.c.to_user.like(prefix))))
+        await db.execute(delete(friendship).where(
+            or_(friendship.c.user_username.like(prefix), friendship.c.friend_username.like(prefix))))
+        await db.execute(delete(user).where(user.c.username.like(prefix)))
+    pattern = {'$regex': f'^{population.USERNAME_PREFIX}'}
+    await mongo.messages.delete_many({'fromUsername': pattern})
+    await mongo.chats.delete_many({'interlocutors': pattern})
+
+
+async def seed_postgresql():
+    password = await password_hasher.hash(population.PASSWORD)
+    users = [{'username': population.username(i), 'email': population.email(i), 'password': password,
+              'first_name': f'Load{i}', 'last_name': 'User', 'is_active': True}
+             for i in range(population.USERS)]
+    friendships = [{'user_username': population.username(i), 'friend_username': population.username(friend)}
+                   for i in range(population.USERS) for friend in population.friends(i)]
+    requests = [{'from_user': population.username(population.requester(i)), 'to_user': population.username(i)}
+                for i in range(population.USERS)
+                if population.requester(i) not in population.friends(i) + [i]]
+    for table, rows in ((user, users), (friendship, friendships), (friendship_request, requests)):
+        for batch in _batches(rows):
+            await db.execute(insert(table).values(batch).on_conflict_do_nothing())
+    return len(users), len(friendships) // 2, len(requests)
+
+
+async def seed_mongodb():
+    chat_service = ChatService()
+    conversations = 0
+    for i in range(population.USERS):
+        for friend in population.friends(i):
+            if friend < i:
+                continue
+            interlocutors = population.username(i), population.username(friend)
+            chat_id = chat_service.generate_chat_id(*interlocutors)
+            messages = [jsonable_encoder({
+                'chatId': chat_id,
+                'createdAt': STARTED_AT + dt.timedelta(minutes=n),
+                'isBackupCreated': False,
+                'fromUsername': interlocutors[n % 2],
+                'toUsername': interlocutors[(n + 1) % 2],
+                'content': f'message {n} of {chat_id}',
+            }) for n in range(population.MESSAGES)]
+            if not messages or await mongo.chats.count_documents({'chatId': chat_id}, limit=1):
+                continue
+            await mongo.messages.insert_many(messages, ordered=False)
+            await mongo.chats.bulk_write([UpdateOne({'chatId': chat_id}, chat_activity_update(messages), upsert=True)])
+            conversations += 1
+    return conversations
+
+
+async def main(clear: bool):
+    await db.connect()
+    mongo.connect()
+    try:
+        if clear:
+            await reset()
+        users, friendships, requests = await seed_postgresql()
+        conversations = await seed_mongodb()
+    finally:
+        mongo.close()
+        await db.disconnect()
+    print(f'Seeded {users} users, {friendships} friendships, {requests} friend requests, '
+          f'{conversations} new conversations')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--reset', action='store_true', help='delete the previously seeded population first')
+    args = parser.parse_args()
+    asyncio.run(main(args.reset))
@@ -1,10 +1,14 @@
 import asyncio
+import os
 
 import pytest
 from asgi_lifespan import LifespanManager
 from httpx import AsyncClient
 
-from main import app, startup
+# rate limits are not under test, except where a limiter is built with its own backend
+os.environ.setdefault('RATE_LIMIT_BACKEND', 'noop')
+
+from main import app, startup  # noqa: E402
 
 app_base_url = "http://127.0.0.1:8000/api"
 
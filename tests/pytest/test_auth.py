@@ -1,5 +1,27 @@
+import asyncio
+import threading
+import time
+import types
+import uuid
+
+import bcrypt
+import httpx
 import pytest
+from aiosmtplib import SMTPException
+from asgi_lifespan import LifespanManager
+from sqlalchemy import select, update
 
+from auth import mail
+from auth.cache import CachedRow, ProfileCache, request_memo
+from auth.mail import MailQueue, OutgoingEmail
+from auth.models import user
+from auth.passwords import PasswordHasher, password_hasher
+from auth.security import ClaimsCache, Principal
+from auth.service import AuthService
+from auth.social.google import GoogleAdapter
+from config import get_email_conf
+from database.core import db
+from main import app
 from tests.pytest.utils import do_login, register_random_user, register_user, activate_user, generate_token, \
     change_password, change_profile_data, get_random_username_and_email
 
@@ -71,3 +93,248 @@ async def test_change_profile_data():
     assert login_response.status_code == 200
     assert login_response.json()['firstName'] == 'new_first_name'
     assert login_response.json()['lastName'] == 'new_last_name'
+
+
+@pytest.mark.asyncio
+async def test_login_rehashes_outdated_password_hash():
+    _, password, email, first_name, last_name = await register_random_user()
+    await activate_user(await generate_token(email))
+    outdated_hash = bcrypt.hashpw(password.encode(), bcrypt.gensalt(4)).decode()
+    async with LifespanManager(app):
+        await db.execute(update(user).where(user.c.email == email).values(password=outdated_hash))
+    assert password_hasher.needs_rehash(outdated_hash)
+
+    assert (await do_login(email, password)).status_code == 200
+    async with LifespanManager(app):
+        password_hash = await db.fetch_val(select([user.c.password]).where(user.c.email == email))
+    assert password_hash != outdated_hash
+    assert not password_hasher.needs_rehash(password_hash)
+    assert bcrypt.checkpw(password.encode(), password_hash.encode())
+    assert (await do_login(email, password)).status_code == 200
+
+
+@pytest.mark.asyncio
+async def test_password_hasher_hash_and_check():
+    hasher = PasswordHasher(rounds=4)
+    password_hash = await hasher.hash('secret')
+    assert await hasher.check('secret', password_hash)
+    assert not await hasher.check('wrong', password_hash)
+    assert not hasher.needs_rehash(password_hash)
+    assert PasswordHasher(rounds=5).needs_rehash(password_hash)
+    assert hasher.needs_rehash('plain text')
+    assert hasher.needs_rehash('$2b$xx$salt')
+    assert hasher.metrics() == {'waiting': 0, 'running': 0, 'completed': 3, 'max_concurrency': 4}
+
+
+@pytest.mark.asyncio
+async def test_password_hasher_limits_concurrency():
+    hasher = PasswordHasher(rounds=4, max_concurrency=2)
+    release, lock = threading.Event(), threading.Lock()
+    active, peak = 0, 0
+
+    def blocking_call():
+        nonlocal active, peak
+        with lock:
+            active += 1
+            peak = max(peak, active)
+        release.wait(timeout=5)
+        with lock:
+            active -= 1
+
+    calls = [asyncio.create_task(hasher._run(blocking_call)) for _ in range(5)]
+    await asyncio.sleep(0.05)
+    assert hasher.metrics() == {'waiting': 3, 'running': 2, 'completed': 0, 'max_concurrency': 2}
+
+    release.set()
+    await asyncio.wait_for(asyncio.gather(*calls), timeout=5)
+    assert peak == 2
+    assert hasher.metrics() == {'waiting': 0, 'running': 0, 'completed': 5, 'max_concurrency': 2}
+
+
+def test_claims_cache():
+    cache = ClaimsCache(max_size=2, ttl=60)
+    jack, bob = Principal('jack', 'jack@example.com'), Principal('bob', 'bob@example.com')
+    cache.set('token-1', jack, time.time() + 30)
+    cache.set('token-2', jack)
+    cache.set('expired', bob, time.time() - 1)
+    assert cache.get('token-1') is None  # evicted as the least recently used
+    assert cache.get('token-2') == jack
+    assert cache.get('expired') is None
+
+    cache.set('token-3', jack)
+    cache.evict_user('jack')
+    assert cache.get('token-2') is None and cache.get('token-3') is None
+
+
+@pytest.mark.asyncio
+async def test_profile_cache_request_memo():
+    cache = ProfileCache(ttl=60, fields=('username', 'email'), enabled=False)
+    loads = []
+
+    async def loader():
+        loads.append(1)
+        return CachedRow(username='jack', email='jack@example.com')
+
+    token = request_memo.set({})
+    try:
+        assert (await cache.get_by_username('jack', loader)).email == 'jack@example.com'
+        assert (await cache.get_by_username('jack', loader)).username == 'jack'
+        assert len(loads) == 1
+        await cache.invalidate('jack')
+        await cache.get_by_username('jack', loader)
+        assert len(loads) == 2
+    finally:
+        request_memo.reset(token)
+    assert cache.metrics() == {'memo_hits': 1, 'hits': 0, 'misses': 2}
+
+
+@pytest.mark.asyncio
+async def test_profile_cache_invalidate_during_load():
+    cache = ProfileCache(ttl=60, fields=('username', 'email'))
+    username = f'cache_{uuid.uuid4().hex}'
+    loading, invalidated = asyncio.Event(), asyncio.Event()
+
+    async def stale_loader():
+        loading.set()
+        await invalidated.wait()
+        return CachedRow(username=username, email='old@example.com', password='hash', otp_secret='secret')
+
+    stale_lookup = asyncio.create_task(cache.get_by_username(username, stale_loader))
+    await loading.wait()
+    await cache.invalidate(username)
+    invalidated.set()
+    assert dict(await stale_lookup) == {'username': username, 'email': 'old@example.com'}
+
+    async def fresh_loader():
+        return CachedRow(username=username, email='new@example.com', password='hash')
+
+    # the row loaded before the invalidation was cached under the previous generation
+    assert (await cache.get_by_username(username, fresh_loader)).email == 'new@example.com'
+
+    async def unreachable_loader():
+        raise AssertionError('expected a cache hit')
+
+    row = await cache.get_by_username(username, unreachable_loader)
+    assert dict(row) == {'username': username, 'email': 'new@example.com'}
+    assert cache.metrics() == {'memo_hits': 0, 'hits': 1, 'misses': 2}
+
+
+@pytest.mark.asyncio
+async def test_social_adapter_against_mock_provider():
+    calls = []
+
+    def provider(request: httpx.Request) -> httpx.Response:
+        calls.append(request.url.path)
+        if request.url.path == '/token':
+            # the code is single-use, only a request which never reached the provider is retried
+            if calls.count('/token') == 1:
+                raise httpx.ConnectError('Connection refused', request=request)
+            if calls.count('/token') == 3:
+                return httpx.Response(503)
+            return httpx.Response(200, json={'access_token': 'mock-token'})
+        assert request.headers['Authorization'] == 'Bearer mock-token'
+        if calls.count('/profile') == 1:
+            return httpx.Response(503)
+        return httpx.Response(200, json={'email': 'mock@example.com'})
+
+    async with httpx.AsyncClient(transport=httpx.MockTransport(provider)) as client:
+        adapter = GoogleAdapter(client=client,
+                                access_token_url='http://oauth.local/token',
+                                profile_url='http://oauth.local/profile')
+        adapter.backoff = 0
+        access_token = await adapter.get_access_token_data(code='code')
+        assert access_token == 'mock-token'
+        assert (await adapter.get_profile_data(access_token))['email'] == 'mock@example.com'
+        with pytest.raises(ValueError):
+            await adapter.get_access_token_data(code='code')
+    assert calls == ['/token', '/token', '/profile', '/profile', '/token']
+
+
+@pytest.fixture
+def smtp_sink(monkeypatch):
+    """Stands in for fastapi_mail's Connection: messages delivered over each SMTP
+    connection, times of every send attempt, and the number of next sends to fail."""
+    sink = types.SimpleNamespace(connections=[], attempts=[], failures=0)
+
+    class SinkConnection:
+        def __init__(self, conf):
+            self.session = self
+
+        async def __aenter__(self):
+            sink.connections.append([])
+            return self
+
+        async def __aexit__(self, *exc_info):
+            pass
+
+        async def send_message(self, message):
+            sink.attempts.append(time.monotonic())
+            if sink.failures:
+                sink.failures -= 1
+                raise SMTPException('451 Try again later')
+            sink.connections[-1].append(message)
+
+    monkeypatch.setattr(mail, 'Connection', SinkConnection)
+    return sink
+
+
+def sending_mail_queue(**kwargs) -> MailQueue:
+    return MailQueue(get_email_conf().copy(update={'SUPPRESS_SEND': 0}), **kwargs)
+
+
+@pytest.mark.asyncio
+async def test_mail_queue_sends_batch_over_one_connection(smtp_sink):
+    queue = sending_mail_queue(batch_size=10)
+    await queue.start()
+    for i in range(3):
+        await queue.put(OutgoingEmail(recipients=[f'user{i}@example.com'], subject=f'email {i}', html='<p>hi</p>'))
+    await queue.stop()
+    assert [[message['Subject'] for message in sent] for sent in smtp_sink.connections] == \
+        [['email 0', 'email 1', 'email 2']]
+    assert smtp_sink.connections[0][2]['To'] == 'user2@example.com'
+
+
+@pytest.mark.asyncio
+async def test_mail_queue_retries_failed_email_with_backoff(smtp_sink):
+    smtp_sink.failures = 1
+    queue = sending_mail_queue(max_retries=2, backoff=0.05)
+    email = OutgoingEmail(recipients=['jack@example.com'], subject='retried', html='<p>hi</p>')
+    await queue.start()
+    await queue.put(email)
+
+    async def delivered():
+        while len(smtp_sink.attempts) < 2:
+            await asyncio.sleep(0.01)
+
+    await asyncio.wait_for(delivered(), timeout=5)
+    await queue.stop()
+    assert [[message['Subject'] for message in sent] for sent in smtp_sink.connections] == [[], ['retried']]
+    assert email.attempts == 1
+    assert smtp_sink.attempts[1] - smtp_sink.attempts[0] >= queue.backoff
+
+
+@pytest.mark.asyncio
+async def test_auth_emails_render_their_templates(smtp_sink, monkeypatch):
+    queue = sending_mail_queue()
+    monkeypatch.setattr(mail, 'mail_queue', queue)
+
+    async def find_profile_by_email(self, email):
+        return CachedRow(username='jack', email=email)
+
+    monkeypatch.setattr(AuthService, 'find_profile_by_email', find_profile_by_email)
+    service = AuthService()
+    await queue.start()
+    await service.forgot_password('jack@example.com')
+    await service.create_temp_password('jack@example.com')
+    await service.send_activation_email(CachedRow(email='jack@example.com', first_name='Jack', last_name='Smith'))
+    await queue.stop()
+
+    forgot_password, temp_password, activation = [message for sent in smtp_sink.connections for message in sent]
+    assert forgot_password['Subject'] == 'Facezhuk Reset Password'
+    assert 'Hello, jack' in forgot_password.get_content()
+    assert '/api/reset-password?reset_password_token=' in forgot_password.get_content()
+    assert temp_password['Subject'] == 'Facezhuk Temp Password'
+    assert 'Your temporary password is' in temp_password.get_content()
+    assert activation['Subject'] == 'Facezhuk Activation'
+    assert 'Hello, Jack Smith' in activation.get_content()
+    assert '/api/activate?token=' in activation.get_content()
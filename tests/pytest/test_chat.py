@@ -1,11 +1,29 @@
 import asyncio
+import datetime as dt
+import logging
+import os
+import time
+import uuid
 
 import pytest
 from asgi_lifespan import LifespanManager
+from bson import ObjectId
+from fastapi.encoders import jsonable_encoder
 from httpx import AsyncClient
 from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo.errors import BulkWriteError
+from sqlalchemy import select
 
+from chat.archive import ChatMessageBulkLoader
+from chat.buffer import MessageWriteBuffer
+from chat.models import chat_message
+from chat.schemas import ChatHistoryPage
 from chat.service import ChatService
+from chat.tasks import _copy_messages
+from common import responses
+from common.responses import serializer_for
+from config import cfg
+from database.core import db, mongo
 from main import app
 from tests.pytest.conftest import app_base_url, get_headers
 
@@ -28,6 +46,17 @@ async def test_create_message():
             assert resp.status_code == 200
 
 
+@pytest.mark.asyncio
+async def test_mongo_client_metrics():
+    async with AsyncClient(app=app, base_url=app_base_url) as conn, LifespanManager(app):
+        resp = await conn.post("/chat/messages/test_user/", headers=get_headers, json={'content': 'metrics'})
+        assert resp.status_code == 200
+        metrics = mongo.metrics.snapshot()
+        assert metrics['commands']['insert']['calls'] >= 1
+        assert metrics['connections'] >= 1
+    assert mongo.client is None
+
+
 @pytest.mark.asyncio
 async def test_get_chats():
         async with AsyncClient(app=app, base_url=app_base_url) as conn, LifespanManager(app):
@@ -37,6 +66,23 @@ async def test_get_chats():
             assert resp.status_code == 200
 
 
+@pytest.mark.asyncio
+async def test_get_chats_inbox():
+    async with AsyncClient(app=app, base_url=app_base_url) as conn, LifespanManager(app):
+        AsyncIOMotorClient.get_io_loop = asyncio.get_running_loop
+
+        await conn.post("/chat/messages/test_user/", headers=get_headers, json={'content': 'latest'})
+        resp = await conn.get("/chats", headers=get_headers)
+        chat = resp.json()['items'][0]
+        assert chat['interlocutors'] == ['ftffesfft12affsd', 'test_user'] or \
+            chat['interlocutors'] == ['test_user', 'ftffesfft12affsd']
+        assert chat['lastMessage']['content'] == 'latest'
+        assert chat['unreadCount'] == 0
+
+        resp = await conn.post(f"/chat/{chat['chatId']}/read", headers=get_headers)
+        assert resp.status_code == 204
+
+
 @pytest.mark.asyncio
 async def test_get_chat_messages():
         async with AsyncClient(app=app, base_url=app_base_url) as conn, LifespanManager(app):
@@ -47,3 +93,185 @@ async def test_get_chat_messages():
 
             resp = await conn.get(f"/chat/{chat_id}/messages", headers=get_headers)
             assert resp.status_code == 200
+
+
+@pytest.mark.asyncio
+async def test_get_chat_history():
+    async with AsyncClient(app=app, base_url=app_base_url) as conn, LifespanManager(app):
+        AsyncIOMotorClient.get_io_loop = asyncio.get_running_loop
+
+        friend_username = 'test_user'
+        for content in ('first', 'second', 'third'):
+            await conn.post(f"/chat/messages/{friend_username}/", headers=get_headers, json={'content': content})
+        chat_id = ChatService().generate_chat_id('ftffesfft12affsd', friend_username)
+
+        resp = await conn.get(f"/chat/{chat_id}/history", headers=get_headers, params={'limit': 2})
+        assert resp.status_code == 200
+        page = resp.json()
+        assert [m['content'] for m in page['items']] == ['third', 'second']
+
+        resp = await conn.get(f"/chat/{chat_id}/history", headers=get_headers,
+                              params={'limit': 1, 'before': page['nextCursor']})
+        assert [m['content'] for m in resp.json()['items']] == ['first']
+
+        resp = await conn.get(f"/chat/{chat_id}/history", headers=get_headers, params={'before': 'xxx'})
+        assert resp.status_code == 400
+
+
+def test_fast_serializer_matches_default_path():
+    message_id = ObjectId()
+    history = {
+        'items': [{'_id': message_id, 'id': str(message_id), 'chatId': 'chat', 'fromUsername': 'jack',
+                   'toUsername': 'test_user', 'content': 'hello', 'createdAt': '2026-10-18T12:00:00.123456'}],
+        'next_cursor': None,
+        'previous_cursor': 'cursor',
+    }
+    expected = jsonable_encoder(ChatHistoryPage.parse_obj(history), by_alias=True)
+    assert serializer_for(ChatHistoryPage).dump(history) == expected
+    assert expected['items'][0]['createdAt'] == '2026-10-18T12:00:00.123Z'
+
+
+class GatedWriteBuffer(MessageWriteBuffer):
+    """Write buffer recording the size of each batch, whose writes wait until `gate` is set."""
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.gate = asyncio.Event()
+        self.gate.set()
+        self.batches = []
+
+    async def _write(self, messages):
+        await self.gate.wait()
+        self.batches.append(len(messages))
+        await super()._write(messages)
+
+
+def buffered_messages(count: int) -> list:
+    chat_id = ChatService().generate_chat_id('buffer', uuid.uuid4().hex)
+    return [{'chatId': chat_id, 'createdAt': dt.datetime.now(dt.timezone.utc).isoformat(), 'isBackupCreated': False,
+             'fromUsername': 'buffer', 'toUsername': 'test_user', 'content': f'buffered {i}'}
+            for i in range(count)]
+
+
+@pytest.mark.asyncio
+async def test_message_buffer_flushes_on_size_and_drains_on_stop():
+    async with LifespanManager(app):
+        buffer = GatedWriteBuffer(batch_size=2, flush_interval=10)
+        await buffer.start()
+        messages = buffered_messages(3)
+        acks = [await buffer.put(message) for message in messages]
+        # acknowledged long before the flush interval
+        await asyncio.wait_for(asyncio.gather(*acks[:2]), timeout=5)
+        assert buffer.batches == [2]
+        assert not acks[2].done()
+
+        await buffer.stop()
+        assert acks[2].done()
+        assert buffer.batches == [2, 1]
+        chat_id = messages[0]['chatId']
+        assert await mongo.messages.count_documents({'chatId': chat_id}) == 3
+        chat = await mongo.chats.find_one({'chatId': chat_id})
+        assert chat['lastMessage']['content'] == 'buffered 2'
+        assert chat['unread'] == {'test_user': 3}
+
+
+@pytest.mark.asyncio
+async def test_message_buffer_flushes_on_interval():
+    async with LifespanManager(app):
+        buffer = GatedWriteBuffer(batch_size=100, flush_interval=0.05)
+        await buffer.start()
+        started = time.monotonic()
+        await asyncio.wait_for(await buffer.put(buffered_messages(1)[0]), timeout=5)
+        assert time.monotonic() - started >= buffer.flush_interval
+        assert buffer.batches == [1]
+        await buffer.stop()
+
+
+@pytest.mark.asyncio
+async def test_message_buffer_acknowledges_written_messages_only():
+    async with LifespanManager(app):
+        buffer = GatedWriteBuffer(batch_size=1, flush_interval=0.01)
+        buffer.gate.clear()
+        await buffer.start()
+        message = buffered_messages(1)[0]
+        ack = await buffer.put(message)
+        await asyncio.sleep(0.05)
+        assert not ack.done()
+        assert await mongo.messages.find_one({'chatId': message['chatId']}) is None
+
+        buffer.gate.set()
+        await asyncio.wait_for(ack, timeout=5)
+        assert (await mongo.messages.find_one({'chatId': message['chatId']}))['content'] == 'buffered 0'
+
+        # same _id as the message written above: the write fails, and so does the acknowledgement
+        with pytest.raises(BulkWriteError):
+            await asyncio.wait_for(await buffer.put(dict(message)), timeout=5)
+        await buffer.stop()
+
+
+@pytest.mark.asyncio
+async def test_message_buffer_backpressure():
+    async with LifespanManager(app):
+        buffer = GatedWriteBuffer(batch_size=1, flush_interval=0.01, max_queue_size=2)
+        buffer.gate.clear()
+        await buffer.start()
+        messages = buffered_messages(4)
+        # the writer holds the first message, the next two fill the queue
+        acks = [await buffer.put(message) for message in messages[:3]]
+        blocked = asyncio.create_task(buffer.put(messages[3]))
+        await asyncio.sleep(0.05)
+        assert not blocked.done()
+
+        buffer.gate.set()
+        acks.append(await asyncio.wait_for(blocked, timeout=5))
+        await buffer.stop()
+        assert all(ack.done() for ack in acks)
+        assert buffer.batches == [1, 1, 1, 1]
+
+
+@pytest.mark.asyncio
+async def test_backup_copies_only_messages_not_backed_up():
+    async with LifespanManager(app), db.connection() as connection:
+        await _copy_messages(connection.raw_connection)
+
+        new = buffered_messages(1)[0]
+        # inserted after greater _ids were copied, e.g. by a writer with a late clock
+        straggler = {**buffered_messages(1)[0],
+                     '_id': ObjectId(ObjectId.from_datetime(dt.datetime(2020, 1, 1)).binary[:4] + os.urandom(8))}
+        await mongo.messages.insert_many([straggler, new])
+        assert await _copy_messages(connection.raw_connection) == 2
+        assert await _copy_messages(connection.raw_connection) == 0
+
+        for message in (straggler, new):
+            assert (await mongo.messages.find_one({'_id': message['_id']}))['isBackupCreated']
+        rows = await db.fetch_all(select([chat_message.c.mongo_id])
+                                  .where(chat_message.c.mongo_id.in_([str(straggler['_id']), str(new['_id'])])))
+        assert len(rows) == 2
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize('on_conflict', ['ignore', 'update'])
+async def test_bulk_loader_loads_batch_once(on_conflict):
+    loader = ChatMessageBulkLoader(batch_size=10, on_conflict=on_conflict)
+    messages = [{**message, '_id': ObjectId()} for message in buffered_messages(3)]
+    chat_id = messages[0]['chatId']
+    async with LifespanManager(app), db.connection() as connection:
+        # duplicates within a batch are written once
+        assert await loader.load(connection.raw_connection, messages + messages[:1]) == 3
+        messages[0]['content'] = 'edited'
+        assert await loader.load(connection.raw_connection, messages) == (3 if on_conflict == 'update' else 0)
+
+        rows = await db.fetch_all(select([chat_message.c.mongo_id, chat_message.c.content])
+                                  .where(chat_message.c.chat_id == chat_id)
+                                  .order_by(chat_message.c.mongo_id))
+    assert [row['mongo_id'] for row in rows] == [str(message['_id']) for message in messages]
+    assert rows[0]['content'] == ('edited' if on_conflict == 'update' else 'buffered 0')
+
+
+def test_check_renderer_warns_without_orjson(monkeypatch, caplog):
+    monkeypatch.setattr(responses, 'orjson', None)
+    monkeypatch.setitem(cfg.__dict__, 'fast_json_responses', True)
+    with caplog.at_level(logging.WARNING, logger='common.responses'):
+        responses.check_renderer()
+    [record] = [record for record in caplog.records if record.name == 'common.responses']
+    assert 'orjson is not installed' in record.getMessage()
@@ -0,0 +1,36 @@
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+import pytest
+from environs import EnvError
+
+from config import Settings
+
+
+def test_settings_are_parsed_on_first_access(monkeypatch):
+    monkeypatch.delenv('BROKER_URL', raising=False)
+    monkeypatch.setenv('BCRYPT_ROUNDS', '10')
+    settings = Settings()
+    assert settings.bcrypt_rounds == 10
+    monkeypatch.setenv('BCRYPT_ROUNDS', '11')
+    assert settings.bcrypt_rounds == 10
+    with pytest.raises(EnvError, match='BROKER_URL'):
+        settings.broker_url
+
+
+def test_settings_validate_lists_every_invalid_setting(monkeypatch):
+    monkeypatch.delenv('BROKER_URL', raising=False)
+    monkeypatch.setenv('MAIL_PORT', 'smtp')
+    with pytest.raises(EnvError) as error:
+        Settings().validate()
+    assert 'BROKER_URL' in str(error.value) and 'MAIL_PORT' in str(error.value)
+
+
+def test_import_main_without_environment(tmp_path):
+    # only the settings read at import time would be needed, and there are none
+    result = subprocess.run([sys.executable, '-c', 'import main'], cwd=Path(__file__).parents[2],
+                            env={'PATH': os.environ.get('PATH', ''), 'HOME': str(tmp_path)},
+                            capture_output=True, text=True)
+    assert result.returncode == 0, result.stderr
@@ -0,0 +1,45 @@
+import asyncio
+import logging
+
+import pytest
+from asgi_lifespan import LifespanManager
+
+from common.metrics import MetricsReporter, metrics
+from database.core import db
+from main import app
+
+
+@pytest.mark.asyncio
+async def test_metrics_are_logged_periodically(caplog):
+    reporter = MetricsReporter()
+    reporter.register('counters', lambda: {'calls': 1})
+    reporter.register('broken', lambda: 1 / 0)
+    with caplog.at_level(logging.INFO, logger='common.metrics'):
+        await reporter.start(interval=0.01)
+        await asyncio.sleep(0.05)
+        await reporter.stop()
+    messages = [record.getMessage() for record in caplog.records if record.name == 'common.metrics']
+    assert "Metrics of counters: {'calls': 1}" in messages
+    assert 'Unable to collect the metrics of broken' in messages
+
+
+@pytest.mark.asyncio
+async def test_runtime_metrics_sources():
+    async with LifespanManager(app):
+        await db.fetch_val('SELECT 1')
+        snapshots = metrics.collect()
+    assert snapshots['postgres_pool']['checkouts'] >= 1 and snapshots['postgres_pool']['size'] >= 1
+    assert snapshots['mongo'].keys() == {'connections', 'checked_out', 'checkout_failures', 'commands'}
+    assert snapshots['profile_cache'].keys() == {'memo_hits', 'hits', 'misses'}
+    assert snapshots['password_hasher'].keys() == {'waiting', 'running', 'completed', 'max_concurrency'}
+    assert snapshots['notifications'].keys() == {'published', 'delivered', 'last_lag', 'max_lag', 'avg_lag'}
+
+
+@pytest.mark.asyncio
+async def test_database_pool_metrics():
+    async with LifespanManager(app):
+        checkouts = db.pool_metrics.checkouts
+        assert await db.fetch_val('SELECT 1') == 1
+        metrics = db.pool_metrics.snapshot()
+        assert metrics['checkouts'] == checkouts + 1 and metrics['in_use'] == 0
+        assert db.pool_size()['size'] >= 1
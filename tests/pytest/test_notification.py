@@ -1,8 +1,18 @@
+import asyncio
+import json
+import time
+
 import pytest
+import redis
 from asgi_lifespan import LifespanManager
 from httpx import AsyncClient
 
+from common.services import services
 from main import app
+from notification.backends import InMemoryBackend, RedisBackend
+from notification.manager import ConnectionManager
+from notification.models import Notification, NotificationData
+from notification.service import NotificationService
 from tests.pytest.conftest import app_base_url, get_headers
 
 
@@ -33,3 +43,136 @@ async def test_mark_notification_as_read_unauthorized():
     async with AsyncClient(app=app, base_url=app_base_url) as conn, LifespanManager(app):
         resp = await conn.patch("/notifications", json=[1], params={'is_read': True})
         assert resp.status_code == 401
+
+
+class FakeWebSocket:
+    def __init__(self, token: str, alive: bool = True):
+        self.query_params = {'token': token}
+        self.alive = alive
+        self.received = []
+
+    async def accept(self):
+        pass
+
+    async def close(self, code: int = 1000):
+        self.alive = False
+
+    async def send_text(self, message: str):
+        if not self.alive:
+            raise RuntimeError('Cannot call "send" once a close message has been sent.')
+        self.received.append(message)
+
+
+@pytest.mark.asyncio
+async def test_broadcast_reaches_only_recipient_sockets():
+    manager = ConnectionManager(InMemoryBackend())
+    await manager.start()
+    token = get_headers['Authorization'].replace('Bearer ', '')
+    tab, other_tab, stranger = FakeWebSocket(token), FakeWebSocket(token), FakeWebSocket('invalid')
+    assert await manager.connect(tab)
+    assert await manager.connect(other_tab)
+    assert not await manager.connect(stranger)
+
+    await manager.broadcast('ftffesfft12affsd', 'hello')
+    assert tab.received == other_tab.received == ['hello']
+    assert stranger.received == []
+
+    other_tab.alive = False
+    await manager.broadcast('ftffesfft12affsd', 'bye')
+    assert manager.connections['ftffesfft12affsd'] == {tab}
+
+    await manager.remove(tab)
+    assert manager.connections == {}
+
+
+class FlakyPubSub:
+    """Stands in for a redis pubsub whose connection drops on the next `failures` reads."""
+
+    subscribed = True
+
+    def __init__(self, failures: int, events: list):
+        self.failures = failures
+        self.events = events
+        self.reads = []
+
+    async def get_message(self, timeout: float):
+        self.reads.append(time.monotonic())
+        if self.failures:
+            self.failures -= 1
+            raise redis.ConnectionError('Connection closed by server.')
+        if self.events:
+            return self.events.pop(0)
+        await asyncio.sleep(timeout)
+
+
+@pytest.mark.asyncio
+async def test_redis_backend_listener_reconnects_with_backoff(caplog):
+    backend = RedisBackend('redis://localhost', reconnect_backoff=0.02)
+    message = {'type': 'message', 'data': json.dumps({'user': 'jack', 'message': 'hello', 'ts': time.time()})}
+    backend._pubsub = FlakyPubSub(failures=2, events=[{'type': 'message', 'data': 'not json'}, message])
+    delivered = asyncio.Queue()
+
+    async def deliver(username, text):
+        await delivered.put((username, text))
+
+    backend._deliver = deliver
+    listener = asyncio.create_task(backend._listen())
+    try:
+        assert await asyncio.wait_for(delivered.get(), timeout=5) == ('jack', 'hello')
+    finally:
+        listener.cancel()
+    reads = backend._pubsub.reads
+    # 0.02s after the first failure, then 0.04s
+    assert reads[1] - reads[0] >= 0.02 and reads[2] - reads[1] >= 0.04
+    assert backend.metrics.delivered == 1
+    assert [record.levelname for record in caplog.records if record.name == 'notification.backends'] == \
+        ['ERROR', 'ERROR', 'ERROR']
+
+
+async def ws_connect(query_string: bytes = b'') -> list:
+    """Open /ws on the application, returning the ASGI messages it sent back."""
+    sent = []
+    scope = {'type': 'websocket', 'path': '/ws', 'root_path': '', 'query_string': query_string,
+             'headers': [], 'client': ('127.0.0.1', 1234), 'server': ('127.0.0.1', 8000), 'subprotocols': []}
+
+    async def receive():
+        return {'type': 'websocket.connect'}
+
+    async def send(message):
+        sent.append(message)
+
+    await app(scope, receive, send)
+    return sent
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize('query_string', [b'', b'token=', b'token=invalid'])
+async def test_ws_without_valid_token_is_closed(query_string):
+    assert await ws_connect(query_string) == [{'type': 'websocket.close', 'code': 1008, 'reason': ''}]
+
+
+@pytest.mark.asyncio
+async def test_unread_count_and_mark_all_as_read():
+    username = 'ftffesfft12affsd'
+    cache_key = f'notifications:unread:{username}'
+    async with AsyncClient(app=app, base_url=app_base_url) as conn, LifespanManager(app):
+        await conn.post("/notifications/read", headers=get_headers)
+        resp = await conn.get("/notifications/unread_count", headers=get_headers)
+        assert resp.status_code == 200
+        assert resp.json() == {'count': 0}
+        assert await services.redis.get(cache_key) == '0'
+
+        for _ in range(2):
+            await NotificationService().create_notification(Notification(
+                user_username=username, data=NotificationData(event='New Message Received', from_user='jack')))
+        assert await services.redis.get(cache_key) is None
+        resp = await conn.get("/notifications/unread_count", headers=get_headers)
+        assert resp.json() == {'count': 2}
+        assert await services.redis.get(cache_key) == '2'
+
+        resp = await conn.post("/notifications/read", headers=get_headers)
+        assert resp.status_code == 200
+        assert resp.json() == {'marked': 2}
+        assert await services.redis.get(cache_key) is None
+        resp = await conn.get("/notifications/unread_count", headers=get_headers)
+        assert resp.json() == {'count': 0}
@@ -1,9 +1,22 @@
+import asyncio
+import logging
+import uuid
+
 import pytest
 from asgi_lifespan import LifespanManager
 from httpx import AsyncClient
+from sqlalchemy import insert, select
 
+from auth.models import friendship, friendship_request, user
+from auth.schemas import JwtUser
+from auth.service import AuthService
+from database.core import db
 from main import app
+from profile.index import ProfilePrefixIndex
+from profile.service import ProfilesService, search_cache
 from tests.pytest.conftest import app_base_url, get_headers
+from tests.pytest.utils import activate_user, change_profile_data, do_login, generate_token, \
+    get_random_username_and_email, register_user
 
 
 @pytest.mark.asyncio
@@ -14,6 +27,44 @@ async def test_search_profiles():
         assert resp.json()['items'][0]['username'] == 'test_user'
 
 
+@pytest.mark.asyncio
+async def test_search_short_query_matches_substrings():
+    async with AsyncClient(app=app, base_url=app_base_url) as conn, LifespanManager(app):
+        resp = await conn.get("/profiles", params={'username_query': 'ck', 'limit': 100})
+        assert 'jack' in [item['username'] for item in resp.json()['items']]
+
+        resp = await conn.get("/profiles", params={'username_query': 'ja', 'limit': 100})
+        usernames = [item['username'] for item in resp.json()['items']]
+        assert 'jack' in usernames
+        # usernames starting with the query go first
+        prefixed = [username.startswith('ja') for username in usernames]
+        assert prefixed == sorted(prefixed, reverse=True)
+
+
+@pytest.mark.asyncio
+async def test_search_cache_invalidated_on_profile_changes():
+    params, cache_key = {'username_query': 'zq', 'limit': 100}, ('zq', 100, 0)
+    async with AsyncClient(app=app, base_url=app_base_url) as conn, LifespanManager(app):
+        total = (await conn.get("/profiles", params=params)).json()['total']
+    assert search_cache.get(cache_key) is not None
+
+    username = f'zq{get_random_username_and_email()[0]}'
+    email, password = f'{username}@example.com', 'testpassword'
+    resp = await register_user(username, email, password, 'test_first', 'test_last', '+380989009900')
+    assert resp.status_code == 201
+    assert search_cache.get(cache_key) is None
+    async with AsyncClient(app=app, base_url=app_base_url) as conn, LifespanManager(app):
+        assert (await conn.get("/profiles", params=params)).json()['total'] == total + 1
+
+    await activate_user(await generate_token(email))
+    access_token = (await do_login(email, password)).json()['accessToken']
+    async with AsyncClient(app=app, base_url=app_base_url) as conn, LifespanManager(app):
+        await conn.get("/profiles", params=params)
+    assert search_cache.get(cache_key) is not None
+    await change_profile_data('new_first_name', 'new_last_name', access_token)
+    assert search_cache.get(cache_key) is None
+
+
 @pytest.mark.asyncio
 async def test_search_profile_not_exist():
     async with AsyncClient(app=app, base_url=app_base_url) as conn, LifespanManager(app):
@@ -145,3 +196,126 @@ async def test_delete_friend():
         assert res.status_code == 204
         res = await conn.get("/profiles/friends/", headers=get_headers)
         assert res.json()['total'] == 0
+
+
+@pytest.mark.asyncio
+async def test_send_friendship_requests_in_bulk():
+    async with AsyncClient(app=app, base_url=app_base_url) as conn, LifespanManager(app):
+        await conn.delete("/profiles/outgoing_friend_requests/test_user_1", headers=get_headers)
+        resp = await conn.post("/profiles/outgoing_friend_requests", headers=get_headers,
+                               json=['test_user_1', 'gubka_bob', 'ftffesfft12affsd'])
+        assert resp.status_code == 200
+        assert {r['username']: r['status'] for r in resp.json()} == {
+            'test_user_1': 'created', 'gubka_bob': 'not_found', 'ftffesfft12affsd': 'self'}
+
+        resp = await conn.post("/profiles/outgoing_friend_requests", headers=get_headers, json=['test_user_1'])
+        assert resp.json() == [{'username': 'test_user_1', 'status': 'exists'}]
+        await conn.delete("/profiles/outgoing_friend_requests/test_user_1", headers=get_headers)
+
+
+async def insert_users(count: int) -> list:
+    usernames = [f'friend_{uuid.uuid4().hex[:12]}' for _ in range(count)]
+    await db.execute_many(insert(user), [dict(username=username, email=f'{username}@example.com', password='-')
+                                         for username in usernames])
+    return usernames
+
+
+async def auth_headers(username: str) -> dict:
+    token = await AuthService()._generate_jwt_access_token(JwtUser(username=username, email=f'{username}@example.com'))
+    return {'Authorization': f'Bearer {token.access_token}'}
+
+
+@pytest.mark.asyncio
+async def test_friend_operations_match_per_row_results():
+    # the set-based statements against the former per-row checks, made in python over the same rows
+    service = ProfilesService()
+    async with AsyncClient(app=app, base_url=app_base_url) as conn, LifespanManager(app):
+        usernames = alice, bob, carol, dave = await insert_users(4)
+
+        async def per_row_friends(username):
+            rows = await db.fetch_all(select([friendship]).where(friendship.c.user_username.in_(usernames)))
+            return sorted(row['friend_username'] for row in rows if row['user_username'] == username)
+
+        async def listed_friends(username):
+            resp = await conn.get("/profiles/friends/", headers=await auth_headers(username))
+            return [item['username'] for item in resp.json()['items']]
+
+        async def stored_requests():
+            return {(row['from_user'], row['to_user']) for row in await db.fetch_all(
+                select([friendship_request]).where(friendship_request.c.from_user.in_(usernames)))}
+
+        requests = set()
+        for first, second in [(alice, bob), (alice, dave), (carol, alice), (bob, alice), (alice, bob),
+                              (alice, carol), (bob, dave), (dave, bob)]:
+            pending = (first, second) in requests or (second, first) in requests
+            assert await service.create_friend_requests(first, [second]) == {second: 'exists' if pending else 'created'}
+            if not pending:
+                requests.add((first, second))
+        assert await stored_requests() == requests
+
+        assert await service.add_friend(alice, bob)
+        assert not await service.add_friend(alice, bob)
+        assert not await service.add_friend(bob, alice)
+        assert await service.add_friend(carol, alice)
+        assert await stored_requests() == requests - {(alice, bob), (carol, alice)}
+        assert await listed_friends(alice) == sorted([bob, carol])
+        for username in usernames:
+            assert await listed_friends(username) == await per_row_friends(username)
+
+        assert await service.delete_friend(bob, alice)
+        assert not await service.delete_friend(alice, bob)
+        assert await listed_friends(bob) == []
+        for username in usernames:
+            assert await listed_friends(username) == await per_row_friends(username)
+
+
+def test_profile_prefix_index():
+    index = ProfilePrefixIndex()
+    index.ready = True
+    index.upsert('jack', 'Jack', 'Black')
+    index.upsert('jill', 'Jill', 'Jackson')
+    index.upsert('bob', 'Bob', None)
+
+    items, total = index.search('ja', limit=10, offset=0)
+    assert [item['username'] for item in items] == ['jack', 'jill'] and total == 2
+    assert index.search('BL', limit=10, offset=0)[1] == 1
+    # the scan stops at the page, the total is then the number of matching terms
+    items, total = index.search('j', limit=1, offset=0)
+    assert [item['username'] for item in items] == ['jack'] and total == 3
+    assert index.search('j', limit=10, offset=0)[1] == 2
+
+    index.upsert('jack', 'John', 'White')
+    assert index.search('bl', limit=10, offset=0) == ([], 0)
+    index.remove('jill')
+    assert [item['username'] for item in index.search('ja', limit=10, offset=0)[0]] == ['jack']
+    assert index.stats()['profiles'] == 2
+
+
+@pytest.mark.asyncio
+async def test_profile_prefix_index_build_logs_stats(caplog):
+    index = ProfilePrefixIndex()
+    async with LifespanManager(app):
+        with caplog.at_level(logging.INFO, logger='profile.index'):
+            await index.build()
+    assert index.ready and index.stats()['profiles'] >= 1
+    [record] = [record for record in caplog.records if record.name == 'profile.index']
+    assert record.getMessage() == f'Profile prefix index built: {index.stats()}'
+
+
+@pytest.mark.asyncio
+async def test_profile_prefix_index_rebuilds_periodically():
+    index = ProfilePrefixIndex()
+    username = f'rebuilt{uuid.uuid4().hex[:8]}'
+    async with LifespanManager(app):
+        await index.start(rebuild_interval=0.05)
+        try:
+            assert index.search(username, limit=10, offset=0) == ([], 0)
+            # a profile created by another worker
+            await db.execute(insert(user).values(username=username, email=f'{username}@example.com',
+                                                 password='hash', first_name='Re', last_name='Built'))
+            await asyncio.sleep(0.2)
+            items, total = index.search(username, limit=10, offset=0)
+            assert [item['username'] for item in items] == [username] and total == 1
+        finally:
+            await index.stop()
+            await db.execute(user.delete().where(user.c.username == username))
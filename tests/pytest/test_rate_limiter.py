@@ -0,0 +1,24 @@
+import pytest
+
+from common.rate_limiter import MemoryLimiterBackend, RateLimitTo
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize('algorithm', ['token_bucket', 'sliding_window'])
+async def test_rate_limit_admits_locally_within_limit(algorithm):
+    backend = MemoryLimiterBackend()
+    calls = []
+    acquire = backend.acquire
+
+    async def counting_acquire(*args):
+        calls.append(args)
+        return await acquire(*args)
+
+    backend.acquire = counting_acquire
+    limiter = RateLimitTo(times=4, seconds=10, algorithm=algorithm, backend=backend, batch_size=2)
+    assert [await limiter.admit('jack') for _ in range(4)] == [0, 0, 0, 0]
+    assert len(calls) == 2  # tokens are taken two at a time
+    assert await limiter.admit('jack') > 0
+    assert await limiter.admit('jack') > 0
+    assert len(calls) == 3  # rejected locally until the retry time
+    assert await limiter.admit('bob') == 0